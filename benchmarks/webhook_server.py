@@ -0,0 +1,86 @@
+"""
+Load test of launchkey.webhooks.WSGIWebhookApp: serves the app on a local threaded WSGI server and sends it webhooks
+signed and encrypted like the LaunchKey API's from concurrent clients, reporting requests per second and the statuses
+received. 503 responses show the backpressure of the app when more requests arrive than its workers handle.
+
+    PYTHONPATH=. python benchmarks/webhook_server.py [--kind authorization] [--concurrency 16] [--seconds 10]
+"""
+from __future__ import print_function
+from launchkey.webhooks import WSGIWebhookApp
+from six.moves import http_client, socketserver
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+from collections import Counter
+from time import time
+from webhooks import make_client, authorization_webhook, session_end_webhook, junk_webhook
+import argparse
+import threading
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def load(port, body, headers, seconds, statuses, lock):
+    body = body.encode("utf-8")
+    deadline = time() + seconds
+    while time() < deadline:
+        connection = http_client.HTTPConnection("127.0.0.1", port)
+        try:
+            connection.request("POST", "/webhook", body, headers)
+            status = connection.getresponse().status
+        except (IOError, http_client.HTTPException):
+            status = "error"
+        finally:
+            connection.close()
+        with lock:
+            statuses[status] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kind", choices=("authorization", "session-end", "junk"), default="authorization")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--seconds", type=float, default=10.0,
+                        help="Duration of the test. The webhook sent expires after 35 seconds.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of workers of the app")
+    parser.add_argument("--max-pending", type=int, default=None, help="Maximum number of webhooks in the app")
+    arguments = parser.parse_args()
+
+    client, api_key, issuer_key = make_client()
+    if arguments.kind == "authorization":
+        body, headers = authorization_webhook(client, api_key, issuer_key)
+    elif arguments.kind == "session-end":
+        body, headers = session_end_webhook(client, api_key)
+    else:
+        body, headers = junk_webhook()
+
+    app = WSGIWebhookApp(client, max_workers=arguments.workers, max_pending=arguments.max_pending)
+    server = make_server("127.0.0.1", 0, app, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    statuses, lock = Counter(), threading.Lock()
+    started = time()
+    clients = [threading.Thread(target=load, args=(server.server_port, body, headers, arguments.seconds, statuses,
+                                                   lock)) for _ in range(arguments.concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time() - started
+    server.shutdown()
+    app.shutdown()
+    print("%-22s %10.1f requests/s" % (arguments.kind, sum(statuses.values()) / elapsed))
+    for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+        print("  %-20s %10d" % (status, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures the number of webhooks ServiceClient.handle_webhook processes per second on one core, for authorization
+response webhooks and session end webhooks signed and encrypted like the LaunchKey API's, and for junk requests: bodies
+without a valid JWT, replays of captured webhooks after they expired, oversized bodies, and duplicate deliveries with a
+ReplayCache. Authorization responses are also measured in batches with handle_webhooks on a process pool.
+
+    PYTHONPATH=. python benchmarks/webhooks.py [--seconds 5]
+"""
+from __future__ import print_function
+from launchkey.clients import ServiceClient
+from launchkey.transports import JOSETransport, ReplayCache
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.PublicKey import RSA
+from jwkest.jwe import JWE
+from jwkest.jwk import RSAKey
+from jwkest.jws import JWS
+from base64 import b64encode
+from hashlib import sha256
+from time import time
+from uuid import uuid4
+import argparse
+import json
+
+
+def make_client():
+    """Returns a ServiceClient, and the API key and issuer public key to sign and encrypt webhooks for it"""
+    service_id = uuid4()
+    issuer_key = RSA.generate(2048)
+    api_key = RSA.generate(2048)
+    transport = JOSETransport()
+    transport.set_issuer("svc", service_id, issuer_key.exportKey("PEM").decode("utf-8"))
+    transport._api_public_keys = [RSAKey(key=api_key.publickey(), kid="api-key")], int(time())
+    return ServiceClient(service_id, transport), api_key, transport.issuer_private_keys[0]
+
+
+def sign(client, api_key, body, now=None):
+    now = int(time()) if now is None else now
+    payload = {"aud": client._transport.issuer, "iss": "lka", "sub": client._subject, "iat": now, "nbf": now,
+               "exp": now + 5, "jti": uuid4().hex,
+               "request": {"meth": "POST", "path": "/webhook", "func": "S256",
+                           "hash": sha256(body.encode("utf-8")).hexdigest()}}
+    token = JWS(json.dumps(payload), alg="RS256").sign_compact(keys=[RSAKey(key=api_key, kid="api-key")])
+    return {"X-IOV-JWT": token, "Content-Type": "application/jwe"}
+
+
+def authorization_webhook(client, api_key, issuer_key):
+    package = json.dumps({"auth_request": str(uuid4()), "response": True, "device_id": str(uuid4()),
+                          "service_pins": ["1234", "2345", "3456"]})
+    encrypted = b64encode(PKCS1_OAEP.new(issuer_key.key.publickey()).encrypt(package.encode("utf-8")))
+    data = {"auth": encrypted.decode("utf-8"), "public_key_id": issuer_key.kid, "service_user_hash": uuid4().hex,
+            "org_user_hash": uuid4().hex, "user_push_id": str(uuid4())}
+    body = JWE(json.dumps(data), alg="RSA-OAEP", enc="A256CBC-HS512", kid=issuer_key.kid).encrypt(
+        keys=[RSAKey(key=issuer_key.key.publickey(), kid=issuer_key.kid)])
+    return body, sign(client, api_key, body)
+
+
+def session_end_webhook(client, api_key):
+    body = json.dumps({"service_user_hash": uuid4().hex, "api_time": "2018-01-01T00:00:00Z"})
+    return body, sign(client, api_key, body)
+
+
+def junk_webhook():
+    return "x" * 2048, {"X-IOV-JWT": "not.a.jwt"}
+
+
+def expired_webhook(client, api_key, issuer_key):
+    body, _ = authorization_webhook(client, api_key, issuer_key)
+    return body, sign(client, api_key, body, now=int(time()) - 3600)
+
+
+def oversized_webhook(client, api_key):
+    body = json.dumps({"service_user_hash": "x" * 1024 * 1024, "api_time": "2018-01-01T00:00:00Z"})
+    return body, sign(client, api_key, body)
+
+
+def measure(name, client, body, headers, seconds):
+    count, started = 0, time()
+    while time() - started < seconds:
+        try:
+            client.handle_webhook(body, headers)
+        except Exception:
+            pass
+        count += 1
+    print("%-22s %10.1f webhooks/s" % (name, count / (time() - started)))
+
+
+def measure_batches(name, client, batch, seconds):
+    count, started = 0, time()
+    while time() - started < seconds:
+        client.handle_webhooks(batch)
+        count += len(batch)
+    print("%-22s %10.1f webhooks/s" % (name, count / (time() - started)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each measurement")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="Number of processes handling batches")
+    parser.add_argument("--batch", type=int, default=200, help="Number of webhooks per batch")
+    arguments = parser.parse_args()
+    client, api_key, issuer_key = make_client()
+    measure("authorization response", client, *authorization_webhook(client, api_key, issuer_key),
+            seconds=arguments.seconds)
+    measure("session end", client, *session_end_webhook(client, api_key), seconds=arguments.seconds)
+    measure("junk", client, *junk_webhook(), seconds=arguments.seconds)
+    measure("expired replay", client, *expired_webhook(client, api_key, issuer_key), seconds=arguments.seconds)
+    measure("oversized", client, *oversized_webhook(client, api_key), seconds=arguments.seconds)
+    batch = [authorization_webhook(client, api_key, issuer_key) for _ in range(arguments.batch)]
+    with ProcessPoolExecutor(max_workers=arguments.workers) as executor:
+        client.webhook_executor = executor
+        measure_batches("batch (%s workers)" % arguments.workers, client, batch, arguments.seconds)
+    client.webhook_replay_cache = ReplayCache()
+    body, headers = authorization_webhook(client, api_key, issuer_key)
+    client.handle_webhook(body, headers)
+    measure("duplicate delivery", client, body, headers, seconds=arguments.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,4 +7,6 @@ JOSE_SUPPORTED_JWT_ALGS = ["RS256", "RS384", "RS512"]
 JOSE_SUPPORTED_CONTENT_HASH_ALGS = ["S256", "S384", "S512"]
 JOSE_AUDIENCE = "lka"
 JOSE_JWT_LEEWAY = 30
+JOSE_MAX_JWT_SIZE = 8192
 API_CACHE_TIME = 300
+AUTHORIZATION_REQUEST_TTL = 300
@@ -1,17 +1,74 @@
 from .base import BaseClient, api_call
-from launchkey.exceptions import InvalidParameters
+from launchkey import JOSE_JWT_LEEWAY
+from launchkey.exceptions import InvalidParameters, RequestTimedOut, WebhookBodyTooLarge, JWTValidationFailure, \
+    JWTReplayed
 from launchkey.entities.validation import AuthorizationResponseValidator, AuthorizeSSEValidator, AuthorizeValidator
 from launchkey.entities.service import AuthPolicy, AuthorizationResponse, SessionEndRequest
+from launchkey.polling import AuthorizationPoller
+from launchkey.polling.bulk import run_bulk
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
 from json import loads
+import six
+import threading
 
 
 class ServiceClient(BaseClient):
 
     def __init__(self, subject_id, transport):
         super(ServiceClient, self).__init__('svc', subject_id, transport)
+        self._authorization_poller = None
+        self._authorization_poller_lock = threading.Lock()
+        self._webhook_executor = None
+        self._webhook_executor_lock = threading.Lock()
+        # launchkey.polling.AuthorizationRelay sharing the responses received by webhooks with other nodes
+        self.authorization_relay = None
+        # launchkey.polling stores sharing authorization results and polling leases with other workers
+        self.authorization_store = None
+        # launchkey.polling.AuthorizationDeduplicator returning the request recently created for the same authorize call
+        self.authorize_deduplicator = None
+        # launchkey.sessions.SessionRegistry recording the sessions started and the authorization responses received
+        self.session_registry = None
+        # Webhook bodies larger than this number of bytes are rejected unread, or None not to limit them
+        self.max_webhook_body_size = None
+        # launchkey.transports.ReplayCache remembering the JWT IDs of the webhooks received, to drop replays
+        self.webhook_replay_cache = None
+
+    @property
+    def authorization_poller(self):
+        """
+        The launchkey.polling.AuthorizationPoller resolving the futures returned by authorize. It is created with the
+        default schedule on first use unless one was set.
+        """
+        if self._authorization_poller is None:
+            with self._authorization_poller_lock:
+                if self._authorization_poller is None:
+                    self._authorization_poller = AuthorizationPoller(self)
+        return self._authorization_poller
+
+    @authorization_poller.setter
+    def authorization_poller(self, value):
+        self._authorization_poller = value
+
+    @property
+    def webhook_executor(self):
+        """
+        The concurrent.futures.Executor verifying and decrypting the webhooks of handle_webhooks. It is a
+        ProcessPoolExecutor with a process per CPU created on first use unless one was set, and is kept for every batch
+        so that the processes are only started once.
+        """
+        if self._webhook_executor is None:
+            with self._webhook_executor_lock:
+                if self._webhook_executor is None:
+                    self._webhook_executor = ProcessPoolExecutor(max_workers=cpu_count())
+        return self._webhook_executor
+
+    @webhook_executor.setter
+    def webhook_executor(self, value):
+        self._webhook_executor = value
 
     @api_call
-    def authorize(self, user, context=None, policy=None):
+    def authorize(self, user, context=None, policy=None, return_future=False, webhook_timeout=None):
         """
         Authorize a transaction for the provided user. This get_service_service method would be utilized if you are
         using this as a secondary factor for user login or authorizing a single transaction within your application.
@@ -30,7 +87,14 @@ class ServiceClient(BaseClient):
         :raise: launchkey.exceptions.InvalidPolicy - The input policy is not valid. It should be a
         launchkey.clients.service.AuthPolicy.
         Please wait and try again.
-        :return: String - Unique identifier for tracking status of the authorization request
+        :param return_future: Whether to return a future resolved with the user's response instead of the request id
+        :param webhook_timeout: Seconds to wait for the response to be received by handle_webhook, in this process or
+        in another one relaying it through the authorization_relay, before polling for it. When it is not provided,
+        polling starts right away. The future is returned even if the relay cannot subscribe to the response.
+        :return: String - Unique identifier for tracking status of the authorization request, or
+        concurrent.futures.Future resolved with the launchkey.entities.service.AuthorizationResponse when return_future
+        is set. When an authorize_deduplicator is set, a request created for the same user, context, and policy within
+        its TTL is returned instead of creating another one.
         """
         kwargs = {'username': user}
         if context is not None:
@@ -41,13 +105,70 @@ class ServiceClient(BaseClient):
                                         "launchkey.clients.service.AuthPolicy class")
             kwargs['policy'] = policy.get_policy()
 
+        deduplicator = self.authorize_deduplicator
+        if deduplicator is None:
+            auth_request = self._create_authorization(kwargs)
+        else:
+            auth_request = deduplicator.authorize(deduplicator.fingerprint(user, context, kwargs.get('policy')),
+                                                  lambda: self._create_authorization(kwargs))
+        if return_future:
+            poller = self.authorization_poller
+            future = poller.poll(auth_request, delay=webhook_timeout)
+            if self.authorization_relay is not None:
+                try:
+                    unsubscribe = self.authorization_relay.subscribe(
+                        auth_request, lambda response: poller.resolve(auth_request, response))
+                except Exception:
+                    # The user was already pushed, so the future is kept and resolved by polling or by this process'
+                    # webhooks when the relay's broker cannot be reached
+                    return future
+                future.add_done_callback(lambda _: unsubscribe())
+            return future
+        return auth_request
+
+    def authorize_many(self, users, context=None, policy=None, max_workers=8, rate=None, max_retries=3):
+        """
+        Authorize a transaction for each of many users, such as for a step-up campaign. Requests are created
+        concurrently and users are read from the iterable as requests complete, so it may be a generator of any length.
+        Requests rate limited by the API are retried after a delay.
+        :param users: Iterable of LaunchKey Usernames, User Push IDs, or Directory User IDs, or of tuples of one and the
+        context for that user
+        :param context: Context for the users which are not given one
+        :param policy: launchkey.entities.service.AuthPolicy for every request. It is validated and serialized once.
+        :param max_workers: Maximum number of requests made at once
+        :param rate: Maximum number of requests per second, or None not to limit it
+        :param max_retries: Number of times a rate limited request is retried
+        :raise: launchkey.exceptions.InvalidParameters - The policy was not a launchkey.clients.service.AuthPolicy
+        :return: Generator of tuples of the user and the unique identifier of their authorization request, or the
+        exception raised creating it, in the order in which they complete
+        """
+        shared = {}
+        if policy is not None:
+            if not isinstance(policy, AuthPolicy):
+                raise InvalidParameters("Please verify the input policy is a "
+                                        "launchkey.clients.service.AuthPolicy class")
+            shared['policy'] = policy.get_policy()
+
+        def create(item):
+            user, user_context = item if isinstance(item, tuple) else (item, context)
+            kwargs = dict(shared, username=user)
+            if user_context is not None:
+                kwargs['context'] = user_context
+            return self._create_authorization(kwargs)
+
+        # Errors are converted here, as _create_authorization is also called by authorize, which converts them itself
+        results = run_bulk(api_call(create), users, max_workers=max_workers, rate=rate, max_retries=max_retries)
+        return ((item[0] if isinstance(item, tuple) else item, result) for item, result in results)
+
+    def _create_authorization(self, kwargs):
         response = self._transport.post("/service/v3/auths", self._subject, **kwargs)
         return self._validate_response(response, AuthorizeValidator)['auth_request']
 
-    @api_call
     def get_authorization_response(self, authorization_request_id):
         """
         Request the response for a previous authorization call.
+        When an authorization_store is set, a result already stored is returned without calling the API, and the API is
+        only called when no other worker holds the lease for polling the request.
         :param authorization_request_id: Unique identifier returned by authorize()
         :raise: launchkey.exceptions.InvalidParameters - Input parameters were not correct
         :raise: launchkey.exceptions.RequestTimedOut - The authorization request has not been responded to before the
@@ -56,6 +177,32 @@ class ServiceClient(BaseClient):
                  with the user's response
         in it
         """
+        store = self.authorization_store
+        if store is None:
+            return self._record_response(self._get_authorization_response(authorization_request_id))
+        result = store.get(authorization_request_id)
+        if result is None:
+            if not store.claim(authorization_request_id):
+                return None
+            try:
+                result = self._get_authorization_response(authorization_request_id)
+            except RequestTimedOut as e:
+                store.set(authorization_request_id, e)
+                raise
+            if result is None:
+                return None
+            store.set(authorization_request_id, result)
+        if isinstance(result, RequestTimedOut):
+            raise result
+        return self._record_response(result)
+
+    def _record_response(self, response):
+        if response is not None and self.session_registry is not None:
+            self.session_registry.record_response(response)
+        return response
+
+    @api_call
+    def _get_authorization_response(self, authorization_request_id):
         response = self._transport.get("/service/v3/auths/%s" % authorization_request_id, self._subject)
         if response.status_code == 204:
             return None
@@ -74,6 +221,8 @@ class ServiceClient(BaseClient):
         """
         self._transport.post("/service/v3/sessions", self._subject, username=user,
                              auth_request=authorization_request_id)
+        if self.session_registry is not None:
+            self.session_registry.start(user, authorization_request_id)
 
     @api_call
     def session_end(self, user):
@@ -84,6 +233,8 @@ class ServiceClient(BaseClient):
         :raise: launchkey.exceptions.EntityNotFound - The input username was not valid
         """
         self._transport.delete("/service/v3/sessions", self._subject, username=user)
+        if self.session_registry is not None:
+            self.session_registry.end(user)
 
     def handle_webhook(self, body, headers):
         """
@@ -91,14 +242,147 @@ class ServiceClient(BaseClient):
         In the event of a Logout webhook, be sure to call session_end() when you complete the process of ending the
         user's session in your implementation.  This will remove the corresponding Application from the authorization
         list on all of the the user's mobile devices.
-        :param body: The raw body that was send in the POST content
+        :param body: The raw body that was send in the POST content, as a string or as the bytes received
         :param headers: A generic map of response headers. These will be used to access and validate the JWT
-        :return: launchkey.entities.service.SessionEndRequest or launchkey.entities.service.AuthorizationResponse
+        :return: launchkey.entities.service.SessionEndRequest or launchkey.entities.service.AuthorizationResponse. An
+        AuthorizationResponse also resolves the future returned by authorize for the same request. The sessions of the
+        user of a SessionEndRequest can be found with the end_service_user method of the session_registry.
+        :raise: launchkey.exceptions.WebhookBodyTooLarge - The body is larger than max_webhook_body_size
+        :raise: launchkey.exceptions.InvalidJWTResponse - The JWT header is missing or malformed
+        :raise: launchkey.exceptions.JWTValidationFailure - The JWT header is not valid for the body and this Service
+        :raise: launchkey.exceptions.JWTReplayed - The webhook_replay_cache already holds the JWT ID of the webhook
         """
-        self._transport.verify_jwt_response(headers, None, body, self._subject)
-        if "service_user_hash" in body:
-            body = self._validate_response(loads(body), AuthorizeSSEValidator)
-            return SessionEndRequest(body['service_user_hash'], self._transport.parse_api_time(body['api_time']))
-        else:
-            body = loads(self._transport.decrypt_response(body))
-            return AuthorizationResponse(body, self._transport.loaded_issuer_private_keys)
+        screened = self._screen_webhook(body, headers)
+        payload = self._transport.verify_screened_jwt_response(headers, screened)
+        self._remember_webhook(payload)
+        return self._accept_webhook(_open_webhook(self._transport, body))
+
+    def handle_webhooks(self, batch, executor=None, max_workers=None):
+        """
+        Handle a batch of webhook callbacks, such as those buffered during a burst, verifying and decrypting them in
+        parallel. Requests which cannot be valid are rejected in the calling thread, as in handle_webhook, and the
+        others are sent in chunks to the workers. The results are then processed in the calling thread in input order,
+        so that futures, stores, the session registry, and the relay see them as if handle_webhook had been called for
+        each.
+
+        RSA operations hold the GIL, so a process pool is needed to use more than one core. The transport is pickled
+        once per chunk for process pools, with the API public keys it has cached. When they are stale, each chunk's
+        worker fetches them from the API itself, and the keys it fetches are not shared with this process.
+        :param batch: Iterable of tuples of the raw body and headers of each webhook, as passed to handle_webhook
+        :param executor: concurrent.futures.Executor verifying and decrypting the webhooks, such as a
+        ProcessPoolExecutor kept for every batch. Defaults to the webhook_executor.
+        :param max_workers: Number of workers of the executor, which the webhooks are spread over. Defaults to the
+        number of CPUs.
+        :return: List with, for each webhook in input order, what handle_webhook would have returned for it or the
+        exception it would have raised
+        """
+        items = list(batch)
+        results = [None] * len(items)
+        pending = []
+        for index, (body, headers) in enumerate(items):
+            try:
+                items[index] = body, headers, self._screen_webhook(body, headers)
+                pending.append(index)
+            except Exception as e:
+                results[index] = e
+        if not pending:
+            return results
+        workers = max_workers or cpu_count()
+        # A few chunks per worker balance uneven chunks while keeping the transport pickled a few times only
+        chunk_size = max(1, -(-len(pending) // (4 * workers)))
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        if executor is None:
+            executor = self.webhook_executor
+        futures = [executor.submit(_verify_and_open_webhooks, self._transport, [items[index] for index in chunk])
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            try:
+                opened = future.result()
+            except Exception as e:
+                # The chunk could not be sent to a worker, or the worker died
+                opened = [(None, e)] * len(chunk)
+            for index, (payload, result) in zip(chunk, opened):
+                if payload is not None:
+                    try:
+                        self._remember_webhook(payload)
+                        result = self._accept_webhook(result)
+                    except Exception as e:
+                        result = e
+                results[index] = result
+        return results
+
+    def _screen_webhook(self, body, headers):
+        """
+        Rejects a webhook which cannot be valid, and one already received, before any public key operation
+        :return: The unverified JWT payload, to verify with verify_screened_jwt_response
+        """
+        if self.max_webhook_body_size is not None and len(body) > self.max_webhook_body_size:
+            raise WebhookBodyTooLarge("The webhook body is larger than %s bytes" % self.max_webhook_body_size)
+        # Requests which cannot be valid are rejected before the signature is verified and the body decrypted, so that
+        # floods of junk do not cost public key operations
+        payload = self._transport.screen_jwt_response(headers, body, self._subject)
+        if self.webhook_replay_cache is not None:
+            if not isinstance(payload.get("jti"), six.string_types):
+                raise JWTValidationFailure("JTI is missing")
+            if payload["jti"] in self.webhook_replay_cache:
+                raise JWTReplayed("JTI %s was already received" % payload["jti"])
+        return payload
+
+    def _remember_webhook(self, payload):
+        """
+        Records the JWT ID of a webhook in the replay cache. The ID is only remembered once the signature is verified,
+        so that forged requests cannot fill the cache.
+        """
+        if self.webhook_replay_cache is not None and \
+                not self.webhook_replay_cache.add(payload["jti"], payload["exp"] + JOSE_JWT_LEEWAY):
+            raise JWTReplayed("JTI %s was already received" % payload["jti"])
+
+    def _accept_webhook(self, package):
+        """Shares a webhook's authorization response with the futures, store, session registry, and relay"""
+        if not isinstance(package, SessionEndRequest):
+            if self._authorization_poller is not None:
+                self._authorization_poller.resolve(package.authorization_request_id, package)
+            if self.authorization_store is not None:
+                self.authorization_store.set(package.authorization_request_id, package)
+            self._record_response(package)
+            if self.authorization_relay is not None:
+                self.authorization_relay.publish(package)
+        return package
+
+
+def _is_session_end_body(body):
+    """
+    Classifies a webhook body by its first character without scanning it: session end requests are JSON objects, while
+    authorization responses are JWE compact serializations, which start with a base64url encoded header.
+    """
+    start = body.lstrip()[:1]
+    return start == (b"{" if isinstance(start, six.binary_type) else u"{")
+
+
+def _open_webhook(transport, body):
+    """Parses the body of a verified webhook, decrypting an authorization response"""
+    if _is_session_end_body(body):
+        if isinstance(body, six.binary_type):
+            body = body.decode("utf-8")
+        body = BaseClient._validate_response(loads(body), AuthorizeSSEValidator)
+        return SessionEndRequest(body['service_user_hash'], transport.parse_api_time(body['api_time']))
+    return AuthorizationResponse(loads(transport.decrypt_response(body)), transport.loaded_issuer_private_keys)
+
+
+def _verify_and_open_webhooks(transport, items):
+    """
+    Verifies and parses a chunk of webhooks for ServiceClient.handle_webhooks. It is a module function so that process
+    pools can pickle it.
+    :param transport: Transport verifying and decrypting the webhooks
+    :param items: List of tuples of the body, the headers, and the screened JWT payload of each webhook
+    :return: List of tuples of the verified JWT payload and the package of each webhook, or of None and the exception
+    raised for it
+    """
+    opened = []
+    for body, headers, screened in items:
+        try:
+            payload = transport.verify_screened_jwt_response(headers, screened)
+            opened.append((payload, _open_webhook(transport, body)))
+        except Exception as e:
+            opened.append((None, e))
+    return opened
@@ -0,0 +1,2 @@
+from .client import DaemonFactory
+from .server import LaunchKeyDaemon
@@ -0,0 +1,53 @@
+"""
+Runs a LaunchKey daemon for a single Organization, Directory, or Service.
+
+    python -m launchkey.daemon --socket /var/run/launchkey.sock --service-id <id> --private-key service.key
+"""
+from launchkey import LAUNCHKEY_PRODUCTION
+from launchkey.daemon.server import LaunchKeyDaemon
+from launchkey.factories import DirectoryFactory, OrganizationFactory, ServiceFactory
+from launchkey.transports import JOSETransport, RequestsTransport
+import argparse
+
+
+def _read(path):
+    with open(path) as key_file:
+        return key_file.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m launchkey.daemon", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--socket", required=True, help="Path of the Unix domain socket to listen on")
+    entity = parser.add_mutually_exclusive_group(required=True)
+    entity.add_argument("--organization-id")
+    entity.add_argument("--directory-id")
+    entity.add_argument("--service-id")
+    parser.add_argument("--private-key", required=True, help="Path to the PEM formatted private key")
+    parser.add_argument("--additional-private-key", action="append", default=[],
+                        help="Path to an additional PEM formatted private key for key rotation")
+    parser.add_argument("--url", default=LAUNCHKEY_PRODUCTION, help="URL for the LaunchKey API")
+    parser.add_argument("--testing", action="store_true", help="Disable SSL validation")
+    args = parser.parse_args(argv)
+
+    if args.organization_id:
+        factory_class, entity_id = OrganizationFactory, args.organization_id
+    elif args.directory_id:
+        factory_class, entity_id = DirectoryFactory, args.directory_id
+    else:
+        factory_class, entity_id = ServiceFactory, args.service_id
+    factory = factory_class(entity_id, _read(args.private_key), url=args.url, testing=args.testing,
+                            transport=JOSETransport(http_client=RequestsTransport(pooled=True)))
+    for path in args.additional_private_key:
+        factory.add_additional_private_key(_read(path))
+
+    daemon = LaunchKeyDaemon(factory, args.socket)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+
+
+if __name__ == "__main__":
+    main()
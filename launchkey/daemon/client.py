@@ -0,0 +1,173 @@
+from launchkey.clients import DirectoryClient, OrganizationClient, ServiceClient
+from launchkey.daemon.protocol import send_message, recv_message
+from launchkey.exceptions import DaemonConnectionError
+from launchkey.utils import ForkDetector
+import socket
+import threading
+
+
+class DaemonConnection(object):
+    """Keeps one connection per thread to a LaunchKey daemon and performs calls over it"""
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        :param socket_path: Path of the Unix domain socket the daemon listens on
+        :param timeout: Socket timeout in seconds
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._fork_detector = ForkDetector()
+
+    def __getstate__(self):
+        return {"socket_path": self.socket_path, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(state["socket_path"], state["timeout"])
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error as e:
+            sock.close()
+            raise DaemonConnectionError("Unable to connect to the LaunchKey daemon at %s: %s" % (self.socket_path, e))
+        return sock
+
+    def close(self):
+        """Closes the current thread's connection"""
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def call(self, client_type, subject_id, method, args, kwargs):
+        """
+        Performs a client call in the daemon
+        :param client_type: service, directory, or organization
+        :param subject_id: Subject id of the client or None for the daemon factory's own entity
+        :param method: Client method name
+        :param args: Positional arguments for the method
+        :param kwargs: Keyword arguments for the method
+        :raise: launchkey.exceptions.DaemonConnectionError - The daemon could not be reached or did not respond
+        :return: The value returned by the client method. Exceptions raised by it are re-raised.
+        """
+        message = (client_type, subject_id, method, args, kwargs)
+        if self._fork_detector.forked():
+            self._local = threading.local()
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                send_message(sock, message)
+            except socket.error:
+                # The daemon closed the idle connection, likely due to a restart. Nothing was sent so retry.
+                self.close()
+                sock = None
+        if sock is None:
+            sock = self._local.sock = self._connect()
+            try:
+                send_message(sock, message)
+            except socket.error as e:
+                self.close()
+                raise DaemonConnectionError("Unable to send the request to the LaunchKey daemon: %s" % e)
+        try:
+            status, value = recv_message(sock)
+        except (EOFError, socket.error) as e:
+            self.close()
+            raise DaemonConnectionError("The LaunchKey daemon did not respond: %s" % e)
+        if status == "error":
+            raise value
+        return value
+
+
+class _RemoteClient(object):
+    """Exposes the public methods of client_class by forwarding them to the daemon"""
+
+    client_class = None
+    client_type = None
+
+    def __init__(self, connection, subject_id=None):
+        self._connection = connection
+        self._subject_id = str(subject_id) if subject_id is not None else None
+
+    def _call(self, method, *args, **kwargs):
+        return self._connection.call(self.client_type, self._subject_id, method, args, kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not callable(getattr(self.client_class, name, None)):
+            raise AttributeError("%s has no attribute %s" % (self.__class__.__name__, name))
+
+        def remote_call(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+        remote_call.__name__ = name
+        remote_call.__doc__ = getattr(self.client_class, name).__doc__
+        return remote_call
+
+
+class RemoteServiceClient(_RemoteClient):
+    """Thin launchkey.clients.ServiceClient whose calls are performed by the daemon"""
+
+    client_class = ServiceClient
+    client_type = "service"
+
+    def handle_webhook(self, body, headers):
+        """
+        Handle a webhook callback in the daemon. See launchkey.clients.ServiceClient.handle_webhook.
+        :param body: The raw body that was send in the POST content
+        :param headers: A generic map of response headers
+        :return: launchkey.entities.service.SessionEndRequest or launchkey.entities.service.AuthorizationResponse
+        """
+        return self._call("handle_webhook", body, dict(headers))
+
+
+class RemoteDirectoryClient(_RemoteClient):
+    """Thin launchkey.clients.DirectoryClient whose calls are performed by the daemon"""
+
+    client_class = DirectoryClient
+    client_type = "directory"
+
+
+class RemoteOrganizationClient(_RemoteClient):
+    """Thin launchkey.clients.OrganizationClient whose calls are performed by the daemon"""
+
+    client_class = OrganizationClient
+    client_type = "organization"
+
+
+class DaemonFactory(object):
+    """
+    Factory for thin clients of a LaunchKey daemon. The clients expose the same methods as the clients of the factory
+    the daemon was started with, but hold no keys, connections, or caches of their own.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        :param socket_path: Path of the Unix domain socket the daemon listens on
+        :param timeout: Socket timeout in seconds
+        """
+        self._connection = DaemonConnection(socket_path, timeout)
+
+    def make_service_client(self, service_id=None):
+        """
+        Retrieves a client to make service calls.
+        :param service_id: Service id. Leave empty when the daemon runs a ServiceFactory.
+        :return: launchkey.daemon.client.RemoteServiceClient
+        """
+        return RemoteServiceClient(self._connection, service_id)
+
+    def make_directory_client(self, directory_id=None):
+        """
+        Retrieves a client to make directory calls.
+        :param directory_id: Directory id. Leave empty when the daemon runs a DirectoryFactory.
+        :return: launchkey.daemon.client.RemoteDirectoryClient
+        """
+        return RemoteDirectoryClient(self._connection, directory_id)
+
+    def make_organization_client(self):
+        """
+        Retrieves a client to make organization calls.
+        :return: launchkey.daemon.client.RemoteOrganizationClient
+        """
+        return RemoteOrganizationClient(self._connection)
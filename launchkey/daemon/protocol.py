@@ -0,0 +1,43 @@
+"""
+Framing used between the LaunchKey daemon and its thin clients. Every message is a pickled tuple prefixed with its
+length as a 4 byte big endian unsigned integer. Pickle is used so that entities and exceptions cross the socket
+unchanged, which means the daemon socket must only be reachable by trusted local users.
+"""
+from six.moves import cPickle as pickle
+import struct
+
+PICKLE_PROTOCOL = 2
+_HEADER = struct.Struct(">I")
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            raise EOFError("Connection closed by peer")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock, message):
+    """
+    Sends a single framed message
+    :param sock: Connected stream socket
+    :param message: Picklable object
+    """
+    payload = pickle.dumps(message, PICKLE_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    """
+    Receives a single framed message
+    :param sock: Connected stream socket
+    :raise: EOFError - The connection was closed before a full message was received
+    :return: The unpickled message
+    """
+    size, = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return pickle.loads(_recv_exactly(sock, size))
@@ -0,0 +1,74 @@
+from launchkey.daemon.protocol import send_message, recv_message
+from launchkey.utils import remove_stale_socket
+from six.moves import socketserver, cPickle as pickle
+import os
+import socket
+
+
+class _DaemonRequestHandler(socketserver.BaseRequestHandler):
+    """Serves calls from a single thin client connection until it is closed"""
+
+    def handle(self):
+        while True:
+            try:
+                client_type, subject_id, method, args, kwargs = recv_message(self.request)
+            except (EOFError, socket.error):
+                return
+            response = self.server.dispatch(client_type, subject_id, method, args, kwargs)
+            try:
+                send_message(self.request, response)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                send_message(self.request, ("error", RuntimeError("The %s of %s could not be serialized: %s" %
+                                                                  (response[0], method, e))))
+            except socket.error:
+                return
+
+
+class LaunchKeyDaemon(socketserver.ThreadingUnixStreamServer):
+    """
+    Local daemon owning a single factory, and with it the issuer keys, the JOSE transport and its connections and
+    caches. Thin clients created by launchkey.daemon.DaemonFactory call it over a Unix domain socket.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, factory, socket_path, socket_mode=0o600):
+        """
+        :param factory: Instantiated launchkey.factories.ServiceFactory, DirectoryFactory or OrganizationFactory
+        :param socket_path: Path of the Unix domain socket to listen on. A stale socket file is replaced.
+        :param socket_mode: File mode for the socket. Anyone able to connect can act with the factory's credentials.
+        :raise: OSError - Something other than a socket exists at the socket path
+        """
+        self.factory = factory
+        self.socket_path = socket_path
+        remove_stale_socket(socket_path)
+        socketserver.ThreadingUnixStreamServer.__init__(self, socket_path, _DaemonRequestHandler)
+        os.chmod(socket_path, socket_mode)
+
+    def server_close(self):
+        socketserver.ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _get_client(self, client_type, subject_id):
+        make_client = getattr(self.factory, "make_%s_client" % client_type, None)
+        if make_client is None:
+            raise AttributeError("%s cannot make %s clients" % (self.factory.__class__.__name__, client_type))
+        return make_client() if subject_id is None else make_client(subject_id)
+
+    def dispatch(self, client_type, subject_id, method, args, kwargs):
+        """
+        Performs a client call on behalf of a thin client
+        :param client_type: service, directory, or organization
+        :param subject_id: Subject id passed to the factory's make_*_client method or None for the factory's own entity
+        :param method: Public client method name
+        :param args: Positional arguments for the method
+        :param kwargs: Keyword arguments for the method
+        :return: Tuple of ("result", return value) or ("error", raised exception)
+        """
+        try:
+            if method.startswith("_"):
+                raise AttributeError("Private method %s cannot be called through the daemon" % method)
+            return "result", getattr(self._get_client(client_type, subject_id), method)(*args, **kwargs)
+        except Exception as e:
+            return "error", e
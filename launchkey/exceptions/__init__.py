@@ -26,6 +26,10 @@ class InvalidAlgorithm(Exception):
     """Input algorithm is not supported"""
 
 
+class DaemonConnectionError(Exception):
+    """The LaunchKey daemon could not be reached or closed the connection before responding"""
+
+
 class InvalidPolicyFormat(Exception):
     """Invalid policy format. A JSON object is expected which is in the proper format containing minimum_requirements
     and factors."""
@@ -67,6 +71,9 @@ class LaunchKeyAPIException(Exception):
         self.status_code = status_code
         self.reason = reason
 
+    def __reduce__(self):
+        return self.__class__, (self.message, self.status_code, self.reason)
+
 
 class InvalidParameters(LaunchKeyAPIException):
     """API Error ARG-001 - Parameter validation error"""
@@ -128,10 +135,18 @@ class NoIssuerKey(LaunchKeyAPIException):
     """Issuer key was not loaded"""
 
 
+class JWTReplayed(JWTValidationFailure):
+    """The JWT of a webhook was already received, so the webhook is a duplicate delivery or a replay"""
+
+
 class InvalidJWTResponse(LaunchKeyAPIException):
     """JWT Response is not in a valid format"""
 
 
+class WebhookBodyTooLarge(LaunchKeyAPIException):
+    """The webhook request body is larger than the maximum size and was not processed"""
+
+
 class InvalidRoute(LaunchKeyAPIException):
     """The requested route does not exist in the requested path + method"""
 
@@ -1,3 +1,4 @@
 from .directory import DirectoryFactory
 from .organization import OrganizationFactory
 from .service import ServiceFactory
+from .registry import FactoryRegistry
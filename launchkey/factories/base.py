@@ -1,5 +1,6 @@
 from launchkey.transports import JOSETransport
 from launchkey.utils import UUIDHelper
+import threading
 
 
 class BaseFactory(object):
@@ -10,7 +11,7 @@ class BaseFactory(object):
     the JOSE flow.
     """
 
-    def __init__(self, issuer, issuer_id, private_key, url, testing, transport):
+    def __init__(self, issuer, issuer_id, private_key, url, testing, transport, lazy=False):
         """
         :param issuer: Issuer type that will be translated directly to the JOSE transport layer as an issuer.
                        IE: svc, dir, org
@@ -19,11 +20,43 @@ class BaseFactory(object):
         :param url: URL for the LaunchKey API
         :param testing: Boolean stating whether testing mode is being used. This will determine whether SSL validation
         occurs.
+        :param lazy: Boolean stating whether parsing the private keys should be deferred until the first API call
         """
         self._issuer_id = UUIDHelper().from_string(issuer_id)
+        self._lazy = lazy
         self._transport = transport if transport is not None else JOSETransport()
         self._transport.set_url(url, testing)
-        self._transport.set_issuer(issuer, issuer_id, private_key)
+        self._transport.set_issuer(issuer, issuer_id, private_key, lazy=lazy)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def __getstate__(self):
+        """Pickles the factory with its transport. Clients are not pickled and are made again on demand."""
+        state = self.__dict__.copy()
+        del state["_clients"], state["_clients_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def _get_client(self, client_class, subject_id):
+        """
+        Retrieves the client of the given class for a subject. Clients are created once per subject and shared by
+        every caller for the life of the factory.
+        :param client_class: launchkey.clients.ServiceClient, DirectoryClient, or OrganizationClient
+        :param subject_id: UUID of the subject
+        :return: Instance of client_class
+        """
+        key = client_class, str(subject_id)
+        client = self._clients.get(key)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = client_class(subject_id, self._transport)
+        return client
 
     def add_additional_private_key(self, private_key):
         """
@@ -32,4 +65,15 @@ class BaseFactory(object):
         :param private_key:
         :return:
         """
-        self._transport.add_issuer_key(private_key)
+        self._transport.add_issuer_key(private_key, lazy=self._lazy)
+
+    def watch_private_keys(self, path, check_interval=10):
+        """
+        Loads the private keys from a key directory or bundle file, and reloads them when the files change. This allows
+        keys to be rotated without restarts. The keys found replace every key the factory had.
+        :param path: Directory in which every file holds PEM private keys, or a file of concatenated PEM private keys
+        :param check_interval: Minimum number of seconds between two checks of the files for changes
+        :raise: launchkey.exceptions.InvalidPrivateKey - A key is invalid or no key was found
+        :return:
+        """
+        self._transport.watch_issuer_keys(path, check_interval)
@@ -6,7 +6,8 @@ from launchkey.clients import DirectoryClient, ServiceClient
 class DirectoryFactory(BaseFactory):
     """Factory for creating clients when representing a LaunchKey Directory"""
 
-    def __init__(self, directory_id, private_key, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None):
+    def __init__(self, directory_id, private_key, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None,
+                 lazy=False):
         """
         :param directory_id: UUID for the requesting directory
         :param private_key: PEM formatted private key string
@@ -17,15 +18,18 @@ class DirectoryFactory(BaseFactory):
         launchkey.transports.JOSETransport. If you wish to set encryption or hashing algorithms, this is where you would
         do it. IE: JOSETransport(jwt_algorithm="RS512", jwe_cek_encryption="RSA-OAEP",
                                 jwe_claims_encryption="A256CBC-HS512", content_hash_algorithm="S256")
+        :param lazy: Boolean stating whether parsing the private keys should be deferred until the first API call. This
+        makes creating the factory cheap, but an invalid key is only reported, by
+        launchkey.exceptions.InvalidPrivateKey, on the first API call.
         """
-        super(DirectoryFactory, self).__init__('dir', directory_id, private_key, url, testing, transport)
+        super(DirectoryFactory, self).__init__('dir', directory_id, private_key, url, testing, transport, lazy)
 
     def make_directory_client(self):
         """
         Retrieves a client to make directory calls.
         :return: launchkey.clients.DirectoryClient
         """
-        return DirectoryClient(self._issuer_id, self._transport)
+        return self._get_client(DirectoryClient, self._issuer_id)
 
     def make_service_client(self, service_id):
         """
@@ -33,4 +37,4 @@ class DirectoryFactory(BaseFactory):
         :param service_id: Service id
         :return: launchkey.clients.ServiceClient
         """
-        return ServiceClient(service_id, self._transport)
+        return self._get_client(ServiceClient, service_id)
@@ -6,7 +6,8 @@ from launchkey.clients import DirectoryClient, OrganizationClient, ServiceClient
 class OrganizationFactory(BaseFactory):
     """Factory for creating clients when representing a LaunchKey Organization"""
 
-    def __init__(self, organization_id, private_key, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None):
+    def __init__(self, organization_id, private_key, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None,
+                 lazy=False):
         """
         :param organization_id: UUID for the requesting organization
         :param private_key: PEM formatted private key string
@@ -17,8 +18,11 @@ class OrganizationFactory(BaseFactory):
         launchkey.transports.JOSETransport. If you wish to set encryption or hashing algorithms, this is where you would
         do it. IE: JOSETransport(jwt_algorithm="RS512", jwe_cek_encryption="RSA-OAEP",
                                 jwe_claims_encryption="A256CBC-HS512", content_hash_algorithm="S256")
+        :param lazy: Boolean stating whether parsing the private keys should be deferred until the first API call. This
+        makes creating the factory cheap, but an invalid key is only reported, by
+        launchkey.exceptions.InvalidPrivateKey, on the first API call.
         """
-        super(OrganizationFactory, self).__init__('org', organization_id, private_key, url, testing, transport)
+        super(OrganizationFactory, self).__init__('org', organization_id, private_key, url, testing, transport, lazy)
 
     def make_directory_client(self, directory_id):
         """
@@ -26,14 +30,14 @@ class OrganizationFactory(BaseFactory):
         :param directory_id: Directory id
         :return: launchkey.clients.DirectoryClient
         """
-        return DirectoryClient(directory_id, self._transport)
+        return self._get_client(DirectoryClient, directory_id)
 
     def make_organization_client(self):
         """
         Retrieves a client to make organization calls.
         :return: launchkey.clients.OrganizationClient
         """
-        return OrganizationClient(self._issuer_id, self._transport)
+        return self._get_client(OrganizationClient, self._issuer_id)
 
     def make_service_client(self, service_id):
         """
@@ -41,4 +45,4 @@ class OrganizationFactory(BaseFactory):
         :param service_id: Service id
         :return: launchkey.clients.ServiceClient
         """
-        return ServiceClient(service_id, self._transport)
+        return self._get_client(ServiceClient, service_id)
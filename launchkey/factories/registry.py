@@ -0,0 +1,101 @@
+from .directory import DirectoryFactory
+from .organization import OrganizationFactory
+from .service import ServiceFactory
+from launchkey import LAUNCHKEY_PRODUCTION
+from launchkey.transports import JOSETransport, RequestsTransport
+from launchkey.utils import UUIDHelper
+from hashlib import sha256
+import six
+import threading
+
+
+class FactoryRegistry(object):
+    """
+    Registry of factories for many Organizations, Directories, or Services. Each entity gets a single factory, and all
+    factories share one HTTP client, one cached server time difference, one cached set of API public keys, and the
+    parsed issuer keys. Only the issuer key ring is specific to each factory, so memory and background API traffic grow
+    with the number of unique keys rather than the number of factories.
+    """
+
+    def __init__(self, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None, lazy=False):
+        """
+        :param url: URL for the LaunchKey API
+        :param testing: Boolean stating whether testing mode is being used. This will determine whether SSL validation
+        occurs.
+        :param transport: Instantiated launchkey.transports.JOSETransport whose algorithms and resources are shared by
+        every factory. By default, a JOSETransport with a pooled RequestsTransport is used.
+        :param lazy: Boolean stating whether factories defer parsing their private keys until their first API call
+        """
+        self._url = url
+        self._testing = testing
+        self._lazy = lazy
+        self._transport = transport if transport is not None else \
+            JOSETransport(http_client=RequestsTransport(pooled=True))
+        self._factories = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._factories)
+
+    def _get_factory(self, factory_class, entity_id, private_key):
+        key = factory_class, str(UUIDHelper().from_string(entity_id))
+        digest = sha256(six.b(private_key)).digest()
+        with self._lock:
+            entry = self._factories.get(key)
+            if entry is None:
+                factory = factory_class(entity_id, private_key, url=self._url, testing=self._testing,
+                                        transport=self._transport.derive(), lazy=self._lazy)
+                entry = self._factories[key] = factory, set([digest])
+            elif digest not in entry[1]:
+                entry[0].add_additional_private_key(private_key)
+                entry[1].add(digest)
+        return entry[0]
+
+    def get_organization_factory(self, organization_id, private_key):
+        """
+        Retrieves the factory for an Organization, creating it on first use. A private key which the factory does not
+        have yet is added to it as an additional key.
+        :param organization_id: UUID for the requesting organization
+        :param private_key: PEM formatted private key string
+        :return: launchkey.factories.OrganizationFactory
+        """
+        return self._get_factory(OrganizationFactory, organization_id, private_key)
+
+    def get_directory_factory(self, directory_id, private_key):
+        """
+        Retrieves the factory for a Directory, creating it on first use. A private key which the factory does not have
+        yet is added to it as an additional key.
+        :param directory_id: UUID for the requesting directory
+        :param private_key: PEM formatted private key string
+        :return: launchkey.factories.DirectoryFactory
+        """
+        return self._get_factory(DirectoryFactory, directory_id, private_key)
+
+    def get_service_factory(self, service_id, private_key):
+        """
+        Retrieves the factory for a Service, creating it on first use. A private key which the factory does not have
+        yet is added to it as an additional key.
+        :param service_id: UUID for the requesting service
+        :param private_key: PEM formatted private key string
+        :return: launchkey.factories.ServiceFactory
+        """
+        return self._get_factory(ServiceFactory, service_id, private_key)
+
+    def remove(self, entity_id):
+        """
+        Removes every factory registered for an entity. Clients already made by them keep working.
+        :param entity_id: UUID of the Organization, Directory, or Service
+        """
+        entity_id = str(UUIDHelper().from_string(entity_id))
+        with self._lock:
+            for key in [key for key in self._factories if key[1] == entity_id]:
+                del self._factories[key]
@@ -6,7 +6,8 @@ from launchkey.clients import ServiceClient
 class ServiceFactory(BaseFactory):
     """Factory for creating clients when representing a LaunchKey Service Profile"""
 
-    def __init__(self, service_id, private_key, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None):
+    def __init__(self, service_id, private_key, url=LAUNCHKEY_PRODUCTION, testing=False, transport=None,
+                 lazy=False):
         """
         :param service_id: UUID for the requesting service
         :param private_key: PEM formatted private key string
@@ -17,12 +18,15 @@ class ServiceFactory(BaseFactory):
         launchkey.transports.JOSETransport. If you wish to set encryption or hashing algorithms, this is where you would
         do it. IE: JOSETransport(jwt_algorithm="RS512", jwe_cek_encryption="RSA-OAEP",
                                 jwe_claims_encryption="A256CBC-HS512", content_hash_algorithm="S256")
+        :param lazy: Boolean stating whether parsing the private keys should be deferred until the first API call. This
+        makes creating the factory cheap, but an invalid key is only reported, by
+        launchkey.exceptions.InvalidPrivateKey, on the first API call.
         """
-        super(ServiceFactory, self).__init__('svc', service_id, private_key, url, testing, transport)
+        super(ServiceFactory, self).__init__('svc', service_id, private_key, url, testing, transport, lazy)
 
     def make_service_client(self):
         """
         Retrieves a client to make service calls.
         :return: launchkey.clients.ServiceClient
         """
-        return ServiceClient(self._issuer_id, self._transport)
+        return self._get_client(ServiceClient, self._issuer_id)
@@ -0,0 +1,6 @@
+from .poller import AuthorizationPoller
+from .schedules import BackoffSchedule, LearnedSchedule
+from .brokers import InMemoryBroker, UnixSocketBroker, UnixSocketBrokerServer, RedisBroker
+from .relay import AuthorizationRelay
+from .stores import InMemoryAuthorizationStore, SQLiteAuthorizationStore, SharedMemoryAuthorizationStore
+from .deduplication import AuthorizationDeduplicator
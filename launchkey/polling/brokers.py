@@ -0,0 +1,316 @@
+from launchkey.utils import remove_stale_socket
+from six.moves import socketserver
+import json
+import os
+import six
+import socket
+import struct
+import threading
+
+_LENGTH = struct.Struct(">I")
+
+
+def _send_frame(sock, message):
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("The connection was closed")
+        data += chunk
+    return data
+
+
+def _recv_frame(sock):
+    length, = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    return json.loads(_recv_exactly(sock, length).decode("utf-8"))
+
+
+class _Subscriptions(object):
+    """Keeps the callbacks subscribed to each channel in this process and dispatches messages to them"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._subscriptions_lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        """
+        Calls callback with every message published on the channel until it is unsubscribed
+        :param channel: Channel name
+        :param callback: Callable receiving the message string. It is called from the broker's thread.
+        :raise: Exception raised when the channel could not be subscribed to. The callback is then not subscribed.
+        """
+        with self._subscriptions_lock:
+            callbacks = self._subscriptions.setdefault(channel, [])
+            callbacks.append(callback)
+            if len(callbacks) == 1:
+                try:
+                    self._channel_added(channel)
+                except Exception:
+                    del self._subscriptions[channel]
+                    raise
+
+    def unsubscribe(self, channel, callback):
+        """
+        Stops calling a callback subscribed to a channel
+        :param channel: Channel name
+        :param callback: Callable given to subscribe
+        """
+        with self._subscriptions_lock:
+            callbacks = self._subscriptions.get(channel)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscriptions[channel]
+                self._channel_removed(channel)
+
+    def _dispatch(self, channel, message):
+        with self._subscriptions_lock:
+            callbacks = list(self._subscriptions.get(channel, ()))
+        for callback in callbacks:
+            callback(message)
+
+    def _channel_added(self, channel):
+        """Called while holding the subscriptions lock when a channel gets its first callback"""
+
+    def _channel_removed(self, channel):
+        """Called while holding the subscriptions lock when a channel loses its last callback"""
+
+
+class InMemoryBroker(_Subscriptions):
+    """Broker delivering messages to the subscribers of the current process only"""
+
+    def publish(self, channel, message):
+        """
+        Delivers a message to the subscribers of a channel
+        :param channel: Channel name
+        :param message: Message string
+        """
+        self._dispatch(channel, message)
+
+    def close(self):
+        """Nothing to release"""
+
+
+class _BrokerRequestHandler(socketserver.BaseRequestHandler):
+    """Relays the messages of a single broker connection until it is closed"""
+
+    def setup(self):
+        self._send_lock = threading.Lock()
+
+    def send(self, frame):
+        """Sends a frame to the connection. Frames relayed by other connections' threads are never interleaved."""
+        with self._send_lock:
+            _send_frame(self.request, frame)
+
+    def handle(self):
+        channels = set()
+        try:
+            while True:
+                try:
+                    frame = _recv_frame(self.request)
+                except (EOFError, socket.error, ValueError):
+                    return
+                operation, channel = frame.get("op"), frame.get("channel")
+                if operation == "subscribe":
+                    channels.add(channel)
+                    self.server.add_subscriber(channel, self)
+                elif operation == "unsubscribe":
+                    channels.discard(channel)
+                    self.server.remove_subscriber(channel, self)
+                elif operation == "publish":
+                    self.server.relay(channel, frame.get("message"))
+        finally:
+            for channel in channels:
+                self.server.remove_subscriber(channel, self)
+
+
+class UnixSocketBrokerServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Hub relaying the messages published by launchkey.polling.UnixSocketBroker instances to the ones subscribed to
+    their channel. It allows the processes of a host to exchange messages without an external broker.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, socket_mode=0o600):
+        """
+        :param socket_path: Path of the Unix domain socket to listen on. A stale socket file is replaced.
+        :param socket_mode: File mode for the socket. Anyone able to connect can publish and receive messages.
+        :raise: OSError - Something other than a socket exists at the socket path
+        """
+        self.socket_path = socket_path
+        self._subscribers = {}
+        self._subscribers_lock = threading.Lock()
+        remove_stale_socket(socket_path)
+        socketserver.ThreadingUnixStreamServer.__init__(self, socket_path, _BrokerRequestHandler)
+        os.chmod(socket_path, socket_mode)
+
+    def server_close(self):
+        socketserver.ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def add_subscriber(self, channel, handler):
+        with self._subscribers_lock:
+            self._subscribers.setdefault(channel, set()).add(handler)
+
+    def remove_subscriber(self, channel, handler):
+        with self._subscribers_lock:
+            handlers = self._subscribers.get(channel)
+            if handlers is not None:
+                handlers.discard(handler)
+                if not handlers:
+                    del self._subscribers[channel]
+
+    def relay(self, channel, message):
+        """
+        Sends a message to every connection subscribed to the channel
+        :param channel: Channel name
+        :param message: Message string
+        """
+        with self._subscribers_lock:
+            handlers = list(self._subscribers.get(channel, ()))
+        for handler in handlers:
+            try:
+                handler.send({"channel": channel, "message": message})
+            except socket.error:
+                self.remove_subscriber(channel, handler)
+
+
+class UnixSocketBroker(_Subscriptions):
+    """
+    Broker exchanging messages with the other processes of a host through a launchkey.polling.UnixSocketBrokerServer.
+    Subscriptions are sent again when the connection to the server is lost and established again.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        :param socket_path: Path of the Unix domain socket the server listens on
+        :param timeout: Socket timeout in seconds for connecting to the server
+        """
+        super(UnixSocketBroker, self).__init__()
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        """Connects to the server and subscribes to the current channels. It must be called holding the send lock."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            for channel in list(self._subscriptions):
+                _send_frame(sock, {"op": "subscribe", "channel": channel})
+        except socket.error:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        reader = threading.Thread(target=self._read, args=(sock,), name="launchkey-broker-reader")
+        reader.daemon = True
+        reader.start()
+        self._sock = sock
+
+    def _read(self, sock):
+        while True:
+            try:
+                frame = _recv_frame(sock)
+            except (EOFError, socket.error, ValueError):
+                with self._send_lock:
+                    if self._sock is sock:
+                        self._sock = None
+                sock.close()
+                return
+            self._dispatch(frame.get("channel"), frame.get("message"))
+
+    def _send(self, frame):
+        with self._send_lock:
+            if self._sock is not None:
+                try:
+                    _send_frame(self._sock, frame)
+                    return
+                except socket.error:
+                    self._sock.close()
+                    self._sock = None
+            self._connect()
+            if frame["op"] != "subscribe":
+                _send_frame(self._sock, frame)
+
+    def publish(self, channel, message):
+        """
+        Publishes a message to the subscribers of a channel in every process connected to the server
+        :param channel: Channel name
+        :param message: Message string
+        :raise: socket.error - The server could not be reached
+        """
+        self._send({"op": "publish", "channel": channel, "message": message})
+
+    def _channel_added(self, channel):
+        self._send({"op": "subscribe", "channel": channel})
+
+    def _channel_removed(self, channel):
+        try:
+            self._send({"op": "unsubscribe", "channel": channel})
+        except socket.error:
+            pass
+
+    def close(self):
+        """Closes the connection to the server"""
+        with self._send_lock:
+            if self._sock is not None:
+                self._sock.shutdown(socket.SHUT_RDWR)
+                self._sock.close()
+                self._sock = None
+
+
+class RedisBroker(_Subscriptions):
+    """
+    Broker exchanging messages between hosts through Redis, or any server implementing its PUBLISH and SUBSCRIBE
+    commands. The client is not provided by the SDK: pass an instantiated redis.Redis or compatible client.
+    """
+
+    def __init__(self, client, sleep_time=0.01):
+        """
+        :param client: Redis client with the publish and pubsub methods of redis.Redis
+        :param sleep_time: Seconds the listening thread sleeps between two reads when no message is pending
+        """
+        super(RedisBroker, self).__init__()
+        self._client = client
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._sleep_time = sleep_time
+        self._thread = None
+
+    def _handle(self, message):
+        channel, data = message["channel"], message["data"]
+        channel = channel.decode("utf-8") if isinstance(channel, six.binary_type) else channel
+        data = data.decode("utf-8") if isinstance(data, six.binary_type) else data
+        self._dispatch(channel, data)
+
+    def publish(self, channel, message):
+        """
+        Publishes a message to the subscribers of a channel on every host
+        :param channel: Channel name
+        :param message: Message string
+        """
+        self._client.publish(channel, message)
+
+    def _channel_added(self, channel):
+        self._pubsub.subscribe(**{channel: self._handle})
+        if self._thread is None:
+            self._thread = self._pubsub.run_in_thread(sleep_time=self._sleep_time, daemon=True)
+
+    def _channel_removed(self, channel):
+        self._pubsub.unsubscribe(channel)
+
+    def close(self):
+        """Stops listening and closes the subscription connection"""
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+        self._pubsub.close()
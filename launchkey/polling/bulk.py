@@ -0,0 +1,99 @@
+from launchkey.exceptions import RateLimited
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import sleep, time
+import threading
+
+
+class TokenBucket(object):
+    """
+    Limits the rate at which requests are made by many threads. Tokens accumulate at the given rate up to the burst
+    size, and each request takes one, waiting for it if none is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: Requests per second
+        :param burst: Maximum number of requests made at once after a pause. Defaults to the rate, or 1.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, waiting until one is available"""
+        with self._lock:
+            now = time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait_time > 0:
+            sleep(wait_time)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for a number of seconds, such as after the API reported that requests are being rate
+        limited
+        :param seconds: Number of seconds
+        """
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def run_bulk(function, items, max_workers=8, rate=None, max_retries=3, retry_delay=1.0):
+    """
+    Calls a function for every item of an iterable with a pool of threads, yielding the results as they complete.
+    Items are read from the iterable as workers become available, so that memory does not grow with its length.
+    :param function: Callable receiving an item
+    :param items: Iterable of items, which may be a generator of any length
+    :param max_workers: Maximum number of calls performed at once
+    :param rate: Maximum number of calls per second, or None not to limit it
+    :param max_retries: Number of times a call raising launchkey.exceptions.RateLimited is retried
+    :param retry_delay: Seconds to wait before the first retry of a rate limited call. It doubles with every retry, and
+    every call waits for it when a rate is set.
+    :return: Generator of tuples of an item and the value returned by the function or the exception it raised
+    """
+    bucket = TokenBucket(rate) if rate else None
+
+    def call(item):
+        for attempt in range(max_retries + 1):
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                return function(item)
+            except RateLimited:
+                if attempt == max_retries:
+                    raise
+                delay = retry_delay * 2 ** attempt
+                if bucket is not None:
+                    bucket.pause(delay)
+                else:
+                    sleep(delay)
+
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {}
+    try:
+        exhausted = False
+        while True:
+            # Twice as many calls as workers are queued, so that workers never wait for the consumer
+            while not exhausted and len(pending) < 2 * max_workers:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(call, item)] = item
+            if not pending:
+                return
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                exception = future.exception()
+                yield item, exception if exception is not None else future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
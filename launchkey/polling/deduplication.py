@@ -0,0 +1,83 @@
+from concurrent.futures import Future
+from collections import OrderedDict
+from hashlib import sha256
+from time import time
+import json
+import six
+import threading
+
+
+class AuthorizationDeduplicator(object):
+    """
+    Makes launchkey.clients.ServiceClient.authorize return the authorization request already created for the same user,
+    context, and policy within a short window instead of creating another one, so that double clicks and retries do not
+    send the user duplicate pushes. Calls made while the first one is still in progress wait for its result.
+    """
+
+    def __init__(self, ttl=10, max_entries=10000):
+        """
+        :param ttl: Seconds during which a created authorization request is returned again
+        :param max_entries: Maximum number of authorization requests remembered. The oldest are forgotten first.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Key to a tuple of the expiration time, or None while the request is being created, and a future of its id
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(user, context=None, policy=None):
+        """
+        :param user: LaunchKey Username, User Push ID, or Directory User ID for the End User
+        :param context: Context string of the authorization request
+        :param policy: Policy dictionary returned by launchkey.entities.service.AuthPolicy.get_policy
+        :return: String identifying the requests which are duplicates of each other
+        """
+        return sha256(json.dumps([user, context, policy], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def authorize(self, key, create):
+        """
+        Returns the authorization request remembered for a key, or creates it
+        :param key: Fingerprint of the request
+        :param create: Callable creating the authorization request and returning its id
+        :raise: The exception raised by create, for the call which made it and the calls waiting for it
+        :return: String - Unique identifier of the authorization request
+        """
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                future = entry[1]
+                creating = False
+            else:
+                future = Future()
+                self._entries.pop(key, None)
+                self._entries[key] = None, future
+                self._prune(now)
+                creating = True
+        if not creating:
+            return future.result()
+        try:
+            auth_request = create()
+        except Exception as e:
+            with self._lock:
+                if self._entries.get(key, (None, None))[1] is future:
+                    del self._entries[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if self._entries.get(key, (None, None))[1] is future:
+                self._entries[key] = time() + self.ttl, future
+        future.set_result(auth_request)
+        return auth_request
+
+    def _prune(self, now):
+        """Forgets expired requests and the oldest ones beyond max_entries. It must be called holding the lock."""
+        while self._entries:
+            key, (expires, future) = next(six.iteritems(self._entries))
+            if len(self._entries) <= self.max_entries and (expires is None or expires > now):
+                return
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,225 @@
+from launchkey import AUTHORIZATION_REQUEST_TTL
+from launchkey.exceptions import RequestTimedOut, RateLimited, DaemonConnectionError
+from .schedules import BackoffSchedule
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.exceptions import RequestException
+from time import time
+import heapq
+import itertools
+import threading
+
+
+class _PendingAuthorization(object):
+    """An authorization request being polled"""
+
+    __slots__ = ("auth_request_id", "future", "started", "attempts", "unanswered")
+
+    def __init__(self, auth_request_id, future, started):
+        self.auth_request_id = auth_request_id
+        self.future = future
+        self.started = started
+        self.attempts = 0
+        # Seconds after its creation at which the request was last seen unanswered
+        self.unanswered = 0
+
+
+class AuthorizationPoller(object):
+    """
+    Polls launchkey.clients.ServiceClient.get_authorization_response for many pending authorization requests with a
+    single scheduler thread. Polls are ordered in a heap by due time and performed by a small pool of threads. Each
+    request is polled according to a schedule until the user responds, the API reports an error, or the request reaches
+    the authorization request timeout, after which the API would only report launchkey.exceptions.RequestTimedOut.
+
+    Results are returned as concurrent.futures.Future objects resolved with the
+    launchkey.entities.service.AuthorizationResponse.
+    """
+
+    # Errors after which a poll is retried following the schedule, as the request may still be answered
+    _TRANSIENT_ERRORS = (RateLimited, RequestException, DaemonConnectionError)
+
+    def __init__(self, service_client, schedule=None, max_workers=4, timeout=AUTHORIZATION_REQUEST_TTL):
+        """
+        :param service_client: launchkey.clients.ServiceClient, or any client with a get_authorization_response method
+        :param schedule: Schedule deciding the delay before each poll. Defaults to a
+        launchkey.polling.BackoffSchedule.
+        :param max_workers: Maximum number of polls performed at once
+        :param timeout: Seconds after its creation at which a request which has not been answered is given up on
+        """
+        self._client = service_client
+        self._schedule = schedule if schedule is not None else BackoffSchedule()
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._heap = []
+        self._pending = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def poll(self, auth_request_id, callback=None, started=None, delay=None):
+        """
+        Starts polling for the response to an authorization request. Polling the same request again returns the same
+        future.
+        :param auth_request_id: Unique identifier returned by launchkey.clients.ServiceClient.authorize
+        :param callback: Callable receiving the future once it is resolved
+        :param started: Unix timestamp at which the request was created. Defaults to now.
+        :param delay: Seconds to wait before the first poll instead of following the schedule, such as to give a
+        webhook the chance to resolve the future with resolve() first
+        :raise: RuntimeError - The poller is closed
+        :return: concurrent.futures.Future resolved with the launchkey.entities.service.AuthorizationResponse, or with
+        launchkey.exceptions.RequestTimedOut if the user did not respond in time. Cancelling it stops the polling.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The poller is closed")
+            pending = self._pending.get(auth_request_id)
+            if pending is None:
+                now = time()
+                pending = self._pending[auth_request_id] = _PendingAuthorization(
+                    auth_request_id, Future(), now if started is None else started)
+                self._schedule_poll(pending, now, delay)
+                self._start()
+        if callback is not None:
+            pending.future.add_done_callback(callback)
+        return pending.future
+
+    def resolve(self, auth_request_id, response):
+        """
+        Resolves the future of a request being polled with a response received otherwise, such as by a webhook, and
+        stops polling it
+        :param auth_request_id: Unique identifier of the authorization request
+        :param response: launchkey.entities.service.AuthorizationResponse
+        :return: Boolean - Whether the request was being polled
+        """
+        with self._condition:
+            pending = self._pending.get(auth_request_id)
+        if pending is None or not self._resolve(pending, result=response):
+            return False
+        self._record_response_time(time() - pending.started)
+        return True
+
+    def close(self, wait=True):
+        """
+        Stops polling and cancels the futures of the requests which were not resolved
+        :param wait: Whether to wait for the polls in progress to complete
+        """
+        with self._condition:
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._heap = []
+            self._condition.notify_all()
+        for entry in pending:
+            entry.future.cancel()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait)
+
+    def _start(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+            self._thread = threading.Thread(target=self._run, name="launchkey-authorization-poller")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _schedule_poll(self, pending, now, delay=None):
+        """Pushes the next poll of a request on the heap. It must be called while holding the condition."""
+        if delay is None:
+            delay = self._schedule.next_delay(pending.attempts, now - pending.started)
+        due = min(now + delay, pending.started + self._timeout)
+        heapq.heappush(self._heap, (due, next(self._counter), pending))
+        if self._heap[0][2] is pending:
+            self._condition.notify()
+
+    def _next_due(self):
+        """Waits for the next poll to be due and returns its request, or None once the poller is closed"""
+        with self._condition:
+            while not self._closed:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                wait = self._heap[0][0] - time()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                return heapq.heappop(self._heap)[2]
+        return None
+
+    def _run(self):
+        while True:
+            pending = self._next_due()
+            if pending is None:
+                return
+            if pending.future.cancelled():
+                self._forget(pending)
+            elif self._pending.get(pending.auth_request_id) is pending:
+                self._executor.submit(self._poll, pending)
+
+    def _poll(self, pending):
+        polled = time()
+        try:
+            response = self._client.get_authorization_response(pending.auth_request_id)
+        except self._TRANSIENT_ERRORS as e:
+            self._retry(pending, e)
+        except Exception as e:
+            self._resolve(pending, exception=e)
+        else:
+            if response is not None:
+                if self._resolve(pending, result=response):
+                    # The user responded between the last poll which found no response and this one
+                    self._record_response_time((pending.unanswered + polled - pending.started) / 2.0)
+            else:
+                pending.unanswered = polled - pending.started
+                self._retry(pending, RequestTimedOut("The authorization request was not responded to before the "
+                                                     "timeout period", 408))
+
+    def _record_response_time(self, elapsed):
+        """Reports a response time to schedules learning from them"""
+        record = getattr(self._schedule, "record", None)
+        if record is not None:
+            record(elapsed)
+
+    def _retry(self, pending, exception):
+        """Schedules the next poll of a request, or resolves it with the exception once it reached the timeout"""
+        now = time()
+        if now >= pending.started + self._timeout:
+            self._resolve(pending, exception=exception)
+            return
+        with self._condition:
+            pending.attempts += 1
+            if self._pending.get(pending.auth_request_id) is not pending:
+                # Resolved by a webhook or cancelled by close() while it was being polled
+                return
+            if not self._closed and not pending.future.cancelled():
+                self._schedule_poll(pending, now)
+                return
+        self._forget(pending)
+
+    def _forget(self, pending):
+        with self._condition:
+            if self._pending.get(pending.auth_request_id) is pending:
+                del self._pending[pending.auth_request_id]
+
+    def _resolve(self, pending, result=None, exception=None):
+        """Resolves the future of a request unless it was resolved already, by a webhook or a concurrent poll"""
+        with self._condition:
+            if self._pending.get(pending.auth_request_id) is not pending:
+                return False
+            del self._pending[pending.auth_request_id]
+        if pending.future.set_running_or_notify_cancel():
+            if exception is not None:
+                pending.future.set_exception(exception)
+            else:
+                pending.future.set_result(result)
+        return True
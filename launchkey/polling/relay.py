@@ -0,0 +1,75 @@
+from .serialization import dump_response, load_response
+from hashlib import sha256
+import hmac
+import json
+import six
+
+
+class AuthorizationRelay(object):
+    """
+    Relays the authorization responses received by launchkey.clients.ServiceClient.handle_webhook on any node to the
+    nodes waiting for them, through a broker such as launchkey.polling.InMemoryBroker, UnixSocketBroker, or
+    RedisBroker. Each authorization request has its own channel.
+
+    Responses are relayed decrypted, so every message is authenticated with an HMAC keyed by a secret shared by the
+    nodes, and messages which fail authentication are ignored. Anyone able to publish on the broker would otherwise be
+    able to approve authorization requests.
+    """
+
+    channel_prefix = "launchkey:authorization:"
+
+    def __init__(self, broker, secret):
+        """
+        :param broker: Broker with the publish, subscribe, and unsubscribe methods of launchkey.polling.InMemoryBroker
+        :param secret: Secret string shared by every node relaying responses
+        """
+        if not secret:
+            raise ValueError("A secret is required to authenticate the relayed responses")
+        self.broker = broker
+        self._secret = secret.encode("utf-8") if isinstance(secret, six.text_type) else secret
+
+    def _mac(self, channel, payload):
+        return hmac.new(self._secret, ("%s\n%s" % (channel, payload)).encode("utf-8"), sha256).hexdigest()
+
+    def _encode(self, channel, response):
+        payload = json.dumps(dump_response(response), sort_keys=True)
+        return json.dumps({"response": payload, "mac": self._mac(channel, payload)})
+
+    def _decode(self, channel, message):
+        """
+        :return: launchkey.entities.service.AuthorizationResponse or None if the message is not authentic
+        """
+        try:
+            envelope = json.loads(message)
+            payload = envelope["response"]
+            if not hmac.compare_digest(str(envelope["mac"]), self._mac(channel, payload)):
+                return None
+            data = json.loads(payload)
+        except (ValueError, KeyError, TypeError):
+            return None
+        return load_response(data)
+
+    def publish(self, response):
+        """
+        Relays a response to the nodes waiting for it
+        :param response: launchkey.entities.service.AuthorizationResponse
+        """
+        channel = self.channel_prefix + response.authorization_request_id
+        self.broker.publish(channel, self._encode(channel, response))
+
+    def subscribe(self, auth_request_id, callback):
+        """
+        Calls callback with the response to an authorization request once it is relayed
+        :param auth_request_id: Unique identifier of the authorization request
+        :param callback: Callable receiving the launchkey.entities.service.AuthorizationResponse
+        :return: Callable ending the subscription
+        """
+        channel = self.channel_prefix + auth_request_id
+
+        def receive(message):
+            response = self._decode(channel, message)
+            if response is not None:
+                callback(response)
+
+        self.broker.subscribe(channel, receive)
+        return lambda: self.broker.unsubscribe(channel, receive)
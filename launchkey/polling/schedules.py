@@ -0,0 +1,141 @@
+import math
+import random
+import six
+import threading
+
+
+class BackoffSchedule(object):
+    """
+    Polling schedule for launchkey.polling.AuthorizationPoller which polls soon after an authorization request is
+    created, then less and less often, as the longer a user has not responded the less likely a response is imminent.
+    Failed polls count as attempts, so the poller backs off when the API is rate limiting it or unavailable.
+    """
+
+    # Past this many attempts the delay is max_delay anyway, and the power would overflow a float
+    _MAX_EXPONENT = 64
+
+    def __init__(self, initial_delay=2.0, multiplier=1.5, max_delay=15.0, jitter=0.1):
+        """
+        :param initial_delay: Seconds between the creation of the request and the first poll
+        :param multiplier: Factor by which the delay grows after every poll
+        :param max_delay: Maximum number of seconds between two polls
+        :param jitter: Fraction by which delays are randomly varied so that requests created together are not all
+        polled together
+        """
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def next_delay(self, attempts, elapsed):
+        """
+        :param attempts: Number of polls already performed for the request
+        :param elapsed: Seconds since the request was created
+        :return: Seconds until the next poll
+        """
+        delay = min(self.initial_delay * self.multiplier ** min(attempts, self._MAX_EXPONENT), self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class LearnedSchedule(object):
+    """
+    Polling schedule for launchkey.polling.AuthorizationPoller which learns when the users of a Service respond. The
+    poller records the response time of every authorization response in a histogram, from which the poll times
+    minimizing the expected time between a response and its detection are chosen for the allowed number of polls.
+    Polls are thereby concentrated where responses are likely. A final poll is always performed at the authorization
+    request timeout.
+
+    Until enough response times are recorded, polls follow the fallback schedule. A schedule instance should only be
+    used for a single Service, as users of different Services may respond differently.
+    """
+
+    # The poll times are chosen again once the number of recorded response times grew by this factor
+    _REPLAN_GROWTH = 1.1
+
+    def __init__(self, max_polls=6, min_samples=50, fallback=None, bucket_width=1.0, timeout=300):
+        """
+        :param max_polls: Maximum number of polls per request once the schedule is learned, including the final poll
+        at the timeout
+        :param min_samples: Number of response times to record before the learned schedule replaces the fallback
+        :param fallback: Schedule used until min_samples response times are recorded. Defaults to a BackoffSchedule.
+        :param bucket_width: Width in seconds of the histogram buckets, and so the precision of the poll times
+        :param timeout: Seconds after which requests time out. Later response times are counted in the last bucket.
+        """
+        self.max_polls = max_polls
+        self.min_samples = min_samples
+        self.fallback = fallback if fallback is not None else BackoffSchedule()
+        self.bucket_width = bucket_width
+        self.counts = [0] * max(int(math.ceil(timeout / float(bucket_width))), 1)
+        self.samples = 0
+        self._planned_samples = 0
+        # Poll times once learned. None until then, while an empty plan leaves only the final poll.
+        self._plan = None
+        self._lock = threading.Lock()
+
+    def record(self, elapsed):
+        """
+        Records the response time of an authorization request, and chooses the poll times again when enough new
+        response times were recorded
+        :param elapsed: Seconds between the creation of the request and the user's response
+        """
+        bucket = min(max(int(elapsed / self.bucket_width), 0), len(self.counts) - 1)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.samples += 1
+            if self.samples < max(self.min_samples, self._planned_samples * self._REPLAN_GROWTH):
+                return
+            self._planned_samples = self.samples
+            counts = list(self.counts)
+        self._plan = self._plan_offsets(counts)
+
+    def _plan_offsets(self, counts):
+        """
+        Chooses the poll times with dynamic programming over the histogram. A poll at the end of a bucket detects the
+        responses of the buckets since the previous poll, which on average arrived in the middle of their bucket, so
+        polls are only ever placed at the end of a non-empty bucket.
+        :param counts: Number of responses in each bucket
+        :return: Sorted list of seconds after the creation of a request at which to poll
+        """
+        width = self.bucket_width
+        responses, times = [0], [0.0]
+        for bucket, count in enumerate(counts):
+            responses.append(responses[-1] + count)
+            times.append(times[-1] + count * (bucket + 0.5) * width)
+        candidates = [bucket + 1 for bucket, count in enumerate(counts) if count]
+        # Minimal total detection delay of the responses before each poll, and the polls achieving it
+        best = {0: (0.0, ())}
+        for _ in range(min(self.max_polls - 1, len(candidates))):
+            layer = {}
+            for end in candidates:
+                choices = [(cost + (responses[end] - responses[start]) * end * width - (times[end] - times[start]),
+                            polls) for start, (cost, polls) in six.iteritems(best) if start < end]
+                if choices:
+                    cost, polls = min(choices)
+                    layer[end] = cost, polls + (end,)
+            best = layer
+        last = len(counts)
+        cost, polls = min((cost + (responses[last] - responses[end]) * last * width - (times[last] - times[end]),
+                           polls) for end, (cost, polls) in six.iteritems(best))
+        return [end * width for end in polls]
+
+    def poll_offsets(self):
+        """
+        :return: Sorted list of the seconds after the creation of a request at which it is polled, excluding the final
+        poll at the timeout. It is empty until min_samples response times are recorded.
+        """
+        return self._plan or []
+
+    def next_delay(self, attempts, elapsed):
+        """
+        :param attempts: Number of polls already performed for the request
+        :param elapsed: Seconds since the request was created
+        :return: Seconds until the next poll. It is infinite when the only poll left is the one at the timeout.
+        """
+        plan = self._plan
+        if plan is None:
+            return self.fallback.next_delay(attempts, elapsed)
+        if attempts < self.max_polls - 1:
+            for offset in plan:
+                if offset > elapsed:
+                    return offset - elapsed
+        return float("inf")
@@ -0,0 +1,47 @@
+from launchkey.entities.service import AuthorizationResponse
+from launchkey.exceptions import RequestTimedOut
+
+# Attributes of launchkey.entities.service.AuthorizationResponse, which are all JSON serializable once decrypted
+RESPONSE_FIELDS = ("authorization_request_id", "authorized", "device_id", "service_pins", "service_user_hash",
+                   "organization_user_hash", "user_push_id")
+
+
+def dump_response(response):
+    """
+    :param response: launchkey.entities.service.AuthorizationResponse
+    :return: Dictionary of the decrypted response's attributes
+    """
+    return dict((field, getattr(response, field, None)) for field in RESPONSE_FIELDS)
+
+
+def load_response(data):
+    """
+    Builds a response from the attributes returned by dump_response, without decrypting it again
+    :param data: Dictionary of the response's attributes
+    :return: launchkey.entities.service.AuthorizationResponse
+    """
+    response = AuthorizationResponse.__new__(AuthorizationResponse)
+    for field in RESPONSE_FIELDS:
+        setattr(response, field, data.get(field))
+    return response
+
+
+def dump_result(result):
+    """
+    :param result: launchkey.entities.service.AuthorizationResponse, or launchkey.exceptions.RequestTimedOut when the
+    user did not respond in time
+    :return: JSON serializable dictionary
+    """
+    if isinstance(result, RequestTimedOut):
+        return {"timed_out": True}
+    return {"response": dump_response(result)}
+
+
+def load_result(data):
+    """
+    :param data: Dictionary returned by dump_result
+    :return: launchkey.entities.service.AuthorizationResponse or launchkey.exceptions.RequestTimedOut
+    """
+    if data.get("timed_out"):
+        return RequestTimedOut("The authorization request was not responded to before the timeout period", 408)
+    return load_response(data["response"])
@@ -0,0 +1,393 @@
+from launchkey import AUTHORIZATION_REQUEST_TTL
+from launchkey.transports.replay import _ShardLock
+from launchkey.utils import ForkDetector
+from .serialization import dump_result, load_result
+from collections import OrderedDict
+from hashlib import sha256
+from time import time
+from uuid import uuid4
+import json
+import mmap
+import os
+import six
+import sqlite3
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class _AuthorizationStore(object):
+    """
+    Base for the stores sharing the state of authorization requests between the workers of a Service, used by
+    launchkey.clients.ServiceClient.get_authorization_response.
+
+    Terminal results, a launchkey.entities.service.AuthorizationResponse or launchkey.exceptions.RequestTimedOut, are
+    stored once and never change, so they are also kept in memory and later lookups for the same request do not read
+    the backend again. While a request is pending, a single worker holds a lease on it and is the only one polling the
+    API. The lease is renewed every time its holder polls, and expires when it stops, such as when its user left the
+    page or the process died, so that another worker takes over.
+    """
+
+    # Maximum number of terminal results kept in memory by each instance
+    _MAX_LOCAL_RESULTS = 1024
+
+    def __init__(self, ttl=2 * AUTHORIZATION_REQUEST_TTL, lease=30):
+        """
+        :param ttl: Seconds for which a terminal result is kept
+        :param lease: Seconds during which the worker which last polled a pending request is the only one polling it
+        """
+        self.ttl = ttl
+        self.lease = lease
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+        self._new_owner()
+
+    def _new_owner(self):
+        self._owner = "%d:%s" % (os.getpid(), uuid4().hex)
+        self._fork_detector = ForkDetector()
+
+    @property
+    def owner(self):
+        """
+        Identifier of this worker in the leases. A forked process is a different worker than its parent. The threads of
+        a process using the same store are the same worker, so any of them may poll a request leased by the process.
+        """
+        if self._fork_detector.forked():
+            self._new_owner()
+        return self._owner
+
+    def get(self, auth_request_id):
+        """
+        :param auth_request_id: Unique identifier of the authorization request
+        :return: launchkey.entities.service.AuthorizationResponse or launchkey.exceptions.RequestTimedOut, or None
+        while the request is pending
+        """
+        now = time()
+        local = self._local.get(auth_request_id)
+        if local is not None and local[0] > now:
+            return load_result(local[1])
+        state = self._load(auth_request_id, now)
+        if state is None:
+            return None
+        self._remember(auth_request_id, state[0], state[1])
+        return load_result(state[1])
+
+    def set(self, auth_request_id, result):
+        """
+        Stores the terminal result of a request. A result stored first, such as by a webhook, is kept.
+        :param auth_request_id: Unique identifier of the authorization request
+        :param result: launchkey.entities.service.AuthorizationResponse or launchkey.exceptions.RequestTimedOut
+        """
+        now = time()
+        expires = now + self.ttl
+        data = dump_result(result)
+        self._store(auth_request_id, data, now, expires)
+        self._remember(auth_request_id, expires, data)
+
+    def claim(self, auth_request_id):
+        """
+        Takes or renews the lease allowing this worker to poll a pending request
+        :param auth_request_id: Unique identifier of the authorization request
+        :return: Boolean - Whether this worker may poll the request. It is False when another worker holds the lease
+        or the result is already stored.
+        """
+        now = time()
+        return self._claim(auth_request_id, self.owner, now, now + self.lease)
+
+    def _remember(self, auth_request_id, expires, data):
+        with self._local_lock:
+            self._local[auth_request_id] = expires, data
+            while len(self._local) > self._MAX_LOCAL_RESULTS:
+                self._local.popitem(last=False)
+
+    def _load(self, auth_request_id, now):
+        """
+        :return: Tuple of the expiration time and result data of the request, or None if it is pending
+        """
+        raise NotImplementedError
+
+    def _store(self, auth_request_id, data, now, expires):
+        raise NotImplementedError
+
+    def _claim(self, auth_request_id, owner, now, lease_expires):
+        raise NotImplementedError
+
+
+class InMemoryAuthorizationStore(_AuthorizationStore):
+    """
+    Authorization store shared by the threads of the current process only. Each thread is a different worker holding
+    its own leases.
+    """
+
+    def __init__(self, ttl=2 * AUTHORIZATION_REQUEST_TTL, lease=30):
+        """
+        :param ttl: Seconds for which a terminal result is kept
+        :param lease: Seconds during which the worker which last polled a pending request is the only one polling it
+        """
+        super(InMemoryAuthorizationStore, self).__init__(ttl, lease)
+        # Request id to a list of the expiration time, the result data or None, and the lease owner, in the order they
+        # were last written
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def owner(self):
+        """Identifier of this worker in the leases. The threads sharing the store are different workers."""
+        return "%s:%d" % (super(InMemoryAuthorizationStore, self).owner, threading.current_thread().ident)
+
+    def _put(self, auth_request_id, entry):
+        """Writes an entry and moves it to the end of the entries. It must be called holding the lock."""
+        self._entries.pop(auth_request_id, None)
+        self._entries[auth_request_id] = entry
+
+    def _prune(self, now):
+        """
+        Forgets the expired entries. Entries are ordered by the time they were written, so only the oldest are checked.
+        Leases and results live for different times, so an expired entry may be kept behind an older one which has not
+        expired yet, for at most the longer of the two. It must be called holding the lock.
+        """
+        while self._entries:
+            auth_request_id, entry = next(six.iteritems(self._entries))
+            if entry[0] > now:
+                return
+            del self._entries[auth_request_id]
+
+    def _load(self, auth_request_id, now):
+        entry = self._entries.get(auth_request_id)
+        if entry is None or entry[1] is None or entry[0] <= now:
+            return None
+        return entry[0], entry[1]
+
+    def _store(self, auth_request_id, data, now, expires):
+        with self._lock:
+            entry = self._entries.get(auth_request_id)
+            if entry is None or entry[1] is None or entry[0] <= now:
+                self._prune(now)
+                self._put(auth_request_id, [expires, data, None])
+
+    def _claim(self, auth_request_id, owner, now, lease_expires):
+        with self._lock:
+            entry = self._entries.get(auth_request_id)
+            if entry is not None and entry[0] > now and (entry[1] is not None or entry[2] != owner):
+                return False
+            self._prune(now)
+            self._put(auth_request_id, [lease_expires, None, owner])
+            return True
+
+
+class SQLiteAuthorizationStore(_AuthorizationStore):
+    """
+    Authorization store shared by the processes of a host, or of several hosts on a shared file system supporting
+    SQLite locking, through an SQLite database
+    """
+
+    def __init__(self, path, ttl=2 * AUTHORIZATION_REQUEST_TTL, lease=30, timeout=5.0):
+        """
+        :param path: Path of the database file. It is created with mode 0600 if it does not exist.
+        :param ttl: Seconds for which a terminal result is kept
+        :param lease: Seconds during which the worker which last polled a pending request is the only one polling it
+        :param timeout: Seconds to wait for another process to release the database lock
+        """
+        super(SQLiteAuthorizationStore, self).__init__(ttl, lease)
+        self.path = path
+        self.timeout = timeout
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        self._connect()
+        with self._lock:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS authorizations (auth_request_id TEXT PRIMARY KEY, "
+                                     "expires REAL NOT NULL, result TEXT, owner TEXT)")
+
+    def __getstate__(self):
+        return {"path": self.path, "ttl": self.ttl, "lease": self.lease, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["ttl"], state["lease"], state["timeout"])
+
+    def _connect(self):
+        # Transactions are begun explicitly, so that the lease check and update happen under one write lock
+        self._connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection_detector = ForkDetector()
+
+    def _check_fork(self):
+        # SQLite connections must not be used across a fork
+        if self._connection_detector.forked():
+            self._connect()
+
+    def close(self):
+        """Closes the database connection"""
+        self._connection.close()
+
+    def _load(self, auth_request_id, now):
+        self._check_fork()
+        with self._lock:
+            row = self._connection.execute("SELECT expires, result FROM authorizations WHERE auth_request_id = ? AND "
+                                           "result IS NOT NULL AND expires > ?", (auth_request_id, now)).fetchone()
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def _write(self, auth_request_id, now, allowed, values):
+        """
+        Replaces the row of a request within a write transaction if allowed returns True for its current row, and
+        removes the expired rows when adding one
+        """
+        self._check_fork()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute("SELECT expires, result, owner FROM authorizations "
+                                               "WHERE auth_request_id = ?", (auth_request_id,)).fetchone()
+                if row is not None and row[0] > now and not allowed(row):
+                    self._connection.execute("ROLLBACK")
+                    return False
+                if row is None:
+                    self._connection.execute("DELETE FROM authorizations WHERE expires <= ?", (now,))
+                self._connection.execute("INSERT OR REPLACE INTO authorizations VALUES (?, ?, ?, ?)",
+                                         (auth_request_id,) + values)
+                self._connection.execute("COMMIT")
+                return True
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _store(self, auth_request_id, data, now, expires):
+        self._write(auth_request_id, now, lambda row: row[1] is None, (expires, json.dumps(data), None))
+
+    def _claim(self, auth_request_id, owner, now, lease_expires):
+        return self._write(auth_request_id, now, lambda row: row[1] is None and row[2] == owner,
+                           (lease_expires, None, owner))
+
+
+class SharedMemoryAuthorizationStore(_AuthorizationStore):
+    """
+    Authorization store shared by the processes of a host through a memory mapped file of fixed size records, so that
+    every operation reads or writes a single record whatever the number of requests stored.
+
+    The file holds a fixed number of slots split in shards, each with a digest of a request id, the time its lease or
+    result expires, a digest of the lease owner, and the result. A request is stored in one of a few slots of its
+    shard, replacing an expired one or, when none is, the one expiring first. Each shard is locked separately, with a
+    thread lock and a lock on its range of the file. Results larger than a record are not shared, and every worker
+    then polls for them once the lease expired.
+    """
+
+    _HEADER = struct.Struct("=16sd16sH")
+    _PROBES = 8
+
+    def __init__(self, path, slots=4096, record_size=512, shards=64, ttl=2 * AUTHORIZATION_REQUEST_TTL, lease=30):
+        """
+        :param path: Path of the file backing the slots. It is created with mode 0600 if it does not exist. Every
+        process sharing the store must use the same path, number of slots, record size, and number of shards.
+        :param slots: Maximum number of requests pending or with a result at once
+        :param record_size: Size of a slot in bytes. Results serialize to roughly 300 bytes.
+        :param shards: Number of shards
+        :param ttl: Seconds for which a terminal result is kept
+        :param lease: Seconds during which the worker which last polled a pending request is the only one polling it
+        """
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryAuthorizationStore requires a platform supporting fcntl")
+        super(SharedMemoryAuthorizationStore, self).__init__(ttl, lease)
+        self.path = path
+        self.slots = slots
+        self.record_size = record_size
+        self.shards = shards
+        self._shard_slots = max(slots // shards, self._PROBES)
+        self._size = self._shard_slots * shards * record_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self._size:
+                os.ftruncate(self._fd, self._size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._mmap = mmap.mmap(self._fd, self._size)
+        self._thread_locks = [threading.Lock() for _ in range(shards)]
+        self._lock_fork_detector = ForkDetector()
+
+    def __getstate__(self):
+        return {"path": self.path, "slots": self.slots, "record_size": self.record_size, "shards": self.shards,
+                "ttl": self.ttl, "lease": self.lease}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["slots"], state["record_size"], state["shards"], state["ttl"],
+                      state["lease"])
+
+    def close(self):
+        """Unmaps the slots and closes the file"""
+        self._mmap.close()
+        os.close(self._fd)
+
+    @staticmethod
+    def _digest(value):
+        return sha256(value.encode("utf-8")).digest()[:16]
+
+    def _locate(self, auth_request_id):
+        """Returns the digest of a request id, its shard, and the first slot it may be stored in"""
+        digest = self._digest(auth_request_id)
+        position = struct.unpack_from("=Q", digest)[0]
+        shard = position % self.shards
+        return digest, shard, shard * self._shard_slots + (position // self.shards) % self._shard_slots
+
+    def _locked(self, shard):
+        if self._lock_fork_detector.forked():
+            # Thread locks held by other threads of the parent would never be released. File locks are not inherited.
+            self._thread_locks = [threading.Lock() for _ in range(self.shards)]
+        return _ShardLock(self._thread_locks[shard], self._fd, shard * self._shard_slots * self.record_size,
+                          self._shard_slots * self.record_size)
+
+    def _find(self, digest, shard, first, now):
+        """
+        Looks for the unexpired record of a request. It must be called holding the lock of the shard.
+        :return: Tuple of the slot holding the record, or None and the slot to store it in, and the record's header
+        """
+        start = shard * self._shard_slots
+        free, free_expires = None, None
+        for probe in range(self._PROBES):
+            slot = start + (first - start + probe) % self._shard_slots
+            header = self._HEADER.unpack_from(self._mmap, slot * self.record_size)
+            if header[1] > now and header[0] == digest:
+                return slot, header
+            # Empty and expired slots expire first, so they are replaced before any other
+            if free is None or header[1] < free_expires:
+                free, free_expires = slot, header[1]
+        return free, None
+
+    def _load(self, auth_request_id, now):
+        digest, shard, first = self._locate(auth_request_id)
+        with self._locked(shard):
+            slot, header = self._find(digest, shard, first, now)
+            if header is None or not header[3]:
+                return None
+            offset = slot * self.record_size + self._HEADER.size
+            payload = self._mmap[offset:offset + header[3]]
+        return header[1], json.loads(payload.decode("utf-8"))
+
+    def _write(self, auth_request_id, now, allowed, expires, owner, data):
+        """
+        Replaces the record of a request if allowed returns True for the header of its current record
+        :return: Boolean - Whether the record was allowed to be replaced. A result larger than a record is allowed but
+        not stored.
+        """
+        payload = b"" if data is None else json.dumps(data, separators=(",", ":")).encode("utf-8")
+        digest, shard, first = self._locate(auth_request_id)
+        with self._locked(shard):
+            slot, header = self._find(digest, shard, first, now)
+            if header is not None and not allowed(header):
+                return False
+            if self._HEADER.size + len(payload) > self.record_size:
+                return True
+            offset = slot * self.record_size
+            self._HEADER.pack_into(self._mmap, offset, digest, expires, owner, len(payload))
+            self._mmap[offset + self._HEADER.size:offset + self._HEADER.size + len(payload)] = payload
+            return True
+
+    def _store(self, auth_request_id, data, now, expires):
+        self._write(auth_request_id, now, lambda header: not header[3], expires, b"\0" * 16, data)
+
+    def _claim(self, auth_request_id, owner, now, lease_expires):
+        owner_digest = self._digest(owner)
+        return self._write(auth_request_id, now, lambda header: not header[3] and header[2] == owner_digest,
+                           lease_expires, owner_digest, None)
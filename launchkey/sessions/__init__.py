@@ -0,0 +1,2 @@
+from .dispatcher import SessionDispatcher
+from .registry import SessionRegistry, RegisteredSession
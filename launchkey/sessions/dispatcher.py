@@ -0,0 +1,335 @@
+from launchkey.exceptions import RateLimited, DaemonConnectionError
+from requests.exceptions import RequestException
+from collections import OrderedDict
+from time import sleep, time
+import itertools
+import json
+import os
+import threading
+
+
+class _SessionOperation(object):
+    """A session_start or session_end call waiting to be made"""
+
+    __slots__ = ("operation_id", "method", "user", "auth_request_id")
+
+    def __init__(self, operation_id, method, user, auth_request_id=None):
+        self.operation_id = operation_id
+        self.method = method
+        self.user = user
+        self.auth_request_id = auth_request_id
+
+    def to_record(self):
+        return {"id": self.operation_id, "op": self.method, "user": self.user, "auth": self.auth_request_id}
+
+
+class SessionDispatcher(object):
+    """
+    Makes launchkey.clients.ServiceClient.session_start and session_end calls in the background, so that they leave the
+    login and logout request paths. Calls are accepted in constant time and made by a bounded pool of threads.
+
+    Calls for the same user are made in order, one at a time, and those not made yet are coalesced: a session_end
+    supersedes the calls before it, and a session_start supersedes a previous session_start. A user who logs in and out
+    before the calls are made therefore only costs a session_end.
+
+    With a journal, every accepted call is appended to a file before it is acknowledged, and calls which were not made
+    when the process stopped are made when a dispatcher is created with the same journal. A journal belongs to a single
+    dispatcher: processes sharing a journal path would replace each other's records and lose calls, so each process
+    must be given its own path.
+    """
+
+    # Errors after which a call is retried, as it may succeed later
+    _TRANSIENT_ERRORS = (RateLimited, RequestException, DaemonConnectionError)
+
+    # Number of journal records after which the journal is rewritten with only the calls not made yet
+    _COMPACT_RECORDS = 10000
+
+    def __init__(self, service_client, max_workers=4, journal_path=None, fsync=False, max_retries=3, retry_delay=1.0,
+                 on_error=None):
+        """
+        :param service_client: launchkey.clients.ServiceClient making the calls
+        :param max_workers: Maximum number of calls made at once
+        :param journal_path: Path of a file journaling the accepted calls, or None not to journal them. It is created
+        with mode 0600, and must not be used by any other dispatcher, including one in another process.
+        :param fsync: Whether every journal write is synced to disk, so that calls survive a power loss and not only a
+        crash of the process, at the cost of a disk sync on every accepted call
+        :param max_retries: Number of times a call failing with a transient error is retried
+        :param retry_delay: Seconds to wait before the first retry of a call. It doubles with every retry.
+        :param on_error: Callable receiving the user, the method name, and the exception of a call which failed for
+        good. Failed calls are otherwise dropped.
+        """
+        self._client = service_client
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.on_error = on_error
+        self.journal_path = journal_path
+        self.fsync = fsync
+        # Users with calls waiting, in the order they were accepted, to the list of their calls
+        self._waiting = OrderedDict()
+        # Users whose calls are being made, to the list of those calls
+        self._in_flight = {}
+        self._condition = threading.Condition()
+        # Serializes the journal writes, so that they are made without holding the condition. It is acquired before
+        # the condition when both are held.
+        self._journal_lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._closed = False
+        self._journal = None
+        self._journal_records = 0
+        # Records appended while the journal is being compacted, to add to the compacted journal, or None
+        self._compaction = None
+        if journal_path is not None:
+            self._open_journal()
+        self._threads = []
+        for _ in range(max_workers):
+            thread = threading.Thread(target=self._run, name="launchkey-session-dispatcher")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __len__(self):
+        """Number of calls waiting or being made"""
+        with self._condition:
+            return sum(len(calls) for calls in self._waiting.values()) + \
+                sum(len(calls) for calls in self._in_flight.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def session_start(self, user, authorization_request_id):
+        """
+        Accepts a launchkey.clients.ServiceClient.session_start call
+        :param user: LaunchKey Username, User Push ID, or Directory User ID for the End User
+        :param authorization_request_id: Unique identifier returned by authorize()
+        :raise: RuntimeError - The dispatcher is closed
+        """
+        self._accept("start", user, authorization_request_id)
+
+    def session_end(self, user):
+        """
+        Accepts a launchkey.clients.ServiceClient.session_end call
+        :param user: LaunchKey Username, User Push ID, or Directory User ID for the End User
+        :raise: RuntimeError - The dispatcher is closed
+        """
+        self._accept("end", user)
+
+    def flush(self, timeout=None):
+        """
+        Waits for the accepted calls to be made
+        :param timeout: Maximum number of seconds to wait, or None to wait until they are
+        :return: Boolean - Whether every call was made
+        """
+        deadline = None if timeout is None else time() + timeout
+        with self._condition:
+            while self._waiting or self._in_flight:
+                remaining = None if deadline is None else deadline - time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, wait=True):
+        """
+        Stops accepting calls
+        :param wait: Whether to make the accepted calls first. Otherwise the calls in progress complete in the
+        background, and every call not made yet remains in the journal to be made by the next dispatcher.
+        """
+        if wait:
+            self.flush()
+        with self._journal_lock:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+        if wait:
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    def _accept(self, method, user, auth_request_id=None):
+        with self._journal_lock:
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("The session dispatcher is closed")
+                operation = _SessionOperation(next(self._counter), method, user, auth_request_id)
+            # Holding the journal lock keeps the dispatcher open and the calls in the order they were journaled
+            self._write_journal(operation.to_record())
+            with self._condition:
+                self._add(operation)
+                self._condition.notify()
+
+    def _add(self, operation):
+        """Adds a call to the waiting calls of its user, coalescing them. It must be called holding the condition."""
+        calls = self._waiting.get(operation.user)
+        if calls is None:
+            calls = self._waiting[operation.user] = []
+        if operation.method == "end":
+            del calls[:]
+        else:
+            calls[:] = [call for call in calls if call.method != "start"]
+        calls.append(operation)
+
+    def _next_user(self):
+        """Waits for a user with waiting calls whose previous calls are made, and takes their calls"""
+        with self._condition:
+            while not self._closed:
+                # At most max_workers users are skipped, as only they can be in flight
+                for user in self._waiting:
+                    if user not in self._in_flight:
+                        calls = self._in_flight[user] = self._waiting.pop(user)
+                        return user, calls
+                self._condition.wait()
+            return None, None
+
+    def _run(self):
+        while True:
+            user, calls = self._next_user()
+            if user is None:
+                return
+            for call in calls:
+                self._call(call)
+            # The calls are journaled as made before they leave the flight, so that flush returns once they are
+            with self._journal_lock:
+                self._write_journal({"done": [call.operation_id for call in calls]})
+                with self._condition:
+                    del self._in_flight[user]
+                    self._condition.notify_all()
+            self._compact()
+
+    def _call(self, operation):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if operation.method == "start":
+                    self._client.session_start(operation.user, operation.auth_request_id)
+                else:
+                    self._client.session_end(operation.user)
+                return
+            except self._TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    self._report(operation, e)
+                    return
+                sleep(self.retry_delay * 2 ** attempt)
+            except Exception as e:
+                self._report(operation, e)
+                return
+
+    def _report(self, operation, exception):
+        if self.on_error is not None:
+            self.on_error(operation.user, "session_" + operation.method, exception)
+
+    def _open_journal(self):
+        """Replays the calls the journal holds which were not made, and opens it for appending"""
+        records = []
+        try:
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A line torn by a crash while it was being written
+                        continue
+        except (IOError, OSError):
+            pass
+        done = set()
+        for record in records:
+            done.update(record.get("done", ()))
+        # Calls are coalesced as they were when accepted, so that calls superseded by one which was made are dropped
+        for record in records:
+            if "op" in record:
+                self._add(_SessionOperation(record["id"], record["op"], record["user"], record.get("auth")))
+        for user, calls in list(self._waiting.items()):
+            calls[:] = [call for call in calls if call.operation_id not in done]
+            if not calls:
+                del self._waiting[user]
+        self._counter = itertools.count(max([0] + [record.get("id", 0) for record in records]) + 1)
+        os.rename(self._write_temporary_journal(self._pending_records()), self.journal_path)
+        self._journal = open(self.journal_path, "a")
+
+    def _pending_records(self):
+        """
+        Returns the journal records of the calls not made yet. It must be called holding the condition or before the
+        threads are started.
+        """
+        return [call.to_record() for calls in list(self._in_flight.values()) + list(self._waiting.values())
+                for call in calls]
+
+    def _write_temporary_journal(self, records):
+        """
+        Writes records to a temporary file next to the journal, to be renamed over it
+        :return: Path of the file, which is synced to disk if fsync is set
+        """
+        temporary_path = "%s.%s.tmp" % (self.journal_path, os.getpid())
+        with os.fdopen(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as journal:
+            for record in records:
+                journal.write(json.dumps(record) + "\n")
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+        return temporary_path
+
+    def _compact(self):
+        """
+        Replaces the journal with the calls not made yet once it holds more than _COMPACT_RECORDS records. It is called
+        by the threads making the calls, and the compacted journal is written without holding the journal lock, so
+        that calls are accepted meanwhile. The records appended in between are added to it before it replaces the
+        journal.
+        """
+        with self._journal_lock:
+            if self._journal is None or self._compaction is not None or \
+                    self._journal_records <= self._COMPACT_RECORDS:
+                return
+            with self._condition:
+                records = self._pending_records()
+            self._compaction = []
+        temporary_path = None
+        try:
+            temporary_path = self._write_temporary_journal(records)
+        finally:
+            with self._journal_lock:
+                appended, self._compaction = self._compaction, None
+                if temporary_path is not None and self._journal is not None:
+                    with open(temporary_path, "a") as journal:
+                        for record in appended:
+                            journal.write(json.dumps(record) + "\n")
+                        journal.flush()
+                        if self.fsync:
+                            os.fsync(journal.fileno())
+                    os.rename(temporary_path, self.journal_path)
+                    self._journal.close()
+                    self._journal = open(self.journal_path, "a")
+                    self._journal_records = len(appended)
+                elif temporary_path is not None:
+                    # The dispatcher was closed meanwhile and its journal is kept as it is
+                    os.unlink(temporary_path)
+
+    def _write_journal(self, record):
+        """
+        Appends a record to the journal. It must be called holding the journal lock and not the condition, which is
+        only held to find whether every call is made.
+        """
+        if self._journal is None:
+            return
+        done = set(record.get("done", ()))
+        if done and self._compaction is None:
+            with self._condition:
+                idle = not self._waiting and all(call.operation_id in done for calls in self._in_flight.values()
+                                                 for call in calls)
+            if idle:
+                # Once every call is made, the journal is emptied instead of growing
+                self._journal.truncate(0)
+                if self.fsync:
+                    os.fsync(self._journal.fileno())
+                self._journal_records = 0
+                return
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_records += 1
+        if self._compaction is not None:
+            self._compaction.append(record)
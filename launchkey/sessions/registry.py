@@ -0,0 +1,171 @@
+from launchkey import AUTHORIZATION_REQUEST_TTL
+from collections import OrderedDict
+from time import time
+import six
+import threading
+
+
+class RegisteredSession(object):
+    """A Service Session started for a user, as recorded by launchkey.sessions.SessionRegistry"""
+
+    __slots__ = ("auth_request_id", "user", "service_user_hash", "data", "expires")
+
+    def __init__(self, auth_request_id, user, service_user_hash, data, expires):
+        """
+        :param auth_request_id: Unique identifier of the authorization request the session was started for
+        :param user: LaunchKey Username, User Push ID, or Directory User ID the session was started with, and to end
+        it with
+        :param service_user_hash: Service User Hash of the user, or None until the authorization response is received
+        :param data: Application data attached to the session, such as the identifiers of its own sessions
+        :param expires: Unix timestamp after which the session is forgotten
+        """
+        self.auth_request_id = auth_request_id
+        self.user = user
+        self.service_user_hash = service_user_hash
+        self.data = data
+        self.expires = expires
+
+
+class SessionRegistry(object):
+    """
+    Records the Service Sessions started by launchkey.clients.ServiceClient.session_start, indexed by user and by
+    Service User Hash. The hash is learned from the authorization response the session was started for, whether it was
+    received before or after the session started, so that the sessions to tear down for a logout webhook's
+    launchkey.entities.service.SessionEndRequest are found in constant time.
+
+    The registry is bounded: sessions are forgotten after the TTL, and the oldest are forgotten first when there are too
+    many.
+    """
+
+    def __init__(self, max_sessions=100000, ttl=86400):
+        """
+        :param max_sessions: Maximum number of sessions recorded
+        :param ttl: Seconds after which a session is forgotten
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # Sessions by authorization request id, oldest first
+        self._sessions = OrderedDict()
+        self._by_user = {}
+        self._by_hash = {}
+        # Service User Hashes of authorization responses received before their session started, oldest first
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def start(self, user, auth_request_id, data=None):
+        """
+        Records a session which was started
+        :param user: LaunchKey Username, User Push ID, or Directory User ID for the End User
+        :param auth_request_id: Unique identifier of the authorization request the session was started for
+        :param data: Application data to attach to the session
+        :return: launchkey.sessions.RegisteredSession
+        """
+        now = time()
+        with self._lock:
+            self._remove(auth_request_id)
+            self._evict_sessions(now)
+            self._evict_hashes(now)
+            hash_entry = self._hashes.pop(auth_request_id, None)
+            service_user_hash = hash_entry[1] if hash_entry is not None and hash_entry[0] > now else None
+            session = RegisteredSession(auth_request_id, user, service_user_hash, data, now + self.ttl)
+            self._sessions[auth_request_id] = session
+            self._by_user.setdefault(user, set()).add(auth_request_id)
+            if service_user_hash is not None:
+                self._by_hash.setdefault(service_user_hash, set()).add(auth_request_id)
+            return session
+
+    def record_response(self, response):
+        """
+        Indexes the session started for an authorization response by the user's Service User Hash, or remembers the
+        hash until the session starts
+        :param response: launchkey.entities.service.AuthorizationResponse
+        """
+        auth_request_id, service_user_hash = response.authorization_request_id, response.service_user_hash
+        if service_user_hash is None:
+            return
+        now = time()
+        with self._lock:
+            session = self._sessions.get(auth_request_id)
+            if session is None:
+                self._hashes.pop(auth_request_id, None)
+                self._hashes[auth_request_id] = now + 2 * AUTHORIZATION_REQUEST_TTL, service_user_hash
+                self._evict_hashes(now)
+            elif session.service_user_hash is None:
+                session.service_user_hash = service_user_hash
+                self._by_hash.setdefault(service_user_hash, set()).add(auth_request_id)
+
+    def sessions_for_user(self, user):
+        """
+        :param user: LaunchKey Username, User Push ID, or Directory User ID for the End User
+        :return: List of the launchkey.sessions.RegisteredSession of the user
+        """
+        with self._lock:
+            return self._live(self._by_user.get(user, ()))
+
+    def sessions_for_service_user_hash(self, service_user_hash):
+        """
+        :param service_user_hash: Service User Hash, such as of a launchkey.entities.service.SessionEndRequest
+        :return: List of the launchkey.sessions.RegisteredSession of the user
+        """
+        with self._lock:
+            return self._live(self._by_hash.get(service_user_hash, ()))
+
+    def end(self, user):
+        """
+        Forgets the sessions of a user, such as after session_end was called for them
+        :param user: LaunchKey Username, User Push ID, or Directory User ID for the End User
+        :return: List of the launchkey.sessions.RegisteredSession which were forgotten
+        """
+        with self._lock:
+            return [self._remove(auth_request_id) for auth_request_id in list(self._by_user.get(user, ()))]
+
+    def end_service_user(self, service_user_hash):
+        """
+        Forgets the sessions of the user a logout webhook was received for. The application tears down the returned
+        sessions and calls session_end with their user.
+        :param service_user_hash: Service User Hash of the launchkey.entities.service.SessionEndRequest
+        :return: List of the launchkey.sessions.RegisteredSession which were forgotten
+        """
+        with self._lock:
+            auth_request_ids = list(self._by_hash.get(service_user_hash, ()))
+            return [self._remove(auth_request_id) for auth_request_id in auth_request_ids]
+
+    def _live(self, auth_request_ids):
+        now = time()
+        return [session for session in (self._sessions[auth_request_id] for auth_request_id in auth_request_ids)
+                if session.expires > now]
+
+    def _remove(self, auth_request_id):
+        """Forgets a session and removes it from the indexes. It must be called holding the lock."""
+        session = self._sessions.pop(auth_request_id, None)
+        if session is None:
+            return None
+        for index, key in ((self._by_user, session.user), (self._by_hash, session.service_user_hash)):
+            auth_request_ids = index.get(key)
+            if auth_request_ids is not None:
+                auth_request_ids.discard(auth_request_id)
+                if not auth_request_ids:
+                    del index[key]
+        return session
+
+    def _evict_sessions(self, now):
+        """
+        Forgets the expired sessions, and the oldest ones to make room for another. Sessions are ordered by expiration,
+        so only the oldest are checked. It must be called holding the lock.
+        """
+        while self._sessions:
+            auth_request_id, session = next(six.iteritems(self._sessions))
+            if session.expires > now and len(self._sessions) < self.max_sessions:
+                return
+            self._remove(auth_request_id)
+
+    def _evict_hashes(self, now):
+        """Forgets the expired and excess hashes of responses received before their session started"""
+        while self._hashes:
+            auth_request_id, (expires, _) = next(six.iteritems(self._hashes))
+            if expires > now and len(self._hashes) <= self.max_sessions:
+                return
+            del self._hashes[auth_request_id]
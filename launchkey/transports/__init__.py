@@ -1,2 +1,5 @@
 from .jose_auth import JOSETransport
 from .http import RequestsTransport
+from .local_proxy import LocalProxyTransport
+from .cache import SharedMemoryCache, DiskCache
+from .replay import ReplayCache, SharedMemoryReplayCache
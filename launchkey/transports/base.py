@@ -1,8 +1,18 @@
+import json
+import six
+
+# Marks data which was not decoded from the content yet
+_UNDECODED = object()
+
+# Media types of JOSE content, which is never JSON and is only decoded to text
+_JOSE_MEDIA_TYPES = ('application/jwe', 'application/jwt', 'application/jose')
+
+
 class APIResponse(object):
-    data = None
     headers = None
     status_code = None
     reason = None
+    content = None
 
     def __init__(self, data, headers, status_code, reason=None):
         self.data = data
@@ -10,6 +20,57 @@ class APIResponse(object):
         self.status_code = status_code
         self.reason = reason
 
+    @classmethod
+    def from_content(cls, content, headers, status_code, reason=None):
+        """
+        Creates a response whose data is decoded from its raw content the first time it is accessed
+        :param content: Raw bytes of the body of the response. They are kept as the content attribute, for hashing and
+        decrypting them as they were received.
+        :param headers: Headers of the response. Their Content-Type decides how the content is decoded.
+        :param status_code: Status code of the response
+        :param reason: Reason phrase of the response
+        :return: APIResponse
+        """
+        response = cls(_UNDECODED, headers, status_code, reason)
+        response.content = content
+        return response
+
+    @property
+    def data(self):
+        """
+        Data of the response. Content is parsed if it is JSON, falling back to its text otherwise, whatever its media
+        type says, as error bodies may be JSON served as text/plain or without a media type. Content of a JOSE media
+        type, such as the JWE of JOSE responses, is only decoded to text.
+        """
+        if self._data is _UNDECODED:
+            self._data = self._decode()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    def _decode(self):
+        content_type = self.headers.get('Content-Type') or self.headers.get('content-type') if self.headers else None
+        media_type, _, parameters = (content_type or '').partition(';')
+        media_type = media_type.strip().lower()
+        charset = 'utf-8'
+        for parameter in parameters.split(';'):
+            name, _, value = parameter.partition('=')
+            if name.strip().lower() == 'charset' and value.strip():
+                charset = value.strip().strip('"')
+        content = self.content if self.content is not None else b''
+        try:
+            text = content.decode(charset, 'replace') if isinstance(content, six.binary_type) else content
+        except LookupError:
+            text = content.decode('utf-8', 'replace')
+        if media_type in _JOSE_MEDIA_TYPES:
+            return text
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
     def __str__(self):
         return super(APIResponse, self).__str__() + ": %s %s %s" % (self.status_code, self.reason, self.data)
 
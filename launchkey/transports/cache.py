@@ -0,0 +1,339 @@
+from time import sleep, time
+from hashlib import sha256
+from launchkey.utils import ForkDetector
+import json
+import mmap
+import os
+import struct
+import six
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class _FileLockedCache(object):
+    """Base for caches shared between processes which elect the one refreshing values with a lock file"""
+
+    cache_issuer_keys = False
+    warm_start = False
+    _refresh_fd = None
+
+    def __del__(self):
+        self.close()
+
+    def _init_refresh_lock(self, path):
+        """Prepares the lock file, which is only opened when the lock is first acquired"""
+        self._refresh_lock_path = path
+        self._refresh_thread_lock = threading.Lock()
+        self._refresh_fd = None
+        self._fork_detector = ForkDetector()
+
+    def _check_fork(self):
+        if self._fork_detector.forked():
+            self._after_fork()
+
+    def _after_fork(self):
+        """
+        Replaces the locks inherited from the parent process. File locks belong to the open file, which the child
+        shares with its parent, so the lock files are opened again. Closing the inherited descriptors does not release
+        locks the parent holds.
+        """
+        self._close_refresh_lock()
+        self._refresh_thread_lock = threading.Lock()
+
+    def _close_refresh_lock(self):
+        if self._refresh_fd is not None:
+            os.close(self._refresh_fd)
+            self._refresh_fd = None
+
+    def close(self):
+        """Closes the files of the cache. They are opened again if it is used afterwards."""
+        self._close_refresh_lock()
+
+    def acquire_refresh_lock(self):
+        """
+        Attempts to become the one process on the host refreshing values. It never blocks.
+        :return: Boolean - Whether the lock was acquired. If so, release_refresh_lock() must be called.
+        """
+        self._check_fork()
+        if not self._refresh_thread_lock.acquire(False):
+            return False
+        try:
+            if self._refresh_fd is None:
+                self._refresh_fd = os.open(self._refresh_lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._refresh_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            self._refresh_thread_lock.release()
+            return False
+        return True
+
+    def release_refresh_lock(self):
+        """Releases the lock acquired with acquire_refresh_lock()"""
+        fcntl.flock(self._refresh_fd, fcntl.LOCK_UN)
+        self._refresh_thread_lock.release()
+
+
+class SharedMemoryCache(_FileLockedCache):
+    """
+    Cache of JSON values shared by every process on a host through a memory mapped file. It is used by
+    launchkey.transports.JOSETransport to share the LaunchKey API public keys and the server time difference so that
+    only one process on the host refreshes them.
+
+    Readers never lock. The segment starts with a sequence number which writers make odd while they write and even once
+    they are done, so a reader which sees the same even sequence number before and after copying the payload knows it
+    did not see a torn write. Writers are serialized with a file lock.
+    """
+
+    _HEADER = struct.Struct("=QI")
+    _MAX_READ_ATTEMPTS = 1000
+    _fd = None
+    _mmap = None
+
+    def __init__(self, path, size=65536):
+        """
+        :param path: Path of the file backing the segment. It is created with mode 0600 if it does not exist. Every
+        process sharing the cache must use the same path and size.
+        :param size: Size of the segment in bytes
+        """
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryCache requires a platform supporting fcntl")
+        self._prepare(path, size)
+        with self._open_lock:
+            self._open()
+
+    def __getstate__(self):
+        return {"path": self.path, "size": self.size}
+
+    def __setstate__(self, state):
+        # The segment is mapped on first use, so that a cache unpickled with a transport which is never used opens no
+        # file
+        self._prepare(state["path"], state["size"])
+
+    def _prepare(self, path, size):
+        self.path = path
+        self.size = size
+        self._snapshot = None, {}
+        self._thread_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._init_refresh_lock(path + ".lock")
+
+    def _segment(self):
+        """Returns the memory map of the segment, mapping it on first use"""
+        self._check_fork()
+        if self._mmap is None:
+            with self._open_lock:
+                if self._mmap is None:
+                    self._open()
+        return self._mmap
+
+    def _open(self):
+        """Opens and maps the segment. It must be called holding the open lock."""
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self.size:
+                os.ftruncate(self._fd, self.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mmap = mmap.mmap(self._fd, self.size)
+
+    def _after_fork(self):
+        super(SharedMemoryCache, self)._after_fork()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR)
+        self._thread_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+
+    def close(self):
+        """Unmaps the segment and closes its files. They are opened again if the cache is used afterwards."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        super(SharedMemoryCache, self).close()
+
+    def _read_values(self):
+        """Returns the dictionary stored in the segment, decoding it only when the sequence number changed"""
+        segment = self._segment()
+        for _ in range(self._MAX_READ_ATTEMPTS):
+            seq, length = self._HEADER.unpack_from(segment, 0)
+            snapshot = self._snapshot
+            if seq == snapshot[0]:
+                return snapshot[1]
+            if seq % 2:
+                sleep(0)
+                continue
+            payload = segment[self._HEADER.size:self._HEADER.size + min(length, self.size - self._HEADER.size)]
+            if self._HEADER.unpack_from(segment, 0)[0] != seq:
+                continue
+            try:
+                values = json.loads(payload.decode("utf-8")) if length else {}
+            except ValueError:
+                # The header was read while a writer updated it, pairing the new sequence number with the old length,
+                # or the segment holds garbage
+                sleep(0)
+                continue
+            self._snapshot = seq, values
+            return values
+        # A writer died mid-write, is starved, or left garbage. Behave as an empty cache until the next write repairs
+        # the segment.
+        return {}
+
+    def get(self, key):
+        """
+        :param key: Cache key
+        :return: The stored value or None if there is none
+        """
+        return self._read_values().get(key)
+
+    def set(self, key, value):
+        """
+        Stores a value for every process sharing the segment
+        :param key: Cache key
+        :param value: JSON serializable value
+        :return: Boolean - Whether the value fit in the segment and was stored
+        """
+        return self.update(lambda values: values.__setitem__(key, value))[1]
+
+    def update(self, function):
+        """
+        Reads and replaces the values of the segment without any other process writing in between, such as to take a
+        lease only if nobody holds it
+        :param function: Callable receiving the dictionary of values, which it may modify
+        :return: Tuple of the value returned by function and a Boolean indicating whether the values fit in the segment
+        and were stored. Values which were not modified are not written again.
+        """
+        segment = self._segment()
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                seq, length = self._HEADER.unpack_from(segment, 0)
+                current = segment[self._HEADER.size:self._HEADER.size + min(length, self.size - self._HEADER.size)]
+                try:
+                    values = json.loads(current.decode("utf-8"))
+                except ValueError:
+                    # Empty segment, or a writer died mid-write and left it in an unknown state
+                    values = {}
+                result = function(values)
+                payload = json.dumps(values, separators=(",", ":")).encode("utf-8")
+                if payload == current and seq % 2 == 0:
+                    return result, True
+                if self._HEADER.size + len(payload) > self.size:
+                    return result, False
+                # An odd sequence number left by a writer which died mid-write is reused as is.
+                writing = seq + 1 if seq % 2 == 0 else seq
+                self._HEADER.pack_into(segment, 0, writing, length)
+                segment[self._HEADER.size:self._HEADER.size + len(payload)] = payload
+                self._HEADER.pack_into(segment, 0, writing + 1, len(payload))
+                return result, True
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class DiskCache(_FileLockedCache):
+    """
+    Persistent cache of JSON values in a file, allowing a new process to start with the values cached by the previous
+    ones. It is used by launchkey.transports.JOSETransport for the API public keys, keyed by key id, the server time
+    difference, and optionally the parsed issuer private keys.
+
+    The file is replaced atomically on every write and carries a checksum of its entries. A file which does not match
+    its checksum is ignored. Entries older than the TTL are ignored as well. A new transport starts with the values of
+    entries younger than the TTL, and refreshes them once it used them for API_CACHE_TIME.
+    """
+
+    _VERSION = 1
+    warm_start = True
+
+    def __init__(self, path, ttl=86400, cache_issuer_keys=False):
+        """
+        :param path: Path of the cache file. It is created with mode 0600.
+        :param ttl: Number of seconds after which an entry is ignored
+        :param cache_issuer_keys: Whether the parsed issuer private keys are stored. They are stored unencrypted as
+        private key material, so the file must then be protected like the PEM files themselves.
+        """
+        if fcntl is None:
+            raise RuntimeError("DiskCache requires a platform supporting fcntl")
+        self.path = path
+        self.ttl = ttl
+        self.cache_issuer_keys = cache_issuer_keys
+        self._loaded = None, {}
+        self._write_lock = threading.Lock()
+        self._init_refresh_lock(self.path + ".lock")
+
+    def __getstate__(self):
+        return {"path": self.path, "ttl": self.ttl, "cache_issuer_keys": self.cache_issuer_keys}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["ttl"], state["cache_issuer_keys"])
+
+    def _after_fork(self):
+        super(DiskCache, self)._after_fork()
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def _checksum(entries):
+        return sha256(json.dumps(entries, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def _read_file(self):
+        try:
+            with open(self.path) as cache_file:
+                document = json.load(cache_file)
+            entries = document["entries"]
+            if document["version"] != self._VERSION or document["checksum"] != self._checksum(entries):
+                return {}
+            return entries
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _entries(self):
+        """Returns the entries of the file, reading it again only when it was replaced"""
+        try:
+            stat = os.stat(self.path)
+            version = stat.st_ino, stat.st_mtime, stat.st_size
+        except OSError:
+            return {}
+        loaded = self._loaded
+        if loaded[0] != version:
+            loaded = self._loaded = version, self._read_file()
+        return loaded[1]
+
+    def get(self, key):
+        """
+        :param key: Cache key
+        :return: The stored value or None if there is none or it is older than the TTL
+        """
+        entry = self._entries().get(key)
+        if entry is None or time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def set(self, key, value):
+        """
+        Stores a value and replaces the cache file
+        :param key: Cache key
+        :param value: JSON serializable value
+        :return: Boolean - Whether the value was stored
+        """
+        self._check_fork()
+        now = time()
+        with self._write_lock:
+            lock_fd = os.open(self.path + ".write", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                entries = dict((k, v) for k, v in six.iteritems(self._read_file()) if now - v[0] <= self.ttl)
+                entries[key] = [now, value]
+                temporary_path = "%s.%s.tmp" % (self.path, os.getpid())
+                with os.fdopen(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                    json.dump({"version": self._VERSION, "checksum": self._checksum(entries), "entries": entries}, f)
+                os.rename(temporary_path, self.path)
+                return True
+            except (IOError, OSError):
+                return False
+            finally:
+                os.close(lock_fd)
@@ -1,4 +1,5 @@
 from launchkey import LAUNCHKEY_PRODUCTION
+from launchkey.utils import ForkDetector
 from .base import APIResponse, APIErrorResponse
 import requests
 
@@ -12,6 +13,35 @@ class RequestsTransport(object):
     testing = False
     verify_ssl = True
 
+    def __init__(self, pooled=False):
+        """
+        :param pooled: Boolean stating whether connections should be kept alive and reused between requests through a
+        requests.Session. When it is not set, each request uses a new connection. The session is replaced in a
+        forked process so that the parent's connections are never shared.
+        """
+        self.pooled = pooled
+        self._session = requests.Session() if pooled else None
+        self._fork_detector = ForkDetector()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_session"], state["_fork_detector"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._session = requests.Session() if self.pooled else None
+        self._fork_detector = ForkDetector()
+
+    @property
+    def _requester(self):
+        """The object performing the HTTP calls: the pooled session if there is one, the requests module otherwise"""
+        if self._session is None:
+            return requests
+        if self._fork_detector.forked():
+            self._session = requests.Session()
+        return self._session
+
     def set_url(self, url, testing):
         """
         :param url: Base url for the querying LaunchKey API
@@ -24,20 +54,17 @@ class RequestsTransport(object):
 
     @staticmethod
     def _parse_response(response):
-        try:
-            data = response.json()
-        except ValueError:
-            data = response.text
-
+        # The body is only decoded when the data is accessed, as JOSE responses are decrypted from the raw content
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError:
             if response.status_code < 500:
-                return APIErrorResponse(data, response.headers, response.status_code, response.reason)
+                return APIErrorResponse.from_content(response.content, response.headers, response.status_code,
+                                                     response.reason)
             else:
                 raise
 
-        return APIResponse(data, response.headers, response.status_code)
+        return APIResponse.from_content(response.content, response.headers, response.status_code)
 
     def get(self, path, headers=None, data=None):
         """
@@ -47,7 +74,8 @@ class RequestsTransport(object):
         :param data: Dictionary or bytes to be sent in the query string for the request.
         :return:
         """
-        return self._parse_response(requests.get(self.url + path, params=data, headers=headers, verify=self.verify_ssl))
+        return self._parse_response(
+            self._requester.get(self.url + path, params=data, headers=headers, verify=self.verify_ssl))
 
     def post(self, path, headers=None, data=None):
         """
@@ -57,7 +85,8 @@ class RequestsTransport(object):
         :param data: Dictionary, bytes, or file-like object to send in the body of the request.
         :return:
         """
-        return self._parse_response(requests.post(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
+        return self._parse_response(
+            self._requester.post(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
 
     def put(self, path, headers=None, data=None):
         """
@@ -67,7 +96,8 @@ class RequestsTransport(object):
         :param data: Dictionary, bytes, or file-like object to send in the body of the request.
         :return:
         """
-        return self._parse_response(requests.put(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
+        return self._parse_response(
+            self._requester.put(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
 
     def delete(self, path, headers=None, data=None):
         """
@@ -78,7 +108,7 @@ class RequestsTransport(object):
         :return:
         """
         return self._parse_response(
-            requests.delete(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
+            self._requester.delete(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
             
     def patch(self, path, headers=None, data=None):
         """
@@ -88,4 +118,5 @@ class RequestsTransport(object):
         :param data: Dictionary, bytes, or file-like object to send in the body of the request.
         :return:
         """
-        return self._parse_response(requests.patch(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
+        return self._parse_response(
+            self._requester.patch(self.url + path, data=data, headers=headers, verify=self.verify_ssl))
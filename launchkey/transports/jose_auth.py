@@ -2,29 +2,84 @@ from launchkey.exceptions import InvalidEntityID, InvalidPrivateKey, InvalidIssu
     LaunchKeyAPIException, JWTValidationFailure, UnexpectedAPIResponse, NoIssuerKey, InvalidJWTResponse
 from launchkey import VALID_JWT_ISSUER_LIST, API_CACHE_TIME, JOSE_SUPPORTED_CONTENT_HASH_ALGS, JOSE_SUPPORTED_JWE_ALGS
 from launchkey import JOSE_SUPPORTED_JWE_ENCS, JOSE_SUPPORTED_JWT_ALGS, JOSE_AUDIENCE, JOSE_JWT_LEEWAY
+from launchkey import JOSE_MAX_JWT_SIZE
+from launchkey.utils import ForkDetector
 from .http import RequestsTransport
 from .base import APIErrorResponse
+from .key_files import IssuerKeyFiles
 from uuid import UUID, uuid4
 from hashlib import sha256, sha384, sha512, md5
 from time import time
 from calendar import timegm
 from dateutil.parser import parse
+from Crypto import Random
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP
+import hmac
 import json
 import six
+import threading
+import weakref
 from jwkest.jwk import RSAKey, import_rsa_key
 from jwkest.jws import JWS, NoSuitableSigningKeys
 from jwkest.jwe import JWE, JWEnc
+from jwkest import b64d
 from jwkest.jwt import BadSyntax
 
 
+def _rsa_key_components(rsa_key):
+    """Returns the integers defining a Crypto.PublicKey.RSA key: n and e, followed by d, p, and q for a private key"""
+    names = ("n", "e", "d", "p", "q") if rsa_key.has_private() else ("n", "e")
+    return tuple(int(getattr(rsa_key, name)) for name in names)
+
+
+def _construct_rsa_key(components):
+    """Builds a Crypto.PublicKey.RSA key from trusted components, skipping the consistency check where supported"""
+    try:
+        return RSA.construct(components, consistency_check=False)
+    except TypeError:
+        return RSA.construct(components)
+
+
+class _SharedResources(object):
+    """
+    Cached API values and parsed issuer keys which a JOSETransport shares with the transports derived from it. Issuer
+    keys are held weakly, so that a key is forgotten once no transport uses it, such as after it was rotated out of
+    watched key files or its factory was removed from a registry.
+    """
+
+    def __init__(self):
+        self.server_time_difference = None, None
+        self.api_public_keys = [], None
+        # (key id, PEM) of the API public keys to their parsed jwkest.jwk.RSAKey, so that each is only parsed once
+        self.parsed_api_public_keys = {}
+        self.issuer_keys = weakref.WeakValueDictionary()
+
+    def __getstate__(self):
+        # Issuer keys are pickled by the transports using them, so that pickling one transport does not pickle the
+        # private keys of every other issuer
+        api_public_keys, fetched = self.api_public_keys
+        return {
+            "server_time_difference": self.server_time_difference,
+            "api_public_keys": ([(key.kid, _rsa_key_components(key.key)) for key in api_public_keys], fetched),
+        }
+
+    def __setstate__(self, state):
+        self.server_time_difference = state["server_time_difference"]
+        api_public_keys, fetched = state["api_public_keys"]
+        self.api_public_keys = [RSAKey(key=_construct_rsa_key(components), kid=key_id)
+                                for key_id, components in api_public_keys], fetched
+        self.parsed_api_public_keys = {}
+        self.issuer_keys = weakref.WeakValueDictionary()
+
+
 class JOSETransport(object):
 
     audience = JOSE_AUDIENCE
+    _MAX_SHARED_API_PUBLIC_KEYS = 5
 
     def __init__(self, jwt_algorithm="RS512", jwe_cek_encryption="RSA-OAEP", jwe_claims_encryption="A256CBC-HS512",
-                 content_hash_algorithm="S256", http_client=None):
+                 content_hash_algorithm="S256", http_client=None, shared_cache=None):
         """
         :param jwt_algorithm: JWT Signing algorithm
                               Currently supported: RS256, RS384, RS512
@@ -36,13 +91,21 @@ class JOSETransport(object):
         :param content_hash_algorithm: Hashing algorithm for signing content body
                                        Currently supported: S256, S384, S512 (shortened forms of SHAxxx)
         :param http_client: HTTP transport to contact the LaunchKey api after JOSE processing is complete
+        :param shared_cache: Optional cache shared between processes such as
+                             launchkey.transports.cache.SharedMemoryCache or launchkey.transports.cache.DiskCache. When
+                             it is set, the API public keys and the server time difference are read from it and only
+                             one process refreshes them. Caches with warm_start set provide a new transport with the
+                             values they hold whatever their age, and caches with cache_issuer_keys set also store the
+                             parsed issuer private keys.
         """
         self.issuer = None
         self.issuer_id = None
-        self.loaded_issuer_private_keys = {}
-        self.issuer_private_keys = []
-        self._server_time_difference = None, None
-        self._api_public_keys = [], None
+        # The key list and the ciphers keyed by key id are replaced together when watched key files change
+        self._issuer_keys = [], {}
+        self._pending_issuer_keys = []
+        self._issuer_key_lock = threading.Lock()
+        self._issuer_key_files = None
+        self._resources = _SharedResources()
 
         self.jwt_algorithm = self.__verify_supported_algorith(jwt_algorithm, JOSE_SUPPORTED_JWT_ALGS)
         self.jwe_cek_encryption = self.__verify_supported_algorith(jwe_cek_encryption, JOSE_SUPPORTED_JWE_ALGS)
@@ -58,6 +121,98 @@ class JOSETransport(object):
             self.content_hash_function = sha512
 
         self._http_client = http_client if http_client is not None else RequestsTransport()
+        self._shared_cache = shared_cache
+        self._fork_detector = ForkDetector()
+
+    def __getstate__(self):
+        """
+        Pickles the transport with its HTTP client and shared cache, its cached API values, and its own issuer keys as
+        RSA key components, so that an unpickled transport starts warm without parsing any PEM. The keys of other
+        transports sharing its resources, locks, and connections are not pickled.
+        """
+        state = self.__dict__.copy()
+        del state["_issuer_key_lock"], state["_fork_detector"]
+        digests = dict((id(key), digest) for digest, key in list(self._resources.issuer_keys.items()))
+        state["_issuer_keys"] = [(digests.get(id(key)), key.kid, _rsa_key_components(key.key))
+                                 for key in self._issuer_keys[0]]
+        return state
+
+    def __setstate__(self, state):
+        issuer_keys = state.pop("_issuer_keys")
+        self.__dict__.update(state)
+        # Keys are shared again with the transports unpickled along with this one, and those derived from it
+        keys, ciphers = [], {}
+        for digest, key_id, components in issuer_keys:
+            key = self._resources.issuer_keys.get(digest) if digest is not None else None
+            if key is None:
+                key = RSAKey(key=_construct_rsa_key(components), kid=key_id)
+                if digest is not None:
+                    self._resources.issuer_keys[digest] = key
+            keys.append(key)
+            ciphers[key_id] = PKCS1_OAEP.new(key.key)
+        self._issuer_keys = keys, ciphers
+        self._issuer_key_lock = threading.Lock()
+        self._fork_detector = ForkDetector()
+        # The transport may be unpickled in a process forked from the one which pickled it
+        Random.atfork()
+
+    def derive(self):
+        """
+        Creates a transport without an issuer using the same algorithms as this one, and sharing its HTTP client, its
+        shared cache, its cached server time difference and API public keys, and its parsed issuer keys. This allows
+        many issuers to be served with a single set of resources.
+        :return: launchkey.transports.JOSETransport
+        """
+        transport = JOSETransport(self.jwt_algorithm, self.jwe_cek_encryption, self.jwe_claims_encryption,
+                                  self.content_hash_algorithm, http_client=self._http_client,
+                                  shared_cache=self._shared_cache)
+        transport._resources = self._resources
+        return transport
+
+    @property
+    def issuer_private_keys(self):
+        """The issuer keys, as jwkest.jwk.RSAKey objects, used for signatures and decryption"""
+        # Any use of a private key needs the random number generator reinitialized in a forked process
+        self._check_fork()
+        if self._pending_issuer_keys:
+            self._load_pending_issuer_keys()
+        if self._issuer_key_files is not None and self._issuer_key_files.due():
+            self._reload_issuer_keys()
+        return self._issuer_keys[0]
+
+    @issuer_private_keys.setter
+    def issuer_private_keys(self, value):
+        self._issuer_keys = value, self._issuer_keys[1]
+
+    @property
+    def loaded_issuer_private_keys(self):
+        """The issuer keys, as Crypto.Cipher.PKCS1_OAEP ciphers keyed by key id, used to decrypt auth packages"""
+        self._check_fork()
+        if self._pending_issuer_keys:
+            self._load_pending_issuer_keys()
+        if self._issuer_key_files is not None and self._issuer_key_files.due():
+            self._reload_issuer_keys()
+        return self._issuer_keys[1]
+
+    @loaded_issuer_private_keys.setter
+    def loaded_issuer_private_keys(self, value):
+        self._issuer_keys = self._issuer_keys[0], value
+
+    @property
+    def _server_time_difference(self):
+        return self._resources.server_time_difference
+
+    @_server_time_difference.setter
+    def _server_time_difference(self, value):
+        self._resources.server_time_difference = value
+
+    @property
+    def _api_public_keys(self):
+        return self._resources.api_public_keys
+
+    @_api_public_keys.setter
+    def _api_public_keys(self, value):
+        self._resources.api_public_keys = value
 
     @staticmethod
     def __verify_supported_algorith(algorithm, supported_list):
@@ -76,11 +231,10 @@ class JOSETransport(object):
     def __generate_key_id(rsa_key):
         """
         Generates a key id to be used in JWE + JWT. It is based on the digest of the key.
-        :param rsa_key: RSA private key in string format
+        :param rsa_key: Crypto.PublicKey.RSA key object
         :return:
         """
-        key = RSA.importKey(rsa_key)
-        md5digest = md5(key.publickey().exportKey('DER')).hexdigest()
+        md5digest = md5(rsa_key.publickey().exportKey('DER')).hexdigest()
         return ":".join(md5digest[i:i + 2] for i in range(0, len(md5digest), 2))
 
     @staticmethod
@@ -91,46 +245,256 @@ class JOSETransport(object):
         """
         return timegm(parse(api_time).timetuple())
 
+    def _read_shared_cache(self, name, now, allow_stale=False):
+        """
+        Retrieves a value and the time it was fetched from the shared cache
+        :param name: Cache key
+        :param now: Current unix timestamp
+        :param allow_stale: Whether a value older than API_CACHE_TIME may be returned
+        :return: Tuple of the value and its timestamp or None
+        """
+        if self._shared_cache is None:
+            return None
+        cached = self._shared_cache.get(name)
+        if cached is None or (not allow_stale and now - cached[1] > API_CACHE_TIME):
+            return None
+        return cached[0], cached[1]
+
+    def _get_api_value(self, name, now, fetch, warm_start=False):
+        """
+        Retrieves a value cached for API_CACHE_TIME. With a shared cache, a fresh shared value is used if there is one.
+        Otherwise only the process holding the refresh lock calls fetch and publishes the result, while the others keep
+        using the stale shared value.
+        :param name: Cache key
+        :param now: Current unix timestamp
+        :param fetch: Callable receiving the stale shared value or None, and returning the new JSON serializable value
+        :param warm_start: Whether the transport holds no value yet. A shared cache with warm_start set, such as a
+        DiskCache, then provides any value it still holds, which is refreshed once it was used for API_CACHE_TIME.
+        :return: Tuple of the value and its timestamp
+        """
+        if warm_start and getattr(self._shared_cache, 'warm_start', False):
+            stale = self._read_shared_cache(name, now, allow_stale=True)
+            if stale is not None:
+                return stale[0], now
+        cached = self._read_shared_cache(name, now)
+        if cached is not None:
+            return cached
+        if self._shared_cache is None:
+            return fetch(None), now
+        if not self._shared_cache.acquire_refresh_lock():
+            stale = self._read_shared_cache(name, now, allow_stale=True)
+            if stale is not None:
+                return stale
+            return fetch(None), now
+        try:
+            stale = self._read_shared_cache(name, now, allow_stale=True)
+            if stale is not None and now - stale[1] <= API_CACHE_TIME:
+                return stale
+            value = fetch(stale[0] if stale is not None else None)
+            self._shared_cache.set(name, [value, now])
+            return value, now
+        finally:
+            self._shared_cache.release_refresh_lock()
+
+    def _fetch_server_time_difference(self, stale):
+        now = int(time())
+        response = self.get("/public/v3/ping", None)
+        try:
+            return now - self.parse_api_time(response.data['api_time'])
+        except (KeyError, ValueError, TypeError):
+            raise UnexpectedAPIResponse("Unexpected api time received: %s" % response.data)
+
     @property
     def server_time_difference(self):
         """The time drag between the sdk and the Launchkey API. The result is cached for API_CACHE_TIME"""
         now = int(time())
         if self._server_time_difference[1] is None or now - self._server_time_difference[1] > API_CACHE_TIME:
-            response = self.get("/public/v3/ping", None)
-            try:
-                self._server_time_difference = now - self.parse_api_time(response.data['api_time']), now
-            except (KeyError, ValueError, TypeError):
-                raise UnexpectedAPIResponse("Unexpected api time received: %s" % response.data)
+            self._server_time_difference = self._get_api_value(
+                "server_time_difference", now, self._fetch_server_time_difference,
+                warm_start=self._server_time_difference[1] is None)
         return self._server_time_difference[0]
 
+    @staticmethod
+    def _parse_api_public_key(public_key, key_id):
+        try:
+            return RSAKey(key=import_rsa_key(public_key), kid=key_id)
+        except (IndexError, TypeError):
+            raise UnexpectedAPIResponse("Unexpected api public key received: %s" % public_key)
+        except ValueError:
+            raise UnexpectedAPIResponse("Unexpected api public key received, RSA parsing error: %s" % public_key)
+
+    def _fetch_api_public_keys(self, stale):
+        response = self.get("/public/v3/public-key", None)
+        key_id = response.headers.get('X-IOV-KEY-ID')
+        # The parsed key is kept for api_public_keys, which would otherwise parse it again
+        parsed = self._resources.parsed_api_public_keys
+        if not isinstance(response.data, six.string_types) or (key_id, response.data) not in parsed:
+            parsed[(key_id, response.data)] = self._parse_api_public_key(response.data, key_id)
+        keys = [key for key in stale or [] if key != [key_id, response.data]]
+        # Keep the previous keys, as the shared cache may be read by transports which have not seen them yet
+        return (keys + [[key_id, response.data]])[-self._MAX_SHARED_API_PUBLIC_KEYS:]
+
     @property
     def api_public_keys(self):
         """The public key retrieved from the LaunchKey API. The result is cached for API_CACHE_TIME"""
         now = int(time())
         if self._api_public_keys[1] is None or now - self._api_public_keys[1] > API_CACHE_TIME:
-            response = self.get("/public/v3/public-key", None)
-            try:
-                key = RSAKey(key=import_rsa_key(response.data), kid=response.headers.get('X-IOV-KEY-ID'))
-            except (IndexError, TypeError):
-                raise UnexpectedAPIResponse("Unexpected api public key received: %s" % response.data)
-            except ValueError:
-                raise UnexpectedAPIResponse("Unexpected api public key received, RSA parsing error: %s" % response.data)
-            if key not in self._api_public_keys[0]:
-                self._api_public_keys[0].append(key)
-            self._api_public_keys = self._api_public_keys[0], now
+            api_keys, fetched = self._get_api_value("api_public_keys", now, self._fetch_api_public_keys,
+                                                    warm_start=self._api_public_keys[1] is None)
+            parsed, current = self._resources.parsed_api_public_keys, {}
+            for key_id, public_key in api_keys:
+                key = parsed.get((key_id, public_key))
+                if key is None:
+                    key = self._parse_api_public_key(public_key, key_id)
+                current[(key_id, public_key)] = key
+                if key not in self._api_public_keys[0]:
+                    self._api_public_keys[0].append(key)
+            # Keys no longer listed by the API are not kept parsed
+            self._resources.parsed_api_public_keys = current
+            self._api_public_keys = self._api_public_keys[0], fetched
         return self._api_public_keys[0]
 
-    def add_issuer_key(self, private_key):
+    @staticmethod
+    def _issuer_key_mac(private_key, components):
+        """Authenticates cached issuer key components with the PEM they were parsed from"""
+        return hmac.new(six.b(private_key), six.b(json.dumps(components, sort_keys=True)), sha256).hexdigest()
+
+    def _load_issuer_key(self, private_key):
+        """
+        Parses a PEM private key. Parsing a PEM private key is expensive, so the result is kept for every transport
+        sharing this one's resources for as long as one of them uses it. When the shared cache stores issuer keys, the
+        key components are also cached under a digest of the PEM and authenticated with a MAC keyed by the PEM.
+        :param private_key: RSA private key in string format
+        :return: Tuple of the jwkest.jwk.RSAKey and the Crypto.Cipher.PKCS1_OAEP cipher for the key
+        """
+        digest = sha256(six.b(private_key)).hexdigest()
+        key = self._resources.issuer_keys.get(digest)
+        if key is None:
+            rsa_key, key_id = self._parse_issuer_key(private_key, digest)
+            key = RSAKey(key=rsa_key, kid=key_id)
+            self._resources.issuer_keys[digest] = key
+        return key, PKCS1_OAEP.new(key.key)
+
+    def _parse_issuer_key(self, private_key, digest):
+        cache = self._shared_cache if getattr(self._shared_cache, 'cache_issuer_keys', False) else None
+        if cache is not None:
+            cache_key = "issuer_key:%s" % digest
+            cached = cache.get(cache_key)
+            if isinstance(cached, dict) and hmac.compare_digest(
+                    str(cached.get('mac')), self._issuer_key_mac(private_key, cached.get('components'))):
+                components = tuple(int(component) for component in cached['components'])
+                return _construct_rsa_key(components), cached['kid']
+
+        rsa_key = RSA.importKey(private_key)
+        key_id = self.__generate_key_id(rsa_key)
+        if cache is not None:
+            components = [str(rsa_key.n), str(rsa_key.e), str(rsa_key.d), str(rsa_key.p), str(rsa_key.q)]
+            cache.set(cache_key, {"kid": key_id, "components": components,
+                                  "mac": self._issuer_key_mac(private_key, components)})
+        return rsa_key, key_id
+
+    def _load_pending_issuer_keys(self):
+        """Parses the keys added lazily, in the order they were added. Only one thread parses them."""
+        self._check_fork()
+        with self._issuer_key_lock:
+            while self._pending_issuer_keys:
+                try:
+                    self._add_issuer_key(self._pending_issuer_keys[0])
+                except ValueError:
+                    raise InvalidPrivateKey("Invalid private key. Please ensure you are submitting a string "
+                                            "representation of a PEM private key.")
+                self._pending_issuer_keys.pop(0)
+
+    def _add_issuer_key(self, private_key):
+        new_key, cipher = self._load_issuer_key(private_key)
+        keys, ciphers = self._issuer_keys
+        for key in keys:
+            if new_key.kid == key.kid:
+                return False
+        keys.append(new_key)
+        ciphers[new_key.kid] = cipher
+
+    def _read_issuer_key_files(self, key_files):
+        """
+        Parses the keys of the key files into a new key list and cipher dictionary
+        :param key_files: launchkey.transports.key_files.IssuerKeyFiles
+        :raise: ValueError - A key is not a valid PEM private key
+        :raise: IOError, OSError - The key files could not be read
+        :return: Tuple of the files' fingerprint and a tuple of the key list and the ciphers keyed by key id
+        """
+        fingerprint = key_files.fingerprint()
+        keys, ciphers = [], {}
+        for private_key in key_files.read():
+            key, cipher = self._load_issuer_key(private_key)
+            if key.kid not in ciphers:
+                keys.append(key)
+                ciphers[key.kid] = cipher
+        return fingerprint, (keys, ciphers)
+
+    def _reload_issuer_keys(self):
+        """
+        Swaps in the keys of the watched key files if they changed. Only one thread checks the files while the others
+        keep using the current keys, and readers never wait for the swap.
+        """
+        self._check_fork()
+        key_files = self._issuer_key_files
+        if not key_files.lock.acquire(False):
+            return
+        try:
+            key_files.next_check = time() + key_files.check_interval
+            if key_files.fingerprint() == key_files.loaded_fingerprint:
+                return
+            fingerprint, issuer_keys = self._read_issuer_key_files(key_files)
+            if issuer_keys[0]:
+                self._issuer_keys = issuer_keys
+                key_files.loaded_fingerprint = fingerprint
+        except (IOError, OSError, ValueError):
+            # A key file is being written or holds an invalid key. The current keys are kept and the files are checked
+            # again after the interval.
+            pass
+        finally:
+            key_files.lock.release()
+
+    def watch_issuer_keys(self, path, check_interval=10):
+        """
+        Loads the issuer keys from a key directory or bundle file, and reloads them when the files change. The keys
+        found replace every issuer key of the transport, including those given to set_issuer and add_issuer_key. The
+        first key is used for signatures. Keys are parsed once, so only keys new to the files are parsed on a reload.
+        A reload which fails or finds no keys keeps the current keys.
+        :param path: Directory in which every file holds PEM private keys, or a file of concatenated PEM private keys
+        :param check_interval: Minimum number of seconds between two checks of the files for changes
+        :raise: launchkey.exceptions.InvalidPrivateKey - A key is invalid or no key was found
+        :raise: IOError, OSError - The key files could not be read
+        """
+        key_files = IssuerKeyFiles(path, check_interval)
+        try:
+            fingerprint, issuer_keys = self._read_issuer_key_files(key_files)
+        except ValueError:
+            raise InvalidPrivateKey("Invalid private key in %s. Please ensure the files only contain PEM private "
+                                    "keys." % path)
+        if not issuer_keys[0]:
+            raise InvalidPrivateKey("No PEM private key was found in %s." % path)
+        key_files.loaded_fingerprint = fingerprint
+        key_files.next_check = time() + check_interval
+        with self._issuer_key_lock:
+            self._pending_issuer_keys = []
+            self._issuer_keys = issuer_keys
+            self._issuer_key_files = key_files
+
+    def add_issuer_key(self, private_key, lazy=False):
         """
         Adds a private key to the list of keys available for decryption and signatures
+        :param private_key: PEM formatted private key string
+        :param lazy: Whether parsing the key should be deferred until the issuer keys are first used. An invalid key
+        is then reported by launchkey.exceptions.InvalidPrivateKey on first use.
         :return: Boolean - Whether the key is already in the list
         """
-        new_key = RSAKey(key=import_rsa_key(private_key), kid=self.__generate_key_id(private_key))
-        for key in self.issuer_private_keys:
-            if new_key.kid == key.kid:
-                return False
-        self.issuer_private_keys.append(new_key)
-        self.loaded_issuer_private_keys[new_key.kid] = PKCS1_OAEP.new(RSA.importKey(private_key))
+        if lazy:
+            self._pending_issuer_keys.append(private_key)
+            return
+        if self._pending_issuer_keys:
+            self._load_pending_issuer_keys()
+        return self._add_issuer_key(private_key)
 
     def set_url(self, url, testing):
         """
@@ -142,7 +506,14 @@ class JOSETransport(object):
         """
         self._http_client.set_url(url, testing)
 
-    def set_issuer(self, issuer, issuer_id, private_key):
+    def set_issuer(self, issuer, issuer_id, private_key, lazy=False):
+        """
+        Sets the issuer of the requests and its private key
+        :param issuer: Issuer type. IE: svc, dir, org
+        :param issuer_id: UUID of the issuer
+        :param private_key: PEM formatted private key string
+        :param lazy: Whether parsing the private key should be deferred until it is first used
+        """
         if issuer not in VALID_JWT_ISSUER_LIST:
             raise InvalidIssuer("Invalid issuer it must be one of: {0}".format(VALID_JWT_ISSUER_LIST))
         try:
@@ -151,7 +522,7 @@ class JOSETransport(object):
             raise InvalidEntityID("The given id was invalid. Please ensure it is a UUID.")
         self.issuer = "%s:%s" % (issuer, issuer_id)
         try:
-            self.add_issuer_key(private_key)
+            self.add_issuer_key(private_key, lazy)
         except ValueError:
             raise InvalidPrivateKey("Invalid private key. Please ensure you are submitting a string representation of "
                                     "a PEM private key.")
@@ -206,10 +577,25 @@ class JOSETransport(object):
     def _get_content_hash(self, body):
         """
         Retrieves a hash using the stored content_hash_function
-        :param body: string body
+        :param body: string or bytes body. Bytes are hashed as they are.
         :return: hash based on the content_hash_function
         """
-        return self.content_hash_function(six.b(body)).hexdigest()
+        return self.content_hash_function(body if isinstance(body, six.binary_type) else six.b(body)).hexdigest()
+
+    def _check_fork(self):
+        if self._fork_detector.forked():
+            self._after_fork()
+
+    def _after_fork(self):
+        """
+        Prepares the transport for use in a forked process. Parsed keys and cached API values remain valid, and the
+        HTTP client and shared cache replace their own connections and locks. PyCrypto's random number generator must
+        be reinitialized in the child before anything is encrypted.
+        """
+        self._issuer_key_lock = threading.Lock()
+        if self._issuer_key_files is not None:
+            self._issuer_key_files.after_fork()
+        Random.atfork()
 
     def _encrypt_request(self, data):
         """
@@ -217,6 +603,7 @@ class JOSETransport(object):
         :param data: Information to be encrypted
         :return: JWE formatted string
         """
+        self._check_fork()
         jwe = JWE(json.dumps(data), alg=self.jwe_cek_encryption, enc=self.jwe_claims_encryption)
         return jwe.encrypt(keys=self.api_public_keys)
 
@@ -241,11 +628,13 @@ class JOSETransport(object):
             headers = {"content-type": "application/jwt", "Authorization": signature}
         response = getattr(self._http_client, method.lower())(path, data=body, headers=headers)
 
+        # The raw content is hashed and decrypted as received, without decoding it first
+        content = response.content if response.content is not None else response.data
         if response.status_code != 401:
-            self.verify_jwt_response(response.headers, jti, response.data, subject)
+            self.verify_jwt_response(response.headers, jti, content, subject)
 
-        if response.data:
-            jwe = self.decrypt_response(response.data)
+        if content:
+            jwe = self.decrypt_response(content)
             try:
                 result = json.loads(jwe)
             except (ValueError, TypeError):
@@ -260,16 +649,21 @@ class JOSETransport(object):
     def decrypt_response(self, response):
         """
         Decrypts a response using the stored issuer private keys
-        :param response: JWE encrypted string
+        :param response: JWE encrypted string or bytes
         :return: Decrypted string
         """
+        # The token is unpacked once, for picking the key and for decrypting
         h = JWEnc().unpack(response)
-        keys = list(self.issuer_private_keys)
+        issuer_private_keys = self.issuer_private_keys
+        keys = list(issuer_private_keys)
         if 'kid' in h.headers:
-            for key in self.issuer_private_keys:
+            for key in issuer_private_keys:
                 if key.kid == h.headers['kid']:
                     keys = [key]
-        return JWE().decrypt(response, keys=keys).decode('utf-8')
+                    break
+        decrypter = JWE()
+        decrypter.jwt = h
+        return decrypter.decrypt(keys=keys).decode('utf-8')
 
     def verify_jwt_response(self, headers, jti, content_body, subject):
         """
@@ -282,7 +676,61 @@ class JOSETransport(object):
         """
         auth = headers.get('X-IOV-JWT')
         payload = self._get_jwt_payload(auth)
+        self._verify_jwt_claims(payload, jti, content_body, subject)
+        return payload
+
+    def screen_jwt_response(self, headers, content_body, subject):
+        """
+        Rejects a response whose JWT header cannot be valid without any public key operation, by checking the shape of
+        the JWT and its claims before its signature is verified. It is meant for webhooks, which anyone can send, so
+        that junk requests are rejected in microseconds. A response passing the screen must still be verified with
+        verify_screened_jwt_response.
+        :param headers: Full header from the response
+        :param content_body: The body of the request
+        :param subject: Subject of the jwt response
+        :raise: launchkey.exceptions.InvalidJWTResponse - The JWT is missing or is not a JWS signed with a supported
+        algorithm
+        :raise: launchkey.exceptions.JWTValidationFailure - The claims or the content hash are not valid
+        :return: The unverified JWT payload
+        """
+        auth = headers.get('X-IOV-JWT')
+        if not auth or len(auth) > JOSE_MAX_JWT_SIZE:
+            raise InvalidJWTResponse("Received JWT response is missing or too large")
+        parts = auth.split(".") if isinstance(auth, six.string_types) else ()
+        if len(parts) != 3 or not all(parts):
+            raise InvalidJWTResponse("Received JWT response is not a JWS compact serialization")
+        try:
+            header, payload = [json.loads(b64d(part.encode("ascii")).decode("utf-8")) for part in parts[:2]]
+        except (ValueError, TypeError):
+            raise InvalidJWTResponse("Received JWT response is not valid: %s" % auth)
+        if not isinstance(header, dict) or header.get("alg") not in JOSE_SUPPORTED_JWT_ALGS or \
+                not isinstance(payload, dict):
+            raise InvalidJWTResponse("Received JWT response is not valid: %s" % auth)
+        for claim in ("nbf", "exp", "iat"):
+            if not isinstance(payload.get(claim), six.integer_types + (float,)):
+                raise JWTValidationFailure("Claim %s is missing or not a number" % claim)
+        if content_body and not isinstance(payload.get("response") or payload.get("request"), dict):
+            raise JWTValidationFailure("Content hash is missing")
+        self._verify_jwt_claims(payload, None, content_body, subject)
+        return payload
 
+    def verify_screened_jwt_response(self, headers, screened_payload):
+        """
+        Verifies the signature of a response's JWT header which passed screen_jwt_response. Its claims and the content
+        hash were checked by the screen, so they are not checked again and the body is not hashed a second time.
+        :param headers: Full header from the response, as passed to screen_jwt_response
+        :param screened_payload: The payload returned by screen_jwt_response
+        :raise: launchkey.exceptions.InvalidJWTResponse - The JWT is not valid
+        :raise: launchkey.exceptions.JWTValidationFailure - The signed payload is not the screened one
+        :return: The JWT payload
+        """
+        payload = self._get_jwt_payload(headers.get('X-IOV-JWT'))
+        if payload != screened_payload:
+            raise JWTValidationFailure("The signed JWT payload is not the screened one")
+        return payload
+
+    def _verify_jwt_claims(self, payload, jti, content_body, subject):
+        """Verifies the claims of a JWT payload, as documented in verify_jwt_response"""
         now = time()
 
         if payload.get('aud') != self.issuer:
@@ -306,7 +754,6 @@ class JOSETransport(object):
             if received_hash != expected_hash:
                 raise JWTValidationFailure("Content hash does not match: expected %s but got %s" %
                                            (expected_hash, received_hash))
-        return payload
 
     def get(self, path, subject=None, **kwargs):
         """
@@ -0,0 +1,78 @@
+from time import time
+import os
+import re
+import threading
+
+_PEM_PRIVATE_KEY = re.compile(r"-----BEGIN ([A-Z ]*)PRIVATE KEY-----.+?-----END \1PRIVATE KEY-----", re.DOTALL)
+
+
+class IssuerKeyFiles(object):
+    """
+    Source of issuer private keys for launchkey.transports.JOSETransport.watch_issuer_keys: either a directory in which
+    every file holds one or more PEM private keys, or a single bundle file of concatenated PEM private keys. Files
+    without a PEM private key, such as a README, are ignored, as are hidden files.
+
+    Changes are detected by polling the modification time, size, and inode of the files at most once per check
+    interval, so keys may be rotated by writing, renaming, or removing files.
+    """
+
+    def __init__(self, path, check_interval=10):
+        """
+        :param path: Path of the key directory or bundle file
+        :param check_interval: Minimum number of seconds between two checks for changes
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.loaded_fingerprint = None
+        self.next_check = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _file_paths(self):
+        if not os.path.isdir(self.path):
+            return [self.path]
+        return [os.path.join(self.path, name) for name in sorted(os.listdir(self.path)) if not name.startswith(".")]
+
+    def fingerprint(self):
+        """
+        :raise: OSError - The path does not exist
+        :return: Hashable value which changes whenever a key file is added, removed, or modified
+        """
+        fingerprint = []
+        for path in self._file_paths():
+            stat = os.stat(path)
+            fingerprint.append((path, stat.st_ino, stat.st_mtime, stat.st_size))
+        return tuple(fingerprint)
+
+    def read(self):
+        """
+        Reads the private keys. Keys from a directory are in file name order, and keys within a file in the order they
+        appear.
+        :raise: IOError, OSError - A key file could not be read
+        :return: List of PEM formatted private key strings
+        """
+        private_keys = []
+        for path in self._file_paths():
+            if os.path.isfile(path):
+                with open(path) as key_file:
+                    private_keys.extend(match.group(0) for match in _PEM_PRIVATE_KEY.finditer(key_file.read()))
+        return private_keys
+
+    def due(self, now=None):
+        """
+        :param now: Current time in seconds since the epoch
+        :return: Boolean - Whether the check interval has elapsed since the last check
+        """
+        return (time() if now is None else now) >= self.next_check
+
+    def after_fork(self):
+        """Replaces the lock inherited from the parent process, where it may have been held by another thread"""
+        self.lock = threading.Lock()
@@ -0,0 +1,205 @@
+from launchkey import LAUNCHKEY_PRODUCTION
+from launchkey.utils import ForkDetector
+from .base import APIResponse, APIErrorResponse
+from requests.exceptions import HTTPError
+from requests.structures import CaseInsensitiveDict
+from six.moves import http_client
+from six.moves.urllib.parse import urlencode, urlsplit
+import six
+import socket
+import threading
+
+
+class UnixHTTPConnection(http_client.HTTPConnection):
+    """HTTPConnection which connects to a Unix domain socket instead of a TCP host"""
+
+    def __init__(self, socket_path, host="localhost", timeout=None):
+        http_client.HTTPConnection.__init__(self, host)
+        self.socket_path = socket_path
+        self.socket_timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.socket_timeout is not None:
+            sock.settimeout(self.socket_timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class LocalProxyTransport(object):
+    """
+    Transport class for performing plain HTTP queries against a local egress proxy which terminates TLS and pools
+    connections to the LaunchKey API. The proxy is reached over a Unix domain socket or a localhost TCP port. The
+    upstream LaunchKey API url is sent in the Host header and as the path prefix of every request.
+    """
+
+    url = LAUNCHKEY_PRODUCTION
+    testing = False
+
+    # Methods which may be sent again when no response was received for them. Others, such as the POST creating an
+    # auth request, are only retried when sending them failed, as the API may have processed them already.
+    IDEMPOTENT_METHODS = frozenset(("GET", "PUT", "DELETE"))
+
+    def __init__(self, socket_path=None, host="127.0.0.1", port=80, timeout=None):
+        """
+        :param socket_path: Path to the Unix domain socket the proxy listens on. When it is not provided, the proxy is
+        contacted over plain HTTP at host and port.
+        :param host: Host of the proxy when no socket_path is provided
+        :param port: Port of the proxy when no socket_path is provided
+        :param timeout: Socket timeout in seconds
+        """
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+        self._fork_detector = ForkDetector()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"], state["_fork_detector"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._fork_detector = ForkDetector()
+
+    def set_url(self, url, testing):
+        """
+        :param url: Base url for the querying LaunchKey API. The proxy is expected to route on the Host header.
+        :param testing: Boolean stating whether testing mode is being performed. TLS is handled by the proxy so this
+        is only recorded for parity with the other transports.
+        """
+        self.url = url
+        self.testing = testing
+
+    def _new_connection(self):
+        if self.socket_path is not None:
+            return UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        return http_client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _get_connection(self):
+        """Retrieves the keep-alive connection for the current thread, creating it if needed"""
+        if self._fork_detector.forked():
+            # Connections inherited from the parent process must not be used, nor closed, by the child
+            self._local = threading.local()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._new_connection()
+            return connection, False
+        return connection, True
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection.close()
+
+    @staticmethod
+    def _parse_response(status_code, reason, headers, body):
+        if 400 <= status_code < 500:
+            return APIErrorResponse.from_content(body, headers, status_code, reason)
+        elif status_code >= 500:
+            raise HTTPError("%s Server Error: %s" % (status_code, reason),
+                            response=APIResponse.from_content(body, headers, status_code, reason))
+
+        return APIResponse.from_content(body, headers, status_code)
+
+    def _request(self, method, path, headers=None, data=None):
+        split_url = urlsplit(self.url)
+        request_headers = {"Host": split_url.netloc}
+        if headers:
+            request_headers.update(headers)
+        if method == "GET":
+            body = None
+            if data:
+                path = "%s?%s" % (path, urlencode(data))
+        else:
+            body = data.encode('utf-8') if isinstance(data, six.text_type) else data
+
+        connection, reused = self._get_connection()
+        sent = False
+        try:
+            connection.request(method, split_url.path + path, body=body, headers=request_headers)
+            sent = True
+            response = connection.getresponse()
+            response_body = response.read()
+        except (http_client.HTTPException, socket.error) as e:
+            self._drop_connection()
+            if not self._retryable(method, reused, sent, e):
+                raise
+            # The proxy closed the idle keep-alive connection. Retry once on a new one.
+            connection, _ = self._get_connection()
+            connection.request(method, split_url.path + path, body=body, headers=request_headers)
+            response = connection.getresponse()
+            response_body = response.read()
+
+        if response.will_close:
+            self._drop_connection()
+
+        return self._parse_response(response.status, response.reason, CaseInsensitiveDict(response.getheaders()),
+                                    response_body)
+
+    def _retryable(self, method, reused, sent, error):
+        """
+        Whether a request which failed may be sent again on a new connection
+        :param method: HTTP method of the request
+        :param reused: Whether the request was made on a kept-alive connection, which the proxy may have closed
+        :param sent: Whether the request was fully written before failing
+        :param error: Exception raised
+        :return: Boolean
+        """
+        if not reused or isinstance(error, socket.timeout):
+            return False
+        return not sent or method in self.IDEMPOTENT_METHODS
+
+    def get(self, path, headers=None, data=None):
+        """
+        Performs an HTTP GET request against the LaunchKey API through the local proxy
+        :param path: Path or endpoint that will be hit
+        :param headers: Headers to add onto the request
+        :param data: Dictionary to be sent in the query string for the request.
+        :return:
+        """
+        return self._request("GET", path, headers, data)
+
+    def post(self, path, headers=None, data=None):
+        """
+        Performs an HTTP POST request against the LaunchKey API through the local proxy
+        :param path: Path or endpoint that will be hit
+        :param headers: Headers to add onto the request
+        :param data: String or bytes to send in the body of the request.
+        :return:
+        """
+        return self._request("POST", path, headers, data)
+
+    def put(self, path, headers=None, data=None):
+        """
+        Performs an HTTP PUT request against the LaunchKey API through the local proxy
+        :param path: Path or endpoint that will be hit
+        :param headers: Headers to add onto the request
+        :param data: String or bytes to send in the body of the request.
+        :return:
+        """
+        return self._request("PUT", path, headers, data)
+
+    def delete(self, path, headers=None, data=None):
+        """
+        Performs an HTTP DELETE request against the LaunchKey API through the local proxy
+        :param path: Path or endpoint that will be hit
+        :param headers: Headers to add onto the request
+        :param data: String or bytes to send in the body of the request.
+        :return:
+        """
+        return self._request("DELETE", path, headers, data)
+
+    def patch(self, path, headers=None, data=None):
+        """
+        Performs an HTTP PATCH request against the LaunchKey API through the local proxy
+        :param path: Path or endpoint that will be hit
+        :param headers: Headers to add onto the request
+        :param data: String or bytes to send in the body of the request.
+        :return:
+        """
+        return self._request("PATCH", path, headers, data)
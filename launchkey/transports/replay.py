@@ -0,0 +1,233 @@
+from launchkey.utils import ForkDetector
+from hashlib import sha256
+from time import time
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class _ReplayShard(object):
+    """JWT IDs of one shard of a ReplayCache, grouped in buckets by the time they expire"""
+
+    def __init__(self, max_entries, bucket_seconds):
+        self.max_entries = max_entries
+        self.bucket_seconds = bucket_seconds
+        # JWT ID to the bucket it is in
+        self._seen = {}
+        # Bucket to the list of its JWT IDs
+        self._buckets = {}
+        self._current = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def contains(self, jti, now):
+        with self._lock:
+            self._expire(now)
+            return jti in self._seen
+
+    def add(self, jti, expires, now):
+        with self._lock:
+            self._expire(now)
+            if jti in self._seen:
+                return False
+            bucket = int(expires // self.bucket_seconds)
+            if bucket < self._current:
+                # The JWT is expired and would be rejected anyway
+                return True
+            while len(self._seen) >= self.max_entries:
+                self._drop(min(self._buckets))
+            self._seen[jti] = bucket
+            self._buckets.setdefault(bucket, []).append(jti)
+            return True
+
+    def _expire(self, now):
+        """Drops the buckets which expired, once per bucket period. It must be called holding the lock."""
+        current = int(now // self.bucket_seconds)
+        if current == self._current:
+            return
+        self._current = current
+        for bucket in [bucket for bucket in self._buckets if bucket < current]:
+            self._drop(bucket)
+
+    def _drop(self, bucket):
+        for jti in self._buckets.pop(bucket):
+            del self._seen[jti]
+
+
+class ReplayCache(object):
+    """
+    Remembers the JWT IDs of the webhooks received by launchkey.clients.ServiceClient.handle_webhook until their JWT
+    expires, so that duplicate deliveries and replays of captured webhooks are dropped before they are decrypted.
+
+    IDs are spread over shards, each with its own lock, so that threads rarely wait for each other. Within a shard, IDs
+    are grouped in buckets by the time their JWT expires, and a whole bucket is dropped once it expired. Memory is
+    bounded: when a shard is full, its bucket expiring first is dropped early.
+    """
+
+    def __init__(self, max_entries=100000, shards=16, bucket_seconds=5):
+        """
+        :param max_entries: Maximum number of JWT IDs remembered
+        :param shards: Number of shards
+        :param bucket_seconds: Width of the time buckets in seconds. IDs are remembered up to this much longer than
+        needed.
+        """
+        self.max_entries = max_entries
+        self._shards = [_ReplayShard(max(max_entries // shards, 1), bucket_seconds) for _ in range(shards)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard(self, jti):
+        return self._shards[hash(jti) % len(self._shards)]
+
+    def __contains__(self, jti):
+        """Whether a JWT ID was added and has not expired yet"""
+        return self._shard(jti).contains(jti, time())
+
+    def add(self, jti, expires):
+        """
+        Remembers a JWT ID unless it was already added
+        :param jti: JWT ID
+        :param expires: Unix timestamp after which the JWT is rejected, and the ID no longer needs to be remembered
+        :return: Boolean - Whether the ID was not added before, meaning the JWT is not a replay
+        """
+        return self._shard(jti).add(jti, expires, time())
+
+
+class SharedMemoryReplayCache(object):
+    """
+    ReplayCache shared by every process on a host through a memory mapped file, so that a webhook replayed to another
+    worker is dropped as well.
+
+    The file holds a fixed number of slots, each with a digest of a JWT ID and the time it expires, split in shards.
+    An ID is stored in one of a few slots of its shard, replacing an expired one or, when none is, the one expiring
+    first. Each shard is locked separately, with a thread lock and a lock on its range of the file.
+    """
+
+    _SLOT = struct.Struct("=16sd")
+    _PROBES = 8
+
+    def __init__(self, path, slots=65536, shards=64):
+        """
+        :param path: Path of the file backing the slots. It is created with mode 0600 if it does not exist. Every
+        process sharing the cache must use the same path, number of slots, and number of shards.
+        :param slots: Maximum number of JWT IDs remembered
+        :param shards: Number of shards
+        """
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryReplayCache requires a platform supporting fcntl")
+        self.path = path
+        self.slots = slots
+        self.shards = shards
+        self._shard_slots = max(slots // shards, self._PROBES)
+        self._size = self._shard_slots * shards * self._SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self._size:
+                os.ftruncate(self._fd, self._size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._mmap = mmap.mmap(self._fd, self._size)
+        self._thread_locks = [threading.Lock() for _ in range(shards)]
+        self._fork_detector = ForkDetector()
+
+    def __getstate__(self):
+        return {"path": self.path, "slots": self.slots, "shards": self.shards}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["slots"], state["shards"])
+
+    def close(self):
+        """Unmaps the slots and closes the file"""
+        self._mmap.close()
+        os.close(self._fd)
+
+    def __contains__(self, jti):
+        """Whether a JWT ID was added and has not expired yet"""
+        digest, shard, first = self._locate(jti)
+        now = time()
+        with self._locked(shard):
+            return self._find(digest, shard, first, now)[0] is not None
+
+    def add(self, jti, expires):
+        """
+        Remembers a JWT ID unless it was already added
+        :param jti: JWT ID
+        :param expires: Unix timestamp after which the JWT is rejected, and the ID no longer needs to be remembered
+        :return: Boolean - Whether the ID was not added before, meaning the JWT is not a replay
+        """
+        digest, shard, first = self._locate(jti)
+        now = time()
+        if expires <= now:
+            # The JWT is expired and would be rejected anyway
+            return True
+        with self._locked(shard):
+            found, free = self._find(digest, shard, first, now)
+            if found is not None:
+                return False
+            self._SLOT.pack_into(self._mmap, free * self._SLOT.size, digest, expires)
+            return True
+
+    def _locate(self, jti):
+        """Returns the digest of a JWT ID, its shard, and the first slot it may be stored in"""
+        digest = sha256(jti.encode("utf-8")).digest()[:16]
+        position = struct.unpack_from("=Q", digest)[0]
+        shard = position % self.shards
+        return digest, shard, shard * self._shard_slots + (position // self.shards) % self._shard_slots
+
+    def _find(self, digest, shard, first, now):
+        """
+        Looks for a digest in the slots it may be stored in. It must be called holding the lock of the shard.
+        :return: Tuple of the slot holding the unexpired digest or None, and the slot to store it in otherwise
+        """
+        start = shard * self._shard_slots
+        free, free_expires = None, None
+        for probe in range(self._PROBES):
+            slot = start + (first - start + probe) % self._shard_slots
+            stored, expires = self._SLOT.unpack_from(self._mmap, slot * self._SLOT.size)
+            if expires > now and stored == digest:
+                return slot, None
+            # Empty and expired slots expire first, so they are replaced before any other
+            if free is None or expires < free_expires:
+                free, free_expires = slot, expires
+        return None, free
+
+    def _locked(self, shard):
+        if self._fork_detector.forked():
+            # Thread locks held by other threads of the parent would never be released. File locks are not inherited.
+            self._thread_locks = [threading.Lock() for _ in range(self.shards)]
+        return _ShardLock(self._thread_locks[shard], self._fd, shard * self._shard_slots * self._SLOT.size,
+                          self._shard_slots * self._SLOT.size)
+
+
+class _ShardLock(object):
+    """Context manager locking a shard against the other threads and processes"""
+
+    def __init__(self, thread_lock, fd, start, length):
+        self._thread_lock = thread_lock
+        self._fd = fd
+        self._start = start
+        self._length = length
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._length, self._start)
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self._length, self._start)
+        finally:
+            self._thread_lock.release()
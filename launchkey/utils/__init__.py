@@ -1,5 +1,8 @@
 from launchkey.exceptions import InvalidIssuerFormat, InvalidIssuerVersion
 from uuid import UUID
+import errno
+import os
+import stat
 
 
 class UUIDHelper(object):
@@ -35,3 +38,40 @@ def iso_format(datetime):
     :return: ISO formatted string IE: 2017-10-03T22:50:15Z
     """
     return datetime.strftime("%Y-%m-%dT%H:%M:%SZ") if datetime is not None else None
+
+
+def remove_stale_socket(path):
+    """
+    Removes the Unix domain socket file left at a path by a server which did not close, so that a new server can bind it
+    :param path: Path of the socket
+    :raise: OSError - Something other than a socket exists at the path. It is left in place.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, "Not a socket, refusing to replace it", path)
+    os.unlink(path)
+
+
+class ForkDetector(object):
+    """
+    Detects that the current process was forked from the one which created or last checked the detector, so that the
+    sockets and locks inherited from the parent process can be replaced.
+    """
+
+    def __init__(self):
+        self._pid = os.getpid()
+
+    def forked(self):
+        """
+        :return: Boolean - Whether the process changed since the previous call
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return False
+        self._pid = pid
+        return True
@@ -0,0 +1,2 @@
+from .base import BaseWebhookApp
+from .wsgi import WSGIWebhookApp
@@ -0,0 +1,109 @@
+"""ASGI application handling webhooks. It requires Python 3.5 or later and is therefore not imported by the package."""
+from .base import BaseWebhookApp, _iscoroutinefunction
+import asyncio
+
+# Returned instead of the body of a request whose client disconnected before sending all of it
+_DISCONNECTED = object()
+
+
+class ASGIWebhookApp(BaseWebhookApp):
+    """
+    ASGI 3 application handling the webhooks of a Service, to mount at the webhook URL configured for it. See
+    launchkey.webhooks.BaseWebhookApp for the handlers and the responses.
+
+    handle_webhook and the handlers which are not coroutine functions run in the executor, so that verification and
+    decryption never block the event loop. Coroutine function handlers are awaited on the event loop afterwards.
+    The body is joined only when it arrives in several messages, and reading stops as soon as it exceeds the maximum.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, [(b"allow", b"POST")])
+            return
+        request_headers = dict(scope["headers"])
+        try:
+            content_length = int(request_headers.get(b"content-length", b""))
+        except ValueError:
+            content_length = None
+        if content_length is not None and self._too_large(content_length):
+            await self._respond(send, 413)
+            return
+        if not self._acquire():
+            await self._respond(send, 503, [(b"retry-after", str(self.retry_after).encode("ascii"))])
+            return
+        try:
+            body = await self._read_body(receive)
+            if body is _DISCONNECTED:
+                # Nobody is left to answer, so the partial body is neither verified nor handled
+                return
+            if body is None:
+                await self._respond(send, 413)
+                return
+            status, package = await asyncio.wrap_future(self.executor.submit(self._handle, body,
+                                                                             self._headers(request_headers)))
+            if package is not None:
+                status = await self._run_coroutine_handlers(package)
+        finally:
+            self._release()
+        await self._respond(send, status)
+
+    async def _read_body(self, receive):
+        """
+        :return: The body as bytes, None if it is larger than the maximum, or _DISCONNECTED if the client disconnected
+        before sending all of it
+        """
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return _DISCONNECTED
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if self._too_large(size):
+                return None
+            if not chunks and not message.get("more_body", False):
+                # A body received in one message is used as it is
+                return chunk
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    async def _run_coroutine_handlers(self, package):
+        try:
+            for handler in self.handlers_for(package):
+                if _iscoroutinefunction(handler):
+                    await handler(package)
+        except Exception:
+            return 500
+        return 200
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    def _headers(request_headers):
+        """Returns the headers handle_webhook reads from the ASGI scope"""
+        headers = {}
+        if b"x-iov-jwt" in request_headers:
+            headers["X-IOV-JWT"] = request_headers[b"x-iov-jwt"].decode("latin-1")
+        if b"content-type" in request_headers:
+            headers["Content-Type"] = request_headers[b"content-type"].decode("latin-1")
+        return headers
+
+    @staticmethod
+    async def _respond(send, status, headers=None):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"text/plain"), (b"content-length", b"0")] + (headers or [])})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,121 @@
+from launchkey.exceptions import LaunchKeyAPIException, WebhookBodyTooLarge, JWTReplayed
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import threading
+
+# Python 2 has no coroutine functions
+_iscoroutinefunction = getattr(inspect, "iscoroutinefunction", lambda function: False)
+
+# Status lines of the responses the webhook apps send
+STATUS_LINES = {
+    200: "200 OK",
+    400: "400 Bad Request",
+    405: "405 Method Not Allowed",
+    409: "409 Conflict",
+    411: "411 Length Required",
+    413: "413 Payload Too Large",
+    500: "500 Internal Server Error",
+    503: "503 Service Unavailable",
+}
+
+
+class BaseWebhookApp(object):
+    """
+    Glue between a web server and launchkey.clients.ServiceClient.handle_webhook shared by the WSGI and ASGI apps.
+    Webhooks are handled by a bounded pool of threads, and requests arriving while every worker is busy and the queue is
+    full are answered right away with a 503 and a Retry-After header rather than queued without limit. The packages
+    returned by handle_webhook are then passed to the handlers registered for their class.
+
+    Responses are 200 once the handlers returned, 413 for bodies larger than the service client's
+    max_webhook_body_size, 409 for replays dropped by its webhook_replay_cache, 400 for other invalid webhooks, and 500
+    when handling failed otherwise, such as when the API public keys could not be fetched or a handler raised, so that
+    the webhook is sent again.
+    """
+
+    def __init__(self, service_client, executor=None, max_workers=4, max_pending=None, retry_after=1):
+        """
+        :param service_client: launchkey.clients.ServiceClient, or daemon ServiceClient, handling the webhooks
+        :param executor: concurrent.futures.Executor running handle_webhook and the handlers. It must run them in this
+        process, like a ThreadPoolExecutor. By default a ThreadPoolExecutor with max_workers threads is created.
+        :param max_workers: Number of threads of the created executor
+        :param max_pending: Maximum number of webhooks being handled or waiting for a worker. Defaults to twice
+        max_workers.
+        :param retry_after: Seconds sent in the Retry-After header of 503 responses
+        """
+        self.service_client = service_client
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending if max_pending is not None else 2 * max_workers
+        self.retry_after = retry_after
+        self._handlers = []
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+
+    @property
+    def max_body_size(self):
+        """Maximum size of the bodies read, from the service client's max_webhook_body_size"""
+        return getattr(self.service_client, "max_webhook_body_size", None)
+
+    def add_handler(self, package_class, handler):
+        """
+        Registers a handler for the webhooks of a class
+        :param package_class: launchkey.entities.service.AuthorizationResponse or
+        launchkey.entities.service.SessionEndRequest
+        :param handler: Callable receiving the package. For the ASGI app, it may also be a coroutine function.
+        """
+        self._handlers.append((package_class, handler))
+
+    def handlers_for(self, package):
+        """
+        :param package: Package returned by handle_webhook
+        :return: List of the handlers registered for the class of the package, in the order they were added
+        """
+        return [handler for package_class, handler in self._handlers if isinstance(package, package_class)]
+
+    def _handle(self, body, headers):
+        """
+        Handles a webhook and passes its package to the handlers which are not coroutine functions. It runs in the
+        executor.
+        :return: Tuple of the status of the response and the package, or None if handling failed
+        """
+        try:
+            package = self.service_client.handle_webhook(body, headers)
+        except Exception as e:
+            return self._status_for(e), None
+        try:
+            for handler in self.handlers_for(package):
+                if not _iscoroutinefunction(handler):
+                    handler(package)
+        except Exception:
+            return 500, None
+        return 200, package
+
+    def shutdown(self, wait=True):
+        """
+        Shuts the executor down
+        :param wait: Whether to wait for the webhooks being handled
+        """
+        self.executor.shutdown(wait=wait)
+
+    def _acquire(self):
+        """
+        Takes a slot for a webhook without waiting
+        :return: Boolean - Whether a slot was free. If so, _release() must be called once the webhook was handled.
+        """
+        return self._pending.acquire(False)
+
+    def _release(self):
+        self._pending.release()
+
+    def _too_large(self, content_length):
+        max_body_size = self.max_body_size
+        return max_body_size is not None and content_length > max_body_size
+
+    @staticmethod
+    def _status_for(exception):
+        """Returns the status of the response to a webhook for which an exception was raised"""
+        if isinstance(exception, WebhookBodyTooLarge):
+            return 413
+        if isinstance(exception, JWTReplayed):
+            return 409
+        if isinstance(exception, LaunchKeyAPIException):
+            return 400
+        return 500
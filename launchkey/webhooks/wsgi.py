@@ -0,0 +1,49 @@
+from .base import BaseWebhookApp, STATUS_LINES
+
+
+class WSGIWebhookApp(BaseWebhookApp):
+    """
+    WSGI application handling the webhooks of a Service, to mount at the webhook URL configured for it. See
+    launchkey.webhooks.BaseWebhookApp for the handlers and the responses.
+
+    The body is read once, with the length announced by the request, and passed to handle_webhook as bytes. Requests
+    announcing a body larger than the maximum are answered without reading it, as are requests arriving while every
+    worker is busy.
+    """
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") != "POST":
+            return self._respond(start_response, 405, [("Allow", "POST")])
+        try:
+            content_length = int(environ.get("CONTENT_LENGTH") or "")
+        except ValueError:
+            return self._respond(start_response, 411)
+        if self._too_large(content_length):
+            return self._respond(start_response, 413)
+        if not self._acquire():
+            return self._respond(start_response, 503, [("Retry-After", str(self.retry_after))])
+        try:
+            body = environ["wsgi.input"].read(content_length) if content_length > 0 else b""
+            # The server thread waits for the executor rather than handling the webhook itself, so that at most
+            # max_workers webhooks are verified and decrypted at once whatever the number of server threads, and the
+            # others wait in the executor's queue until max_pending is reached
+            status, _ = self.executor.submit(self._handle, body, self._headers(environ)).result()
+        finally:
+            self._release()
+        return self._respond(start_response, status)
+
+    @staticmethod
+    def _headers(environ):
+        """Returns the headers handle_webhook reads from the WSGI environment"""
+        headers = {}
+        if "HTTP_X_IOV_JWT" in environ:
+            headers["X-IOV-JWT"] = environ["HTTP_X_IOV_JWT"]
+        if "CONTENT_TYPE" in environ:
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        return headers
+
+    @staticmethod
+    def _respond(start_response, status, headers=None):
+        start_response(STATUS_LINES[status], [("Content-Type", "text/plain"), ("Content-Length", "0")] +
+                       (headers or []))
+        return [b""]
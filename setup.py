@@ -1,5 +1,7 @@
 import os
+import sys
 from setuptools import setup
+from setuptools.command.build_py import build_py
 from launchkey import SDK_VERSION
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -13,9 +15,22 @@ requires = [
     'python-dateutil >= 2.4.2, < 3.0.0',
     'formencode >= 1.3.1, < 2.0.0',
     'pyjwkest >= 1.3.2, < 2.0.0',
-    'pytz==2017.2'
+    'pytz==2017.2',
+    'futures >= 3.0.0, < 4.0.0; python_version < "3.0"'
     ]
 
+
+class BuildPy(build_py):
+    """Leaves out the modules using syntax the interpreter does not support, so that they are not byte-compiled"""
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 5):
+            # async def is a SyntaxError before Python 3.5
+            modules = [module for module in modules if (module[0], module[1]) != ('launchkey.webhooks', 'asgi')]
+        return modules
+
+
 setup(name='launchkey',
       version=SDK_VERSION,
       description='LaunchKey Python SDK',
@@ -35,13 +50,18 @@ setup(name='launchkey',
       packages=[
           'launchkey',
           'launchkey.clients',
+          'launchkey.daemon',
           'launchkey.entities',
           'launchkey.exceptions',
           'launchkey.factories',
+          'launchkey.polling',
+          'launchkey.sessions',
           'launchkey.transports',
-          'launchkey.utils'
+          'launchkey.utils',
+          'launchkey.webhooks'
       ],
       zip_safe=False,
+      cmdclass={'build_py': BuildPy},
       test_suite='tests',
       install_requires=requires,
       tests_require=[
@@ -1,5 +1,6 @@
 import unittest
-from mock import MagicMock, ANY
+from ddt import ddt, data, unpack
+from mock import MagicMock, ANY, patch
 from launchkey.transports.base import APIResponse, APIErrorResponse
 
 
@@ -24,3 +25,53 @@ class TestAPIResponses(unittest.TestCase):
 
     def test_error_response_type(self):
         self.assertIsInstance(APIErrorResponse(ANY, ANY, ANY), APIResponse)
+
+
+@ddt
+class TestAPIResponseFromContent(unittest.TestCase):
+
+    @data(
+        ({"Content-Type": "application/json"}, b'{"a": "b"}', {"a": "b"}),
+        ({"Content-Type": "application/json; charset=utf-8"}, b'{"a": "b"}', {"a": "b"}),
+        ({"content-type": "application/problem+json"}, b'{"a": "b"}', {"a": "b"}),
+        ({"Content-Type": "application/json"}, b'a.b.c.d.e', 'a.b.c.d.e'),
+        ({"Content-Type": "application/json"}, b'', ''),
+        ({"Content-Type": "application/jwe"}, b'{"a": "b"}', '{"a": "b"}'),
+        ({"Content-Type": "application/jwt"}, b'{"a": "b"}', '{"a": "b"}'),
+        ({"Content-Type": "text/plain"}, b'{"error_code": "SVC-002"}', {"error_code": "SVC-002"}),
+        ({"Content-Type": "text/html"}, b'<html></html>', '<html></html>'),
+        ({"Content-Type": ""}, b'{"a": "b"}', {"a": "b"}),
+        ({"Content-Type": "text/plain; charset=latin-1"}, b'caf\xe9', u'caf\xe9'),
+        ({"Content-Type": "text/plain; charset=unknown"}, b'abc', 'abc'),
+        ({}, b'{"a": "b"}', {"a": "b"}),
+        ({}, b'a.b.c.d.e', 'a.b.c.d.e'),
+        (None, b'[1]', [1]),
+    )
+    @unpack
+    def test_data_decoded_by_content_type(self, headers, content, expected):
+        self.assertEqual(APIResponse.from_content(content, headers, 200).data, expected)
+
+    def test_content_kept(self):
+        response = APIResponse.from_content(b'a.b.c.d.e', {}, 200)
+        self.assertEqual(response.content, b'a.b.c.d.e')
+
+    def test_data_decoded_once_on_access(self):
+        with patch("launchkey.transports.base.json") as json_patch:
+            response = APIResponse.from_content(b'{}', {"Content-Type": "application/json"}, 200)
+            json_patch.loads.assert_not_called()
+            self.assertEqual(response.data, json_patch.loads.return_value)
+            self.assertEqual(response.data, json_patch.loads.return_value)
+        json_patch.loads.assert_called_once_with('{}')
+
+    def test_data_set(self):
+        response = APIResponse.from_content(b'a.b.c.d.e', {}, 200)
+        response.data = {"a": "b"}
+        self.assertEqual(response.data, {"a": "b"})
+
+    def test_error_response(self):
+        response = APIErrorResponse.from_content(b'{"a": "b"}', {}, 400, "Bad Request")
+        self.assertIsInstance(response, APIErrorResponse)
+        self.assertEqual(response.reason, "Bad Request")
+
+    def test_content_of_decoded_response_is_none(self):
+        self.assertIsNone(APIResponse({"a": "b"}, {}, 200).content)
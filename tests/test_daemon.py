@@ -0,0 +1,136 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import pickle
+from mock import MagicMock
+from uuid import uuid4
+from launchkey.daemon import DaemonFactory, LaunchKeyDaemon
+from launchkey.daemon.client import RemoteServiceClient, RemoteDirectoryClient, RemoteOrganizationClient
+from launchkey.exceptions import DaemonConnectionError, EntityNotFound
+from launchkey.factories import ServiceFactory
+
+
+class TestLaunchKeyDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._socket_path = os.path.join(self._directory, "launchkey.sock")
+        self._factory = MagicMock(spec=ServiceFactory)
+        self._client = self._factory.make_service_client.return_value
+        self._client.session_end.return_value = None
+        self._client.handle_webhook.return_value = None
+        self._daemon = LaunchKeyDaemon(self._factory, self._socket_path)
+        self._thread = threading.Thread(target=self._daemon.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._remote_factory = DaemonFactory(self._socket_path, timeout=5)
+
+    def tearDown(self):
+        self._daemon.shutdown()
+        self._daemon.server_close()
+        shutil.rmtree(self._directory)
+
+    def test_socket_mode(self):
+        self.assertEqual(os.stat(self._socket_path).st_mode & 0o777, 0o600)
+
+    def test_stale_socket_replaced(self):
+        self._daemon.shutdown()
+        self._daemon.socket.close()
+        self._daemon = LaunchKeyDaemon(self._factory, self._socket_path)
+        self._thread = threading.Thread(target=self._daemon.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self.assertIsNone(self._remote_factory.make_service_client().session_end("user"))
+
+    def test_regular_file_not_replaced(self):
+        path = os.path.join(self._directory, "launchkey.conf")
+        with open(path, "w") as f:
+            f.write("data")
+        with self.assertRaises(OSError):
+            LaunchKeyDaemon(self._factory, path)
+        self.assertTrue(os.path.isfile(path))
+
+    def test_call_forwarded(self):
+        self._client.authorize.return_value = "auth-request-id"
+        client = self._remote_factory.make_service_client()
+        self.assertEqual(client.authorize("user", context="context"), "auth-request-id")
+        self._factory.make_service_client.assert_called_once_with()
+        self._client.authorize.assert_called_once_with("user", context="context")
+
+    def test_connection_reused(self):
+        client = self._remote_factory.make_service_client()
+        client.session_end("user")
+        sock = self._remote_factory._connection._local.sock
+        client.session_end("user")
+        self.assertIs(self._remote_factory._connection._local.sock, sock)
+
+    def test_subject_id_forwarded(self):
+        service_id = uuid4()
+        self._remote_factory.make_service_client(service_id).session_end("user")
+        self._factory.make_service_client.assert_called_once_with(str(service_id))
+
+    def test_api_exception_reraised(self):
+        self._client.session_end.side_effect = EntityNotFound("Not found", 404, "Not Found")
+        with self.assertRaises(EntityNotFound) as context:
+            self._remote_factory.make_service_client().session_end("user")
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(context.exception.reason, "Not Found")
+
+    def test_handle_webhook_headers_converted(self):
+        headers = MagicMock()
+        headers.keys.return_value = ["X-IOV-JWT"]
+        headers.__getitem__.return_value = "x.y.z"
+        self._remote_factory.make_service_client().handle_webhook("body", headers)
+        self._client.handle_webhook.assert_called_once_with("body", {"X-IOV-JWT": "x.y.z"})
+
+    def test_unavailable_client_type(self):
+        with self.assertRaises(AttributeError):
+            self._remote_factory.make_organization_client().get_services()
+
+    def test_private_method_refused(self):
+        with self.assertRaises(AttributeError):
+            self._remote_factory.make_service_client()._call("_validate_response", None, None)
+
+    def test_unserializable_result(self):
+        self._client.authorize.return_value = threading.Lock()
+        with self.assertRaises(RuntimeError):
+            self._remote_factory.make_service_client().authorize("user")
+
+    def test_closed_connection_reconnects(self):
+        client = self._remote_factory.make_service_client()
+        client.session_end("user")
+        self._remote_factory._connection._local.sock.close()
+        client.session_end("user")
+        self.assertEqual(self._client.session_end.call_count, 2)
+
+
+class TestRemoteClients(unittest.TestCase):
+
+    def setUp(self):
+        self._connection = MagicMock()
+
+    def test_unknown_method(self):
+        with self.assertRaises(AttributeError):
+            RemoteServiceClient(self._connection).not_a_method()
+
+    def test_directory_client_methods(self):
+        RemoteDirectoryClient(self._connection, "id").link_device("user")
+        self._connection.call.assert_called_once_with("directory", "id", "link_device", ("user",), {})
+
+    def test_organization_client_methods(self):
+        RemoteOrganizationClient(self._connection).get_all_directories()
+        self._connection.call.assert_called_once_with("organization", None, "get_all_directories", (), {})
+
+    def test_missing_daemon(self):
+        with self.assertRaises(DaemonConnectionError):
+            DaemonFactory(os.path.join(tempfile.gettempdir(), str(uuid4()))).make_service_client().session_end("u")
+
+    def test_pickled_factory_connects_again(self):
+        factory = DaemonFactory("/tmp/launchkey.sock", timeout=5)
+        factory._connection._local.sock = MagicMock()
+        factory = pickle.loads(pickle.dumps(factory))
+        self.assertEqual(factory._connection.socket_path, "/tmp/launchkey.sock")
+        self.assertEqual(factory._connection.timeout, 5)
+        self.assertIsNone(getattr(factory._connection._local, "sock", None))
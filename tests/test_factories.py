@@ -1,11 +1,19 @@
 import unittest
 from mock import MagicMock, ANY
 from launchkey.factories.base import BaseFactory
-from launchkey.factories import DirectoryFactory, OrganizationFactory, ServiceFactory
+from launchkey.factories import DirectoryFactory, OrganizationFactory, ServiceFactory, FactoryRegistry
 from launchkey.clients import DirectoryClient, OrganizationClient, ServiceClient
 from launchkey.transports import JOSETransport
+from launchkey.exceptions import InvalidEntityID
+from launchkey.transports.base import APIResponse
+from .test_jose_auth_transport import valid_private_key
+from Crypto.PublicKey import RSA
+from time import time
 from uuid import uuid1, uuid4
 from ddt import ddt, data
+import gc
+import threading
+import pickle
 
 
 @ddt
@@ -26,6 +34,66 @@ class TestBaseFactory(unittest.TestCase):
         BaseFactory(ANY, str(entity_id), ANY, ANY, ANY, MagicMock(spec=JOSETransport))
 
 
+class TestWatchedPrivateKeys(unittest.TestCase):
+
+    def test_watch_private_keys_uses_transport(self):
+        transport = MagicMock()
+        factory = ServiceFactory(uuid1(), ANY, transport=transport)
+        factory.watch_private_keys("/keys", 30)
+        transport.watch_issuer_keys.assert_called_once_with("/keys", 30)
+
+
+class TestFactoryPickling(unittest.TestCase):
+
+    def test_factory_pickled_with_keys(self):
+        factory = ServiceFactory(uuid1(), valid_private_key)
+        factory.make_service_client()
+        factory = pickle.loads(pickle.dumps(factory))
+        self.assertEqual(factory._clients, {})
+        self.assertIsInstance(factory.make_service_client(), ServiceClient)
+        self.assertEqual(len(factory._transport.issuer_private_keys), 1)
+
+    def test_registry_pickled_with_factories(self):
+        registry = FactoryRegistry()
+        organization_id = uuid1()
+        registry.get_organization_factory(organization_id, valid_private_key)
+        registry.get_service_factory(uuid1(), valid_private_key)
+        registry = pickle.loads(pickle.dumps(registry))
+        self.assertEqual(len(registry), 2)
+        factory = registry.get_organization_factory(organization_id, valid_private_key)
+        self.assertIs(factory._transport._resources, registry._transport._resources)
+
+
+    def test_factory_pickled_without_keys_of_other_factories(self):
+        registry = FactoryRegistry()
+        keys = [RSA.generate(1024).exportKey().decode("utf-8") for _ in range(3)]
+        factories = [registry.get_service_factory(uuid1(), key) for key in keys]
+        factory = pickle.loads(pickle.dumps(factories[0]))
+        self.assertEqual([key.kid for key in factory._transport.issuer_private_keys],
+                         [key.kid for key in factories[0]._transport.issuer_private_keys])
+        self.assertEqual(len(factory._transport._resources.issuer_keys), 1)
+
+
+class TestLazyFactories(unittest.TestCase):
+
+    def test_lazy_keys(self):
+        transport = MagicMock(spec=JOSETransport)
+        factory = ServiceFactory(uuid1(), ANY, transport=transport, lazy=True)
+        transport.set_issuer.assert_called_once_with('svc', ANY, ANY, lazy=True)
+        factory.add_additional_private_key(ANY)
+        transport.add_issuer_key.assert_called_once_with(ANY, lazy=True)
+
+    def test_lazy_key_parsed_on_first_use(self):
+        factory = DirectoryFactory(uuid1(), valid_private_key, lazy=True)
+        self.assertEqual(len(factory._transport._pending_issuer_keys), 1)
+        self.assertEqual(len(factory._transport.issuer_private_keys), 1)
+        self.assertEqual(len(factory._transport._pending_issuer_keys), 0)
+
+    def test_lazy_registry(self):
+        factory = FactoryRegistry(lazy=True).get_organization_factory(uuid1(), valid_private_key)
+        self.assertEqual(len(factory._transport._pending_issuer_keys), 1)
+
+
 class TestDirectoryFactory(unittest.TestCase):
 
     def setUp(self):
@@ -60,3 +128,107 @@ class TestOrganizationFactory(unittest.TestCase):
 
     def test_make_service_client(self):
         self.assertIsInstance(self._factory.make_service_client(uuid1()), ServiceClient)
+
+    def test_make_organization_client_is_memoized(self):
+        self.assertIs(self._factory.make_organization_client(), self._factory.make_organization_client())
+
+    def test_make_service_client_is_memoized_per_service(self):
+        service_id = uuid1()
+        client = self._factory.make_service_client(service_id)
+        self.assertIs(self._factory.make_service_client(service_id), client)
+        self.assertIs(self._factory.make_service_client(str(service_id)), client)
+        self.assertIsNot(self._factory.make_service_client(uuid1()), client)
+
+    def test_make_directory_and_service_clients_for_same_id_differ(self):
+        subject_id = uuid1()
+        self.assertIsInstance(self._factory.make_directory_client(subject_id), DirectoryClient)
+        self.assertIsInstance(self._factory.make_service_client(subject_id), ServiceClient)
+
+    def test_invalid_subject_id_is_not_memoized(self):
+        with self.assertRaises(InvalidEntityID):
+            self._factory.make_service_client("invalid")
+        self.assertEqual(len(self._factory._clients), 0)
+
+    def test_concurrent_make_client_returns_one_instance(self):
+        service_id = uuid1()
+        clients = []
+
+        def make():
+            clients.append(self._factory.make_service_client(service_id))
+        threads = [threading.Thread(target=make) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(id(client) for client in clients)), 1)
+
+
+class TestFactoryRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = JOSETransport(http_client=MagicMock())
+        self._registry = FactoryRegistry(transport=self._transport)
+
+    def test_factory_interned(self):
+        service_id = uuid4()
+        factory = self._registry.get_service_factory(service_id, valid_private_key)
+        self.assertIsInstance(factory, ServiceFactory)
+        self.assertIs(self._registry.get_service_factory(str(service_id), valid_private_key), factory)
+        self.assertEqual(len(self._registry), 1)
+
+    def test_factory_types(self):
+        entity_id = uuid4()
+        self.assertIsInstance(self._registry.get_directory_factory(entity_id, valid_private_key), DirectoryFactory)
+        self.assertIsInstance(self._registry.get_organization_factory(entity_id, valid_private_key),
+                              OrganizationFactory)
+        self.assertEqual(len(self._registry), 2)
+
+    def test_issuers_kept_separate(self):
+        first = self._registry.get_service_factory(uuid4(), valid_private_key)
+        second = self._registry.get_service_factory(uuid4(), valid_private_key)
+        self.assertNotEqual(first._transport.issuer, second._transport.issuer)
+        self.assertIsNot(first._transport, second._transport)
+
+    def test_resources_shared(self):
+        first = self._registry.get_service_factory(uuid4(), valid_private_key)
+        second = self._registry.get_directory_factory(uuid4(), valid_private_key)
+        self.assertIs(first._transport._http_client, second._transport._http_client)
+        self.assertIs(first._transport.issuer_private_keys[0], second._transport.issuer_private_keys[0])
+        first._transport._server_time_difference = 5, time()
+        self.assertEqual(second._transport.server_time_difference, 5)
+
+    def test_api_public_keys_fetched_once(self):
+        self._transport._http_client.get.return_value = APIResponse(
+            valid_private_key, {"X-IOV-KEY-ID": "kid"}, 200)
+        first = self._registry.get_service_factory(uuid4(), valid_private_key)
+        second = self._registry.get_service_factory(uuid4(), valid_private_key)
+        self.assertIs(first._transport.api_public_keys, second._transport.api_public_keys)
+        self._transport._http_client.get.assert_called_once()
+
+    def test_new_key_added_once(self):
+        service_id = uuid4()
+        factory = self._registry.get_service_factory(service_id, valid_private_key)
+        factory.add_additional_private_key = MagicMock()
+        self._registry.get_service_factory(service_id, valid_private_key)
+        factory.add_additional_private_key.assert_not_called()
+        self._registry.get_service_factory(service_id, "other key")
+        self._registry.get_service_factory(service_id, "other key")
+        factory.add_additional_private_key.assert_called_once_with("other key")
+
+    def test_remove(self):
+        service_id = uuid4()
+        factory = self._registry.get_service_factory(service_id, valid_private_key)
+        self._registry.remove(service_id)
+        self.assertEqual(len(self._registry), 0)
+        self.assertIsNot(self._registry.get_service_factory(service_id, valid_private_key), factory)
+
+    def test_removed_factory_keys_forgotten(self):
+        service_id = uuid4()
+        self._registry.get_service_factory(service_id, valid_private_key).make_service_client()
+        self.assertEqual(len(self._transport._resources.issuer_keys), 1)
+        self._registry.remove(service_id)
+        gc.collect()
+        self.assertEqual(len(self._transport._resources.issuer_keys), 0)
+
+    def test_default_transport_pooled(self):
+        self.assertTrue(FactoryRegistry()._transport._http_client.pooled)
@@ -0,0 +1,200 @@
+import unittest
+import pickle
+import os
+import shutil
+import tempfile
+import socket
+import threading
+from mock import MagicMock, patch
+from requests.exceptions import HTTPError
+from six.moves import http_client, socketserver
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler
+from launchkey.transports import LocalProxyTransport
+from launchkey.transports.local_proxy import UnixHTTPConnection
+from launchkey.transports.base import APIResponse, APIErrorResponse
+from launchkey import LAUNCHKEY_PRODUCTION
+
+
+class TestLocalProxyTransportParseResponse(unittest.TestCase):
+
+    def test_parse_response_json_success(self):
+        response = LocalProxyTransport._parse_response(200, "OK", {}, b'{"a": "b"}')
+        self.assertIsInstance(response, APIResponse)
+        self.assertNotIsInstance(response, APIErrorResponse)
+        self.assertEqual(response.data, {"a": "b"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_parse_response_text_success(self):
+        response = LocalProxyTransport._parse_response(200, "OK", {}, b'a.b.c.d.e')
+        self.assertEqual(response.data, 'a.b.c.d.e')
+
+    def test_parse_response_400_failure(self):
+        response = LocalProxyTransport._parse_response(400, "Bad Request", {}, b'{"error_code": "ARG-001"}')
+        self.assertIsInstance(response, APIErrorResponse)
+        self.assertEqual(response.data, {"error_code": "ARG-001"})
+        self.assertEqual(response.reason, "Bad Request")
+
+    def test_parse_response_500_failure(self):
+        with self.assertRaises(HTTPError):
+            LocalProxyTransport._parse_response(500, "Internal Server Error", {}, b'')
+
+    def test_parse_response_500_failure_has_response(self):
+        with self.assertRaises(HTTPError) as context:
+            LocalProxyTransport._parse_response(503, "Service Unavailable", {"Retry-After": "1"}, b'busy')
+        self.assertEqual(context.exception.response.status_code, 503)
+        self.assertEqual(context.exception.response.content, b'busy')
+        self.assertEqual(context.exception.response.headers, {"Retry-After": "1"})
+
+
+class TestLocalProxyTransport(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = LocalProxyTransport(socket_path="/tmp/proxy.sock")
+        self._connection = MagicMock()
+        self._connection.getresponse.return_value.status = 200
+        self._connection.getresponse.return_value.read.return_value = b'{}'
+        self._connection.getresponse.return_value.will_close = False
+        self._connection.getresponse.return_value.getheaders.return_value = [("X-IOV-JWT", "x.y.z")]
+        self._transport._new_connection = MagicMock(return_value=self._connection)
+
+    def test_defaults(self):
+        self.assertEqual(self._transport.url, LAUNCHKEY_PRODUCTION)
+        self.assertIsInstance(LocalProxyTransport("/tmp/proxy.sock")._new_connection(), UnixHTTPConnection)
+        self.assertNotIsInstance(LocalProxyTransport()._new_connection(), UnixHTTPConnection)
+
+    def test_set_url(self):
+        self._transport.set_url("https://api.example.com/base", True)
+        self._transport.get("/public/v3/ping")
+        self._connection.request.assert_called_once_with("GET", "/base/public/v3/ping", body=None,
+                                                         headers={"Host": "api.example.com"})
+        self.assertTrue(self._transport.testing)
+
+    def test_get_query_string(self):
+        self._transport.get("/path", data={"a": "b"})
+        self._connection.request.assert_called_once_with("GET", "/path?a=b", body=None,
+                                                         headers={"Host": "api.launchkey.com"})
+
+    def test_headers_case_insensitive(self):
+        response = self._transport.get("/path")
+        self.assertEqual(response.headers.get("x-iov-jwt"), "x.y.z")
+
+    def test_post_encodes_body(self):
+        self._transport.post("/path", headers={"Authorization": "IOV-JWT x"}, data=u"a.b.c.d.e")
+        self._connection.request.assert_called_once_with(
+            "POST", "/path", body=b"a.b.c.d.e", headers={"Host": "api.launchkey.com", "Authorization": "IOV-JWT x"})
+
+    def test_methods(self):
+        for method in ("put", "delete", "patch"):
+            getattr(self._transport, method)("/path", data="body")
+            self.assertEqual(self._connection.request.call_args[0][0], method.upper())
+
+    def test_connection_reused(self):
+        self._transport.get("/path")
+        self._transport.get("/path")
+        self._transport._new_connection.assert_called_once()
+
+    @patch("launchkey.utils.os.getpid")
+    def test_connection_replaced_after_fork(self, getpid_patch):
+        getpid_patch.return_value = 1
+        self._transport = LocalProxyTransport(socket_path="/tmp/proxy.sock")
+        self._transport._new_connection = MagicMock(return_value=self._connection)
+        self._transport.get("/path")
+        getpid_patch.return_value = 2
+        self._transport.get("/path")
+        self.assertEqual(self._transport._new_connection.call_count, 2)
+        self._connection.close.assert_not_called()
+
+    def test_connection_dropped_when_closing(self):
+        self._connection.getresponse.return_value.will_close = True
+        self._transport.get("/path")
+        self._transport.get("/path")
+        self.assertEqual(self._transport._new_connection.call_count, 2)
+
+    def test_stale_connection_retried_once(self):
+        self._transport.get("/path")
+        self._connection.request.side_effect = [http_client.BadStatusLine(""), None]
+        self.assertIsInstance(self._transport.get("/path"), APIResponse)
+        self.assertEqual(self._transport._new_connection.call_count, 2)
+
+    def test_new_connection_failure_not_retried(self):
+        self._connection.request.side_effect = IOError()
+        with self.assertRaises(IOError):
+            self._transport.get("/path")
+        self._transport._new_connection.assert_called_once()
+
+    def test_stale_connection_without_response_retried_for_idempotent_methods(self):
+        self._transport.get("/path")
+        self._connection.getresponse.side_effect = [http_client.BadStatusLine(""),
+                                                    self._connection.getresponse.return_value]
+        self.assertIsInstance(self._transport.put("/path", data="body"), APIResponse)
+        self.assertEqual(self._connection.request.call_count, 3)
+
+    def test_post_without_response_not_retried(self):
+        self._transport.get("/path")
+        self._connection.getresponse.side_effect = http_client.BadStatusLine("")
+        with self.assertRaises(http_client.BadStatusLine):
+            self._transport.post("/path", data="body")
+        self.assertEqual(self._connection.request.call_count, 2)
+
+    def test_post_not_sent_retried(self):
+        self._transport.get("/path")
+        self._connection.request.side_effect = [IOError(), None]
+        self.assertIsInstance(self._transport.post("/path", data="body"), APIResponse)
+        self.assertEqual(self._connection.request.call_count, 3)
+
+    def test_timeout_not_retried(self):
+        self._transport.get("/path")
+        self._connection.getresponse.side_effect = socket.timeout()
+        with self.assertRaises(socket.timeout):
+            self._transport.get("/path")
+        self.assertEqual(self._connection.request.call_count, 2)
+
+    def test_pickled_without_connections(self):
+        self._transport.set_url("https://example.com/api", False)
+        self._transport.get("/path")
+        del self._transport._new_connection
+        transport = pickle.loads(pickle.dumps(self._transport))
+        self.assertEqual(transport.socket_path, "/tmp/proxy.sock")
+        self.assertEqual(transport.url, "https://example.com/api")
+        self.assertIsNone(getattr(transport._local, "connection", None))
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        response = ('{"host": "%s", "path": "%s", "body": "%s"}' %
+                    (self.headers.get("Host"), self.path, body.decode('utf-8'))).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLocalProxyTransportUnixSocket(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._socket_path = os.path.join(self._directory, "proxy.sock")
+        self._server = socketserver.UnixStreamServer(self._socket_path, _ProxyHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._directory)
+
+    def test_round_trip(self):
+        transport = LocalProxyTransport(socket_path=self._socket_path, timeout=5)
+        for _ in range(2):
+            response = transport.post("/service/v3/auths", data="a.b.c.d.e")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {"host": "api.launchkey.com", "path": "/service/v3/auths",
+                                             "body": "a.b.c.d.e"})
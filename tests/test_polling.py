@@ -0,0 +1,430 @@
+import unittest
+from mock import MagicMock, patch
+from requests.exceptions import ConnectionError
+from launchkey.exceptions import RequestTimedOut, RateLimited, EntityNotFound
+from launchkey.polling import AuthorizationPoller, BackoffSchedule, LearnedSchedule, AuthorizationDeduplicator
+from launchkey.polling.bulk import TokenBucket, run_bulk
+from time import time, sleep
+from ddt import ddt, data
+import threading
+
+
+class ImmediateSchedule(object):
+
+    def next_delay(self, attempts, elapsed):
+        return 0
+
+
+@ddt
+class TestBackoffSchedule(unittest.TestCase):
+
+    def test_first_delay(self):
+        self.assertEqual(BackoffSchedule(initial_delay=2, jitter=0).next_delay(0, 0), 2)
+
+    def test_delay_grows(self):
+        schedule = BackoffSchedule(initial_delay=2, multiplier=2, max_delay=100, jitter=0)
+        self.assertEqual([schedule.next_delay(attempts, 0) for attempts in range(4)], [2, 4, 8, 16])
+
+    @data(10, 100, 100000)
+    def test_delay_capped(self, attempts):
+        self.assertEqual(BackoffSchedule(max_delay=15, jitter=0).next_delay(attempts, 0), 15)
+
+    @patch("launchkey.polling.schedules.random.uniform")
+    def test_jitter(self, uniform_patch):
+        uniform_patch.return_value = 0.1
+        self.assertAlmostEqual(BackoffSchedule(initial_delay=2, jitter=0.1).next_delay(0, 0), 2.2)
+        uniform_patch.assert_called_once_with(-0.1, 0.1)
+
+
+class TestLearnedSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self._fallback = MagicMock()
+        self._schedule = LearnedSchedule(max_polls=3, min_samples=100, fallback=self._fallback)
+
+    def _record(self, elapsed, count):
+        for _ in range(count):
+            self._schedule.record(elapsed)
+
+    def test_fallback_until_min_samples(self):
+        self._record(2, 99)
+        self.assertIs(self._schedule.next_delay(0, 0), self._fallback.next_delay.return_value)
+        self._fallback.next_delay.assert_called_once_with(0, 0)
+        self.assertEqual(self._schedule.poll_offsets(), [])
+
+    def test_polls_at_quantiles(self):
+        self._record(2.5, 50)
+        self._record(10.2, 50)
+        self.assertEqual(self._schedule.poll_offsets(), [3.0, 11.0])
+
+    def test_next_delay_follows_plan(self):
+        self._record(2.5, 50)
+        self._record(10.2, 50)
+        self.assertEqual(self._schedule.next_delay(0, 0), 3.0)
+        self.assertEqual(self._schedule.next_delay(1, 3.0), 8.0)
+        self._fallback.next_delay.assert_not_called()
+
+    def test_final_poll_at_timeout_after_plan(self):
+        self._record(2.5, 50)
+        self._record(10.2, 50)
+        self.assertEqual(self._schedule.next_delay(1, 11.0), float("inf"))
+
+    def test_final_poll_at_timeout_after_max_polls(self):
+        self._record(2.5, 50)
+        self._record(10.2, 50)
+        self.assertEqual(self._schedule.next_delay(2, 0), float("inf"))
+
+    def test_polls_capped(self):
+        schedule = LearnedSchedule(max_polls=5, min_samples=10)
+        for elapsed in range(300):
+            schedule.record(elapsed)
+        self.assertEqual(len(schedule.poll_offsets()), 4)
+
+    def test_only_final_poll_once_learned_with_one_poll(self):
+        fallback = MagicMock()
+        schedule = LearnedSchedule(max_polls=1, min_samples=10, fallback=fallback)
+        for _ in range(10):
+            schedule.record(2.5)
+        self.assertEqual(schedule.poll_offsets(), [])
+        self.assertEqual(schedule.next_delay(0, 0), float("inf"))
+        fallback.next_delay.assert_not_called()
+
+    def test_polls_minimize_detection_delay(self):
+        schedule = LearnedSchedule(max_polls=3, min_samples=10)
+        for elapsed in [2.5] * 80 + [10.5] * 10 + [40.5] * 10:
+            schedule.record(elapsed)
+        self.assertEqual(schedule.poll_offsets(), [3.0, 41.0])
+
+    def test_out_of_range_times_recorded_in_edge_buckets(self):
+        self._schedule.record(-1)
+        self._schedule.record(1000)
+        self.assertEqual(self._schedule.counts[0], 1)
+        self.assertEqual(self._schedule.counts[-1], 1)
+        self.assertEqual(self._schedule.samples, 2)
+
+    def test_plan_updated_as_samples_grow(self):
+        self._record(2.5, 100)
+        self.assertEqual(self._schedule.poll_offsets(), [3.0])
+        self._record(20.5, 100)
+        self.assertEqual(self._schedule.poll_offsets(), [3.0, 21.0])
+
+    def test_plan_kept_until_samples_grow_enough(self):
+        self._record(2.5, 100)
+        self._record(20.5, 5)
+        self.assertEqual(self._schedule.poll_offsets(), [3.0])
+
+
+class TestAuthorizationPoller(unittest.TestCase):
+
+    def setUp(self):
+        self._client = MagicMock()
+        self._client.get_authorization_response.return_value = None
+        self._poller = AuthorizationPoller(self._client, schedule=ImmediateSchedule(), timeout=5)
+
+    def tearDown(self):
+        self._poller.close()
+
+    def test_resolved_with_response(self):
+        response = MagicMock()
+        self._client.get_authorization_response.side_effect = [None, None, response]
+        self.assertIs(self._poller.poll("auth").result(5), response)
+        self.assertEqual(self._client.get_authorization_response.call_count, 3)
+        self._client.get_authorization_response.assert_called_with("auth")
+        self.assertEqual(len(self._poller), 0)
+
+    def test_callback_receives_future(self):
+        response = MagicMock()
+        self._client.get_authorization_response.return_value = response
+        callback = MagicMock()
+        future = self._poller.poll("auth", callback=callback)
+        future.result(5)
+        self._poller.close()
+        callback.assert_called_once_with(future)
+
+    def test_same_request_returns_same_future(self):
+        self._poller = AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=60), timeout=5)
+        self.assertIs(self._poller.poll("auth"), self._poller.poll("auth"))
+        self.assertEqual(len(self._poller), 1)
+
+    def test_api_error_resolves_future(self):
+        self._client.get_authorization_response.side_effect = EntityNotFound("Not found", 404)
+        with self.assertRaises(EntityNotFound):
+            self._poller.poll("auth").result(5)
+        self._client.get_authorization_response.assert_called_once_with("auth")
+
+    def test_api_timeout_resolves_future(self):
+        self._client.get_authorization_response.side_effect = RequestTimedOut("Timed out", 408)
+        with self.assertRaises(RequestTimedOut):
+            self._poller.poll("auth").result(5)
+
+    def test_transient_errors_retried(self):
+        response = MagicMock()
+        self._client.get_authorization_response.side_effect = [ConnectionError(), RateLimited("Limited", 429),
+                                                                response]
+        self.assertIs(self._poller.poll("auth").result(5), response)
+
+    def test_gives_up_at_timeout(self):
+        self._poller = AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=0.01, jitter=0),
+                                           timeout=0.1)
+        with self.assertRaises(RequestTimedOut):
+            self._poller.poll("auth").result(5)
+
+    def test_transient_error_at_timeout_resolves_future(self):
+        self._client.get_authorization_response.side_effect = ConnectionError()
+        with self.assertRaises(ConnectionError):
+            self._poller.poll("auth", started=time() - 10).result(5)
+
+    def test_last_poll_at_timeout(self):
+        self._poller = AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=60), timeout=0.05)
+        with self.assertRaises(RequestTimedOut):
+            self._poller.poll("auth").result(5)
+        self._client.get_authorization_response.assert_called_once_with("auth")
+
+    def test_cancelled_future_stops_polling(self):
+        self._poller = AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=0.05), timeout=5)
+        future = self._poller.poll("auth")
+        self.assertTrue(future.cancel())
+        sleep(0.1)
+        self._client.get_authorization_response.assert_not_called()
+        self.assertEqual(len(self._poller), 0)
+
+    def test_close_cancels_pending_futures(self):
+        self._poller = AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=60), timeout=5)
+        future = self._poller.poll("auth")
+        self._poller.close()
+        self.assertTrue(future.cancelled())
+        self.assertEqual(len(self._poller), 0)
+
+    def test_poll_after_close_raises(self):
+        self._poller.close()
+        with self.assertRaises(RuntimeError):
+            self._poller.poll("auth")
+
+    def test_many_requests(self):
+        self._client.get_authorization_response.side_effect = lambda auth: auth
+        futures = dict((auth, self._poller.poll(auth)) for auth in map(str, range(100)))
+        for auth, future in futures.items():
+            self.assertEqual(future.result(5), auth)
+
+    def test_context_manager_closes(self):
+        with AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=60)) as poller:
+            future = poller.poll("auth")
+        self.assertTrue(future.cancelled())
+
+    def test_response_time_recorded(self):
+        schedule = MagicMock()
+        schedule.next_delay.return_value = 0
+        self._client.get_authorization_response.side_effect = [None, MagicMock()]
+        self._poller = AuthorizationPoller(self._client, schedule=schedule)
+        self._poller.poll("auth", started=time() - 10).result(5)
+        schedule.record.assert_called_once()
+        self.assertTrue(9 < schedule.record.call_args[0][0] < 11)
+
+    def test_learned_schedule_caps_polls(self):
+        schedule = LearnedSchedule(max_polls=3, min_samples=1, bucket_width=0.01, timeout=0.3)
+        schedule.record(0.05)
+        schedule.record(0.1)
+        schedule.record(0.15)
+        self._poller = AuthorizationPoller(self._client, schedule=schedule, timeout=0.3)
+        with self.assertRaises(RequestTimedOut):
+            self._poller.poll("auth").result(5)
+        self.assertEqual(self._client.get_authorization_response.call_count, 3)
+
+    def test_resolve_stops_polling(self):
+        self._poller = AuthorizationPoller(self._client, schedule=BackoffSchedule(initial_delay=0.05), timeout=5)
+        response = MagicMock()
+        future = self._poller.poll("auth")
+        self.assertTrue(self._poller.resolve("auth", response))
+        self.assertIs(future.result(5), response)
+        sleep(0.1)
+        self._client.get_authorization_response.assert_not_called()
+
+    def test_resolve_unknown_request(self):
+        self.assertFalse(self._poller.resolve("auth", MagicMock()))
+
+    def test_resolve_records_response_time(self):
+        schedule = MagicMock()
+        schedule.next_delay.return_value = 60
+        self._poller = AuthorizationPoller(self._client, schedule=schedule)
+        self._poller.poll("auth", started=time() - 10)
+        self._poller.resolve("auth", MagicMock())
+        self.assertTrue(10 <= schedule.record.call_args[0][0] < 11)
+
+    def test_delay_before_first_poll(self):
+        self._poller = AuthorizationPoller(self._client, schedule=ImmediateSchedule(), timeout=5)
+        self._poller.poll("auth", delay=60)
+        sleep(0.05)
+        self._client.get_authorization_response.assert_not_called()
+
+
+class TestAuthorizationDeduplicator(unittest.TestCase):
+
+    def setUp(self):
+        self._deduplicator = AuthorizationDeduplicator(ttl=10)
+        self._create = MagicMock(side_effect=lambda: "auth %s" % self._create.call_count)
+
+    def test_repeat_returns_existing_request(self):
+        self.assertEqual(self._deduplicator.authorize("key", self._create), "auth 1")
+        self.assertEqual(self._deduplicator.authorize("key", self._create), "auth 1")
+        self._create.assert_called_once_with()
+
+    def test_other_key_creates_request(self):
+        self._deduplicator.authorize("key", self._create)
+        self.assertEqual(self._deduplicator.authorize("other", self._create), "auth 2")
+
+    def test_expired_request_created_again(self):
+        with patch("launchkey.polling.deduplication.time", return_value=time() - 60):
+            self._deduplicator.authorize("key", self._create)
+        self.assertEqual(self._deduplicator.authorize("key", self._create), "auth 2")
+
+    def test_failure_not_remembered(self):
+        self._create.side_effect = [RateLimited("Limited", 429), "auth"]
+        with self.assertRaises(RateLimited):
+            self._deduplicator.authorize("key", self._create)
+        self.assertEqual(self._deduplicator.authorize("key", self._create), "auth")
+        self.assertEqual(len(self._deduplicator), 1)
+
+    def test_concurrent_calls_wait_for_first(self):
+        started, release = threading.Event(), threading.Event()
+
+        def create():
+            started.set()
+            release.wait(5)
+            return "auth"
+        results = []
+        first = threading.Thread(target=lambda: results.append(self._deduplicator.authorize("key", create)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.append(self._deduplicator.authorize("key", self._create)))
+        second.start()
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(results, ["auth", "auth"])
+        self._create.assert_not_called()
+
+    def test_concurrent_calls_receive_failure(self):
+        started, release = threading.Event(), threading.Event()
+
+        def create():
+            started.set()
+            release.wait(5)
+            raise RateLimited("Limited", 429)
+        errors = []
+
+        def authorize(function):
+            try:
+                self._deduplicator.authorize("key", function)
+            except RateLimited as e:
+                errors.append(e)
+        first = threading.Thread(target=authorize, args=(create,))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=authorize, args=(self._create,))
+        second.start()
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(len(errors), 2)
+        self._create.assert_not_called()
+
+    def test_entries_bounded(self):
+        deduplicator = AuthorizationDeduplicator(max_entries=2)
+        for key in ("first", "second", "third"):
+            deduplicator.authorize(key, self._create)
+        self.assertEqual(list(deduplicator._entries), ["second", "third"])
+
+    def test_fingerprint(self):
+        fingerprint = AuthorizationDeduplicator.fingerprint
+        self.assertEqual(fingerprint("user", "context", {"a": 1, "b": 2}),
+                         fingerprint("user", "context", {"b": 2, "a": 1}))
+        self.assertNotEqual(fingerprint("user", "context"), fingerprint("user", "other"))
+        self.assertNotEqual(fingerprint("user"), fingerprint("other"))
+        self.assertNotEqual(fingerprint("user", None, {"a": 1}), fingerprint("user"))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    @patch("launchkey.polling.bulk.sleep")
+    def test_burst_without_waiting(self, sleep_patch):
+        bucket = TokenBucket(10, burst=3)
+        for _ in range(3):
+            bucket.acquire()
+        sleep_patch.assert_not_called()
+
+    @patch("launchkey.polling.bulk.sleep")
+    def test_waits_once_tokens_exhausted(self, sleep_patch):
+        bucket = TokenBucket(10, burst=1)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertAlmostEqual(sleep_patch.call_args[0][0], 0.1, places=2)
+
+    @patch("launchkey.polling.bulk.sleep")
+    def test_pause(self, sleep_patch):
+        bucket = TokenBucket(10)
+        bucket.pause(2)
+        bucket.acquire()
+        self.assertAlmostEqual(sleep_patch.call_args[0][0], 2.1, places=2)
+
+
+class TestRunBulk(unittest.TestCase):
+
+    def test_results_for_every_item(self):
+        results = dict(run_bulk(lambda item: item * 2, range(100), max_workers=4))
+        self.assertEqual(results, dict((item, item * 2) for item in range(100)))
+
+    def test_exceptions_returned(self):
+        def function(item):
+            if item == 1:
+                raise EntityNotFound("Not found", 404)
+            return item
+        results = dict(run_bulk(function, range(3)))
+        self.assertIsInstance(results[1], EntityNotFound)
+        self.assertEqual(results[2], 2)
+
+    def test_items_read_as_workers_become_available(self):
+        read = []
+
+        def items():
+            for item in range(1000):
+                read.append(item)
+                yield item
+        results = run_bulk(lambda item: item, items(), max_workers=2)
+        next(results)
+        self.assertLessEqual(len(read), 5)
+        results.close()
+
+    @patch("launchkey.polling.bulk.sleep")
+    def test_rate_limited_calls_retried(self, sleep_patch):
+        function = MagicMock(side_effect=[RateLimited("Limited", 429), RateLimited("Limited", 429), "auth"])
+        self.assertEqual(list(run_bulk(function, ["user"], retry_delay=1)), [("user", "auth")])
+        self.assertEqual([call[0][0] for call in sleep_patch.call_args_list], [1, 2])
+
+    @patch("launchkey.polling.bulk.sleep")
+    def test_rate_limited_retries_exhausted(self, sleep_patch):
+        function = MagicMock(side_effect=RateLimited("Limited", 429))
+        result = list(run_bulk(function, ["user"], max_retries=2))
+        self.assertIsInstance(result[0][1], RateLimited)
+        self.assertEqual(function.call_count, 3)
+
+    @patch("launchkey.polling.bulk.TokenBucket")
+    def test_rate_limited_pauses_bucket(self, bucket_patch):
+        function = MagicMock(side_effect=[RateLimited("Limited", 429), "auth"])
+        list(run_bulk(function, ["user"], rate=10, retry_delay=3))
+        bucket_patch.assert_called_once_with(10)
+        bucket_patch.return_value.pause.assert_called_once_with(3)
+        self.assertEqual(bucket_patch.return_value.acquire.call_count, 2)
+
+    def test_concurrency_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def function(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            sleep(0.001)
+            with lock:
+                running[0] -= 1
+        list(run_bulk(function, range(50), max_workers=3))
+        self.assertLessEqual(running[1], 3)
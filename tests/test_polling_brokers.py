@@ -0,0 +1,285 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import json
+from mock import MagicMock
+from launchkey.entities.service import AuthorizationResponse
+from launchkey.polling import InMemoryBroker, UnixSocketBroker, UnixSocketBrokerServer, RedisBroker, \
+    AuthorizationRelay
+from time import sleep
+
+
+def wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+class FakeRedisThread(object):
+
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakePubSub(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.handlers = {}
+        self.closed = False
+
+    def subscribe(self, **handlers):
+        self.handlers.update(handlers)
+
+    def unsubscribe(self, *channels):
+        for channel in channels:
+            self.handlers.pop(channel, None)
+
+    def run_in_thread(self, sleep_time=0, daemon=False):
+        if not self.handlers:
+            raise RuntimeError("No subscriptions")
+        return FakeRedisThread()
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRedis(object):
+    """Stand-in for a Redis server and client delivering messages as bytes, like redis.Redis"""
+
+    def __init__(self):
+        self.pubsubs = []
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        pubsub = FakePubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    def publish(self, channel, message):
+        for pubsub in self.pubsubs:
+            handler = pubsub.handlers.get(channel)
+            if handler is not None:
+                handler({"type": "message", "channel": channel.encode("utf-8"), "data": message.encode("utf-8")})
+
+
+class TestInMemoryBroker(unittest.TestCase):
+
+    def setUp(self):
+        self._broker = InMemoryBroker()
+
+    def test_publish_to_subscribers(self):
+        first, second = MagicMock(), MagicMock()
+        self._broker.subscribe("channel", first)
+        self._broker.subscribe("channel", second)
+        self._broker.publish("channel", "message")
+        first.assert_called_once_with("message")
+        second.assert_called_once_with("message")
+
+    def test_publish_to_other_channel(self):
+        callback = MagicMock()
+        self._broker.subscribe("channel", callback)
+        self._broker.publish("other", "message")
+        callback.assert_not_called()
+
+    def test_unsubscribe(self):
+        callback = MagicMock()
+        self._broker.subscribe("channel", callback)
+        self._broker.unsubscribe("channel", callback)
+        self._broker.publish("channel", "message")
+        callback.assert_not_called()
+        self.assertEqual(self._broker._subscriptions, {})
+
+    def test_unsubscribe_unknown_callback(self):
+        self._broker.unsubscribe("channel", MagicMock())
+
+    def test_callback_may_unsubscribe(self):
+        def callback(message):
+            self._broker.unsubscribe("channel", callback)
+        self._broker.subscribe("channel", callback)
+        self._broker.publish("channel", "message")
+        self.assertEqual(self._broker._subscriptions, {})
+
+
+class TestUnixSocketBroker(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._socket_path = os.path.join(self._directory, "broker.sock")
+        self._server = UnixSocketBrokerServer(self._socket_path)
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.01})
+        self._thread.daemon = True
+        self._thread.start()
+        self._publisher = UnixSocketBroker(self._socket_path, timeout=5)
+        self._subscriber = UnixSocketBroker(self._socket_path, timeout=5)
+
+    def tearDown(self):
+        self._publisher.close()
+        self._subscriber.close()
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._directory)
+
+    def _subscribe(self, broker, channel):
+        received = []
+        broker.subscribe(channel, received.append)
+        self.assertTrue(wait_for(lambda: channel in self._server._subscribers))
+        return received
+
+    def test_socket_mode(self):
+        self.assertEqual(os.stat(self._socket_path).st_mode & 0o777, 0o600)
+
+    def test_message_relayed_between_brokers(self):
+        received = self._subscribe(self._subscriber, "channel")
+        self._publisher.publish("channel", "message")
+        self.assertTrue(wait_for(lambda: received == ["message"]))
+
+    def test_message_not_relayed_to_other_channels(self):
+        received = self._subscribe(self._subscriber, "channel")
+        other = self._subscribe(self._subscriber, "other")
+        self._publisher.publish("other", "message")
+        self.assertTrue(wait_for(lambda: other == ["message"]))
+        self.assertEqual(received, [])
+
+    def test_unsubscribed_channel_removed_from_server(self):
+        callback = MagicMock()
+        self._subscribe(self._subscriber, "channel")
+        self._subscriber.subscribe("other", callback)
+        self._subscriber.unsubscribe("other", callback)
+        self.assertTrue(wait_for(lambda: "other" not in self._server._subscribers))
+
+    def test_closed_subscriber_removed_from_server(self):
+        self._subscribe(self._subscriber, "channel")
+        self._subscriber.close()
+        self.assertTrue(wait_for(lambda: "channel" not in self._server._subscribers))
+
+    def test_subscriptions_restored_after_reconnection(self):
+        received = self._subscribe(self._subscriber, "channel")
+        self._subscriber._sock.shutdown(2)
+        self.assertTrue(wait_for(lambda: self._subscriber._sock is None))
+        self._subscribe(self._subscriber, "other")
+        self._publisher.publish("channel", "message")
+        self.assertTrue(wait_for(lambda: received == ["message"]))
+
+    def test_publish_without_server(self):
+        broker = UnixSocketBroker(os.path.join(self._directory, "missing.sock"))
+        with self.assertRaises(EnvironmentError):
+            broker.publish("channel", "message")
+
+
+    def test_failed_subscription_not_kept(self):
+        broker = UnixSocketBroker(os.path.join(self._directory, "missing.sock"))
+        for _ in range(5):
+            with self.assertRaises(EnvironmentError):
+                broker.subscribe("channel", MagicMock())
+        self.assertEqual(broker._subscriptions, {})
+
+    def test_regular_file_not_replaced(self):
+        path = os.path.join(self._directory, "broker.conf")
+        with open(path, "w") as f:
+            f.write("data")
+        with self.assertRaises(OSError):
+            UnixSocketBrokerServer(path)
+        self.assertTrue(os.path.isfile(path))
+
+
+class TestRedisBroker(unittest.TestCase):
+
+    def setUp(self):
+        self._redis = FakeRedis()
+        self._publisher = RedisBroker(self._redis)
+        self._subscriber = RedisBroker(self._redis)
+
+    def test_message_relayed_as_text(self):
+        callback = MagicMock()
+        self._subscriber.subscribe("channel", callback)
+        self._publisher.publish("channel", "message")
+        callback.assert_called_once_with("message")
+
+    def test_listening_thread_started_once(self):
+        self._subscriber.subscribe("channel", MagicMock())
+        thread = self._subscriber._thread
+        self._subscriber.subscribe("other", MagicMock())
+        self.assertIs(self._subscriber._thread, thread)
+
+    def test_unsubscribe(self):
+        callback = MagicMock()
+        self._subscriber.subscribe("channel", callback)
+        self._subscriber.unsubscribe("channel", callback)
+        self._publisher.publish("channel", "message")
+        callback.assert_not_called()
+
+    def test_close(self):
+        self._subscriber.subscribe("channel", MagicMock())
+        thread = self._subscriber._thread
+        self._subscriber.close()
+        self.assertTrue(thread.stopped)
+        self.assertTrue(self._subscriber._pubsub.closed)
+
+
+class TestAuthorizationRelay(unittest.TestCase):
+
+    def setUp(self):
+        self._broker = InMemoryBroker()
+        self._relay = AuthorizationRelay(self._broker, "secret")
+        self._response = AuthorizationResponse.__new__(AuthorizationResponse)
+        self._response.authorization_request_id = "auth"
+        self._response.authorized = True
+        self._response.device_id = "device"
+        self._response.service_pins = ["1234"]
+        self._response.service_user_hash = "hash"
+        self._response.organization_user_hash = "org hash"
+        self._response.user_push_id = "push"
+
+    def test_secret_required(self):
+        with self.assertRaises(ValueError):
+            AuthorizationRelay(self._broker, "")
+
+    def test_response_relayed(self):
+        callback = MagicMock()
+        self._relay.subscribe("auth", callback)
+        self._relay.publish(self._response)
+        response = callback.call_args[0][0]
+        self.assertIsInstance(response, AuthorizationResponse)
+        self.assertEqual(response.__dict__, self._response.__dict__)
+
+    def test_response_for_other_request_not_relayed(self):
+        callback = MagicMock()
+        self._relay.subscribe("other", callback)
+        self._relay.publish(self._response)
+        callback.assert_not_called()
+
+    def test_unsubscribe(self):
+        callback = MagicMock()
+        self._relay.subscribe("auth", callback)()
+        self._relay.publish(self._response)
+        callback.assert_not_called()
+
+    def test_response_with_other_secret_ignored(self):
+        callback = MagicMock()
+        self._relay.subscribe("auth", callback)
+        AuthorizationRelay(self._broker, "other secret").publish(self._response)
+        callback.assert_not_called()
+
+    def test_forged_response_ignored(self):
+        callback = MagicMock()
+        self._relay.subscribe("auth", callback)
+        payload = json.dumps({"authorization_request_id": "auth", "authorized": True})
+        self._broker.publish("launchkey:authorization:auth", json.dumps({"response": payload, "mac": "0" * 64}))
+        self._broker.publish("launchkey:authorization:auth", "not json")
+        callback.assert_not_called()
+
+    def test_response_replayed_on_other_channel_ignored(self):
+        callback = MagicMock()
+        self._relay.subscribe("other", callback)
+        messages = []
+        self._broker.subscribe("launchkey:authorization:auth", messages.append)
+        self._relay.publish(self._response)
+        self._broker.publish("launchkey:authorization:other", messages[0])
+        callback.assert_not_called()
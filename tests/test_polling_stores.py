@@ -0,0 +1,269 @@
+import unittest
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from mock import patch
+from launchkey.entities.service import AuthorizationResponse
+from launchkey.exceptions import RequestTimedOut
+from launchkey.polling import InMemoryAuthorizationStore, SQLiteAuthorizationStore, SharedMemoryAuthorizationStore
+from launchkey.polling.serialization import dump_response
+from time import time
+
+
+def make_response(auth_request_id="auth"):
+    response = AuthorizationResponse.__new__(AuthorizationResponse)
+    response.authorization_request_id = auth_request_id
+    response.authorized = True
+    response.device_id = "device"
+    response.service_pins = ["1234"]
+    response.service_user_hash = "hash"
+    response.organization_user_hash = None
+    response.user_push_id = "push"
+    return response
+
+
+class AuthorizationStoreTests(object):
+    """Behavior shared by every store, run against instances made by make_store"""
+
+    def make_store(self, **kwargs):
+        raise NotImplementedError
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._store = self.make_store()
+        self._other = self.make_store()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_pending_request(self):
+        self.assertIsNone(self._store.get("auth"))
+
+    def test_response_stored(self):
+        self._store.set("auth", make_response())
+        self.assertEqual(dump_response(self._store.get("auth")), dump_response(make_response()))
+
+    def test_timeout_stored(self):
+        self._store.set("auth", RequestTimedOut("Timed out", 408))
+        result = self._store.get("auth")
+        self.assertIsInstance(result, RequestTimedOut)
+        self.assertEqual(result.status_code, 408)
+
+    def test_first_result_kept(self):
+        self._store.set("auth", make_response())
+        self._other.set("auth", RequestTimedOut("Timed out", 408))
+        self.assertIsInstance(self.make_store().get("auth"), AuthorizationResponse)
+
+    def test_claim_once(self):
+        self.assertTrue(self._store.claim("auth"))
+        self.assertFalse(self._other.claim("auth"))
+
+    def test_claim_renewed_by_holder(self):
+        self._store.claim("auth")
+        self.assertTrue(self._store.claim("auth"))
+
+    def test_claims_independent_per_request(self):
+        self._store.claim("auth")
+        self.assertTrue(self._other.claim("other"))
+
+    def test_expired_lease_taken_over(self):
+        with patch("launchkey.polling.stores.time", return_value=time() - 60):
+            self._store.claim("auth")
+        self.assertTrue(self._other.claim("auth"))
+
+    def test_no_claim_once_result_stored(self):
+        self._store.claim("auth")
+        self._store.set("auth", make_response())
+        self.assertFalse(self._store.claim("auth"))
+        self.assertFalse(self._other.claim("auth"))
+
+    def test_result_shared(self):
+        self._store.set("auth", make_response())
+        self.assertIsInstance(self._other.get("auth"), AuthorizationResponse)
+
+    def test_expired_result_ignored(self):
+        with patch("launchkey.polling.stores.time", return_value=time() - 3600):
+            self._store.set("auth", make_response())
+        self.assertIsNone(self._store.get("auth"))
+        self.assertIsNone(self._other.get("auth"))
+
+    def test_result_served_locally(self):
+        self._store.set("auth", make_response())
+        with patch.object(self._store, "_load") as load_patch:
+            self.assertIsInstance(self._store.get("auth"), AuthorizationResponse)
+        load_patch.assert_not_called()
+
+    def test_local_results_bounded(self):
+        self._store._MAX_LOCAL_RESULTS = 2
+        for auth_request_id in ("first", "second", "third"):
+            self._store.set(auth_request_id, make_response(auth_request_id))
+        self.assertEqual(list(self._store._local), ["second", "third"])
+        self.assertIsInstance(self._store.get("first"), AuthorizationResponse)
+
+    def test_forked_process_is_other_owner(self):
+        self._store.claim("auth")
+        with patch("launchkey.utils.os.getpid", return_value=os.getpid() + 1):
+            self.assertFalse(self._store.claim("auth"))
+
+
+class TestInMemoryAuthorizationStore(AuthorizationStoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self._store = InMemoryAuthorizationStore()
+        self._directory = tempfile.mkdtemp()
+        # Workers of a single process share the store's entries but are different lease owners
+        self._other = InMemoryAuthorizationStore()
+        self._other._entries = self._store._entries
+        self._other._lock = self._store._lock
+
+    def make_store(self, **kwargs):
+        store = InMemoryAuthorizationStore(**kwargs)
+        store._entries = self._store._entries
+        return store
+
+    def test_threads_are_other_owners(self):
+        self._store.claim("auth")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self._store.claim("auth")))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [False])
+        self.assertTrue(self._store.claim("auth"))
+
+    def test_expired_entries_pruned(self):
+        with patch("launchkey.polling.stores.time", return_value=time() - 3600):
+            self._store.set("old", make_response("old"))
+            self._store.claim("pending")
+        self._store.claim("auth")
+        self.assertEqual(list(self._store._entries), ["auth"])
+
+    def test_renewed_lease_moved_to_end(self):
+        self._store.claim("first")
+        self._store.claim("second")
+        self._store.claim("first")
+        self.assertEqual(list(self._store._entries), ["second", "first"])
+
+    def test_prune_stops_at_first_live_entry(self):
+        self._store.claim("live")
+        with patch("launchkey.polling.stores.time", return_value=time() - 3600):
+            self._store.claim("expired")
+        self._store.claim("auth")
+        self.assertEqual(list(self._store._entries), ["live", "expired", "auth"])
+        self.assertFalse(self._other.claim("live"))
+        self.assertTrue(self._other.claim("expired"))
+
+
+class TestSQLiteAuthorizationStore(AuthorizationStoreTests, unittest.TestCase):
+
+    def make_store(self, **kwargs):
+        return SQLiteAuthorizationStore(os.path.join(self._directory, "authorizations.db"), **kwargs)
+
+    def tearDown(self):
+        self._store.close()
+        self._other.close()
+        super(TestSQLiteAuthorizationStore, self).tearDown()
+
+    def test_file_mode(self):
+        self.assertEqual(os.stat(self._store.path).st_mode & 0o777, 0o600)
+
+    def test_expired_rows_pruned(self):
+        with patch("launchkey.polling.stores.time", return_value=time() - 3600):
+            self._store.set("old", make_response("old"))
+        self._store.claim("auth")
+        rows = self._store._connection.execute("SELECT auth_request_id FROM authorizations").fetchall()
+        self.assertEqual(rows, [("auth",)])
+
+    def test_pickle(self):
+        self._store.set("auth", make_response())
+        store = pickle.loads(pickle.dumps(self._store))
+        try:
+            self.assertEqual(store.path, self._store.path)
+            self.assertIsInstance(store.get("auth"), AuthorizationResponse)
+            self.assertNotEqual(store.owner, self._store.owner)
+        finally:
+            store.close()
+
+    def test_connection_replaced_after_fork(self):
+        connection = self._store._connection
+        with patch("launchkey.utils.os.getpid", return_value=os.getpid() + 1):
+            self._store.claim("auth")
+        self.assertIsNot(self._store._connection, connection)
+
+
+class TestSharedMemoryAuthorizationStore(AuthorizationStoreTests, unittest.TestCase):
+
+    def make_store(self, **kwargs):
+        kwargs.setdefault("slots", 64)
+        kwargs.setdefault("shards", 8)
+        return SharedMemoryAuthorizationStore(os.path.join(self._directory, "authorizations"), **kwargs)
+
+    def tearDown(self):
+        self._store.close()
+        self._other.close()
+        super(TestSharedMemoryAuthorizationStore, self).tearDown()
+
+    def test_file_mode_and_size(self):
+        self.assertEqual(os.stat(self._store.path).st_mode & 0o777, 0o600)
+        self.assertEqual(os.path.getsize(self._store.path), 64 * 512)
+
+    def test_bounded_by_slots(self):
+        for i in range(1000):
+            self.assertTrue(self._store.claim("auth %s" % i))
+        self._store.set("auth", make_response())
+        self.assertIsInstance(self._other.get("auth"), AuthorizationResponse)
+        self.assertEqual(os.path.getsize(self._store.path), 64 * 512)
+
+    def test_expired_record_replaced(self):
+        path = os.path.join(self._directory, "small")
+        store = SharedMemoryAuthorizationStore(path, slots=8, shards=1)
+        other = SharedMemoryAuthorizationStore(path, slots=8, shards=1)
+        try:
+            with patch("launchkey.polling.stores.time", return_value=time() - 3600):
+                for i in range(8):
+                    store.set("old %s" % i, make_response("old %s" % i))
+            self.assertTrue(store.claim("auth"))
+            self.assertFalse(other.claim("auth"))
+        finally:
+            store.close()
+            other.close()
+
+    def test_large_result_not_shared(self):
+        path = os.path.join(self._directory, "large")
+        store = SharedMemoryAuthorizationStore(path, record_size=64)
+        other = SharedMemoryAuthorizationStore(path, record_size=64)
+        try:
+            self.assertTrue(store.claim("auth"))
+            store.set("auth", make_response())
+            self.assertIsInstance(store.get("auth"), AuthorizationResponse)
+            self.assertIsNone(other.get("auth"))
+        finally:
+            store.close()
+            other.close()
+
+    def test_operations_do_not_read_other_records(self):
+        for i in range(32):
+            self._store.set("auth %s" % i, make_response("auth %s" % i))
+        with patch("launchkey.polling.stores.json.loads", wraps=json.loads) as loads_patch:
+            self.assertIsInstance(self._other.get("auth 0"), AuthorizationResponse)
+        loads_patch.assert_called_once()
+
+    def test_pickle(self):
+        self._store.set("auth", make_response())
+        store = pickle.loads(pickle.dumps(self._store))
+        try:
+            self.assertEqual(store.slots, 64)
+            self.assertIsInstance(store.get("auth"), AuthorizationResponse)
+        finally:
+            store.close()
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Requires os.fork")
+    def test_shared_with_forked_process(self):
+        self._store.claim("auth")
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if not self._store.claim("auth") and self._store.claim("other") else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertFalse(self._other.claim("other"))
@@ -1,4 +1,5 @@
 import unittest
+import pickle
 from mock import MagicMock, patch
 from requests import Response
 from requests.exceptions import HTTPError
@@ -12,48 +13,51 @@ class TestRequestsHTTPTransportParseResponse(unittest.TestCase):
 
     def setUp(self):
         self._transport = RequestsTransport()
-        self._requests_response = MagicMock(spec=Response())
+
+    @staticmethod
+    def _response(status_code, content, content_type="application/json"):
+        response = Response()
+        response.status_code = status_code
+        response.reason = "Reason"
+        response.headers["Content-Type"] = content_type
+        response._content = content
+        return response
 
     def test_parse_response_success(self):
-        transport_response = self._transport._parse_response(self._requests_response)
+        requests_response = self._response(200, b'{"a": "b"}')
+        transport_response = self._transport._parse_response(requests_response)
         self.assertIsInstance(transport_response, APIResponse)
-        self.assertEqual(self._requests_response.json(), transport_response.data)
-        self.assertEqual(self._requests_response.headers, transport_response.headers)
-        self.assertEqual(self._requests_response.status_code, transport_response.status_code)
+        self.assertNotIsInstance(transport_response, APIErrorResponse)
+        self.assertEqual(requests_response.headers, transport_response.headers)
+        self.assertEqual(requests_response.status_code, transport_response.status_code)
 
     def test_parse_response_json_success(self):
-        transport_response = self._transport._parse_response(self._requests_response)
-        self.assertIsInstance(transport_response, APIResponse)
-        self._requests_response.json.assert_called_once()
-        self.assertNotEqual(self._requests_response.text, transport_response.data)
-        self.assertEqual(self._requests_response.json(), transport_response.data)
-        self.assertEqual(self._requests_response.headers, transport_response.headers)
-        self.assertEqual(self._requests_response.status_code, transport_response.status_code)
+        transport_response = self._transport._parse_response(self._response(200, b'{"a": "b"}'))
+        self.assertEqual({"a": "b"}, transport_response.data)
 
     def test_parse_response_text_success(self):
-        self._requests_response.json.side_effect = ValueError()
-        transport_response = self._transport._parse_response(self._requests_response)
-        self.assertIsInstance(transport_response, APIResponse)
-        with self.assertRaises(ValueError):
-            self._requests_response.json()
-        self.assertEqual(self._requests_response.text, transport_response.data)
-        self.assertEqual(self._requests_response.headers, transport_response.headers)
-        self.assertEqual(self._requests_response.status_code, transport_response.status_code)
+        transport_response = self._transport._parse_response(self._response(200, b'a.b.c.d.e', "application/jwe"))
+        self.assertEqual('a.b.c.d.e', transport_response.data)
+
+    def test_parse_response_keeps_raw_content(self):
+        transport_response = self._transport._parse_response(self._response(200, b'a.b.c.d.e', "application/jwe"))
+        self.assertEqual(b'a.b.c.d.e', transport_response.content)
+
+    def test_parse_response_does_not_decode_json(self):
+        with patch("launchkey.transports.base.json") as json_patch:
+            self._transport._parse_response(self._response(200, b'{"a": "b"}'))
+        json_patch.loads.assert_not_called()
 
     def test_parse_response_400_failure(self):
-        self._requests_response.raise_for_status.side_effect = HTTPError()
-        self._requests_response.status_code = 400
-        transport_response = self._transport._parse_response(self._requests_response)
+        transport_response = self._transport._parse_response(self._response(400, b'{"error_code": "ARG-001"}'))
         self.assertIsInstance(transport_response, APIErrorResponse)
-        self.assertEqual(self._requests_response.json(), transport_response.data)
-        self.assertEqual(self._requests_response.headers, transport_response.headers)
-        self.assertEqual(self._requests_response.status_code, transport_response.status_code)
+        self.assertEqual({"error_code": "ARG-001"}, transport_response.data)
+        self.assertEqual(400, transport_response.status_code)
+        self.assertEqual("Reason", transport_response.reason)
 
     def test_parse_response_500_failure(self):
-        self._requests_response.raise_for_status.side_effect = HTTPError()
-        self._requests_response.status_code = 500
         with self.assertRaises(HTTPError):
-            self._transport._parse_response(self._requests_response)
+            self._transport._parse_response(self._response(500, b''))
 
 
 class TestRequestsHTTPTransport(unittest.TestCase):
@@ -99,3 +103,42 @@ class TestRequestsHTTPTransport(unittest.TestCase):
     def test_patch(self, requests_patch):
         self._transport.patch(MagicMock())
         requests_patch.assert_called_once()
+
+
+class TestRequestsHTTPTransportPooled(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = RequestsTransport(pooled=True)
+        self._transport._session = MagicMock()
+
+    def test_get_uses_session(self):
+        self._transport.get(MagicMock())
+        self._transport._session.get.assert_called_once()
+
+    def test_post_uses_session(self):
+        self._transport.post(MagicMock())
+        self._transport._session.post.assert_called_once()
+
+    @patch("launchkey.utils.os.getpid")
+    @patch("requests.Session")
+    def test_session_replaced_after_fork(self, session_patch, getpid_patch):
+        getpid_patch.return_value = 1
+        transport = RequestsTransport(pooled=True)
+        session = transport._session
+        transport.get(MagicMock())
+        self.assertIs(transport._session, session)
+        getpid_patch.return_value = 2
+        transport.get(MagicMock())
+        self.assertEqual(session_patch.call_count, 2)
+
+    def test_pickled_without_session(self):
+        transport = RequestsTransport(pooled=True)
+        transport.set_url("https://example.com", True)
+        transport = pickle.loads(pickle.dumps(transport))
+        self.assertEqual(transport.url, "https://example.com")
+        self.assertFalse(transport.verify_ssl)
+        self.assertIsNotNone(transport._session)
+
+    def test_unpooled_pickled(self):
+        transport = pickle.loads(pickle.dumps(RequestsTransport()))
+        self.assertIsNone(transport._session)
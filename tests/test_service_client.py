@@ -6,13 +6,28 @@ from formencode import Invalid
 from launchkey.transports.base import APIResponse
 from launchkey.clients import ServiceClient
 from launchkey.clients.service import AuthorizationResponse, SessionEndRequest, AuthPolicy
+from launchkey.sessions import SessionRegistry
+from launchkey.polling import InMemoryBroker, AuthorizationRelay, InMemoryAuthorizationStore, \
+    AuthorizationDeduplicator
 from launchkey.exceptions import LaunchKeyAPIException, InvalidParameters, InvalidPolicyInput, PolicyFailure, \
     EntityNotFound, RateLimited, RequestTimedOut, UnexpectedAPIResponse, UnexpectedDeviceResponse, UnexpectedKeyID, \
-    InvalidGeoFenceName, InvalidPolicyFormat
+    InvalidGeoFenceName, InvalidPolicyFormat, JWTValidationFailure, WebhookBodyTooLarge, JWTReplayed, \
+    InvalidJWTResponse, Unauthorized, Forbidden
+from launchkey.transports import ReplayCache, JOSETransport
+from concurrent.futures import ThreadPoolExecutor
+from Crypto.PublicKey import RSA
+from jwkest.jwk import RSAKey
+from jwkest.jws import JWS
+from hashlib import sha256
+from tests.test_jose_auth_transport import valid_private_key
+from launchkey import JOSE_JWT_LEEWAY
 from datetime import datetime
+from time import time
 from ddt import ddt, data, unpack
+import socket
 
 
+@ddt
 class TestServiceClient(unittest.TestCase):
 
     def setUp(self):
@@ -141,6 +156,44 @@ class TestServiceClient(unittest.TestCase):
         with self.assertRaises(UnexpectedAPIResponse):
             self.assertIsInstance(self._service_client.handle_webhook(request, ANY), SessionEndRequest)
 
+    def test_webhook_session_end_bytes(self):
+        service_user_hash = str(uuid4())
+        request = (" \n" + dumps({"service_user_hash": service_user_hash, "api_time": "2018-01-01T00:00:00Z"})).encode()
+        self._transport.parse_api_time.return_value = 1514764800
+        response = self._service_client.handle_webhook(request, ANY)
+        self.assertIsInstance(response, SessionEndRequest)
+        self.assertEqual((response.service_user_hash, response.logout_requested), (service_user_hash, 1514764800))
+        self._transport.screen_jwt_response.assert_called_once_with(ANY, request, ANY)
+        self._transport.verify_screened_jwt_response.assert_called_once_with(
+            ANY, self._transport.screen_jwt_response.return_value)
+        self._transport.decrypt_response.assert_not_called()
+
+    def test_webhook_screened_before_verified(self):
+        self._transport.screen_jwt_response.side_effect = JWTValidationFailure("EXP failed by 60 seconds")
+        with self.assertRaises(JWTValidationFailure):
+            self._service_client.handle_webhook("body", {"X-IOV-JWT": "jwt"})
+        self._transport.screen_jwt_response.assert_called_once_with({"X-IOV-JWT": "jwt"}, "body", ANY)
+        self._transport.verify_screened_jwt_response.assert_not_called()
+
+    def test_webhook_body_too_large(self):
+        self._service_client.max_webhook_body_size = 10
+        with self.assertRaises(WebhookBodyTooLarge):
+            self._service_client.handle_webhook(b"x" * 11, {})
+        self._transport.screen_jwt_response.assert_not_called()
+
+    def test_webhook_body_size_unlimited_by_default(self):
+        self.assertIsNone(self._service_client.max_webhook_body_size)
+        self._transport.decrypt_response.side_effect = ValueError
+        with self.assertRaises(ValueError):
+            self._service_client.handle_webhook("x" * 100000, {})
+
+    @data("eyJhbGciOiJSU0EtT0FFUCJ9.service_user_hash", b"eyJhbGciOiJSU0EtT0FFUCJ9.service_user_hash")
+    def test_webhook_classified_by_first_character(self, body):
+        self._transport.decrypt_response.side_effect = ValueError
+        with self.assertRaises(ValueError):
+            self._service_client.handle_webhook(body, ANY)
+        self._transport.decrypt_response.assert_called_once_with(body)
+
     @patch("launchkey.entities.service.b64decode")
     @patch("launchkey.clients.service.loads")
     @patch("launchkey.entities.service.loads")
@@ -157,6 +210,450 @@ class TestServiceClient(unittest.TestCase):
         self.assertIsInstance(self._service_client.handle_webhook(MagicMock(), ANY), AuthorizationResponse)
 
 
+class TestServiceClientAuthorizationFutures(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._transport.post.return_value = APIResponse({"auth_request": "auth"}, {}, 200)
+        self._transport.get.return_value = APIResponse({}, {}, 204)
+        self._service_client = ServiceClient(uuid4(), self._transport)
+
+    def tearDown(self):
+        if self._service_client._authorization_poller is not None:
+            self._service_client.authorization_poller.close()
+
+    def _webhook(self, auth_request_id):
+        with patch("launchkey.clients.service.loads"):
+            with patch("launchkey.clients.service.AuthorizationResponse") as authorization_response_patch:
+                authorization_response_patch.return_value.authorization_request_id = auth_request_id
+                return self._service_client.handle_webhook("body", {})
+
+    def test_authorize_returns_request_id_by_default(self):
+        self.assertEqual(self._service_client.authorize("user"), "auth")
+        self.assertIsNone(self._service_client._authorization_poller)
+
+    def test_authorize_returns_future(self):
+        poller = MagicMock()
+        self._service_client.authorization_poller = poller
+        future = self._service_client.authorize("user", return_future=True, webhook_timeout=30)
+        self.assertIs(future, poller.poll.return_value)
+        poller.poll.assert_called_once_with("auth", delay=30)
+
+    def test_poller_created_once(self):
+        self.assertIs(self._service_client.authorization_poller, self._service_client.authorization_poller)
+
+    def test_webhook_resolves_future_without_polling(self):
+        future = self._service_client.authorize("user", return_future=True, webhook_timeout=60)
+        response = self._webhook("auth")
+        self.assertIs(future.result(5), response)
+        self._transport.get.assert_not_called()
+
+    def test_webhook_for_other_request_does_not_resolve_future(self):
+        future = self._service_client.authorize("user", return_future=True, webhook_timeout=60)
+        self._webhook("other")
+        self.assertFalse(future.done())
+
+    def test_webhook_without_futures(self):
+        self.assertIsNotNone(self._webhook("auth"))
+        self.assertIsNone(self._service_client._authorization_poller)
+
+    def test_polls_after_webhook_timeout(self):
+        with patch.object(self._service_client, "get_authorization_response") as get_authorization_response_patch:
+            future = self._service_client.authorize("user", return_future=True, webhook_timeout=0.01)
+            self.assertIs(future.result(5), get_authorization_response_patch.return_value)
+        get_authorization_response_patch.assert_called_once_with("auth")
+
+    def test_webhook_on_other_node_resolves_future_through_relay(self):
+        broker = InMemoryBroker()
+        self._service_client.authorization_relay = AuthorizationRelay(broker, "secret")
+        other_client = ServiceClient(uuid4(), self._transport)
+        other_client.authorization_relay = AuthorizationRelay(broker, "secret")
+        future = self._service_client.authorize("user", return_future=True, webhook_timeout=60)
+        response = AuthorizationResponse.__new__(AuthorizationResponse)
+        response.__dict__.update(authorization_request_id="auth", authorized=True, device_id="device",
+                                 service_pins=[], service_user_hash="hash", organization_user_hash=None,
+                                 user_push_id=None)
+        with patch("launchkey.clients.service.loads"):
+            with patch("launchkey.clients.service.AuthorizationResponse", return_value=response):
+                other_client.handle_webhook("body", {})
+        self.assertEqual(future.result(5).__dict__, response.__dict__)
+        self._transport.get.assert_not_called()
+        self.assertEqual(broker._subscriptions, {})
+
+    def test_future_polled_when_relay_unreachable(self):
+        relay = MagicMock()
+        relay.subscribe.side_effect = socket.error()
+        self._service_client.authorization_relay = relay
+        with patch.object(self._service_client, "get_authorization_response") as get_authorization_response_patch:
+            future = self._service_client.authorize("user", return_future=True, webhook_timeout=0.01)
+            self.assertIs(future.result(5), get_authorization_response_patch.return_value)
+        get_authorization_response_patch.assert_called_once_with("auth")
+
+
+class TestServiceClientAuthorizationStore(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._transport.get.return_value = APIResponse({}, {}, 204)
+        self._store = InMemoryAuthorizationStore()
+        self._service_client = ServiceClient(uuid4(), self._transport)
+        self._service_client.authorization_store = self._store
+
+    def _response(self):
+        response = AuthorizationResponse.__new__(AuthorizationResponse)
+        response.__dict__.update(authorization_request_id="auth", authorized=True, device_id="device",
+                                 service_pins=[], service_user_hash="hash", organization_user_hash=None,
+                                 user_push_id=None)
+        return response
+
+    def test_pending_request_polled_and_leased(self):
+        self.assertIsNone(self._service_client.get_authorization_response("auth"))
+        self._transport.get.assert_called_once_with("/service/v3/auths/auth", ANY)
+        self.assertEqual(self._store._entries["auth"][2], self._store.owner)
+
+    def test_request_leased_by_other_worker_not_polled(self):
+        other = InMemoryAuthorizationStore()
+        other._entries = self._store._entries
+        other.claim("auth")
+        self.assertIsNone(self._service_client.get_authorization_response("auth"))
+        self._transport.get.assert_not_called()
+
+    def test_stored_response_returned_without_polling(self):
+        self._store.set("auth", self._response())
+        self.assertEqual(self._service_client.get_authorization_response("auth").__dict__, self._response().__dict__)
+        self._transport.get.assert_not_called()
+
+    @patch("launchkey.clients.service.AuthorizationResponse")
+    def test_polled_response_stored(self, authorization_response_patch):
+        authorization_response_patch.return_value = self._response()
+        self._transport.get.return_value = APIResponse({"auth": "", "service_user_hash": "hash"}, {}, 200)
+        with patch("launchkey.clients.service.ServiceClient._validate_response"):
+            self._service_client.get_authorization_response("auth")
+        self.assertTrue(self._store.get("auth").authorized)
+
+    def test_timeout_stored(self):
+        self._transport.get.side_effect = LaunchKeyAPIException({}, 408)
+        with self.assertRaises(RequestTimedOut):
+            self._service_client.get_authorization_response("auth")
+        self._transport.get.reset_mock()
+        with self.assertRaises(RequestTimedOut):
+            self._service_client.get_authorization_response("auth")
+        self._transport.get.assert_not_called()
+
+    def test_webhook_response_stored(self):
+        with patch("launchkey.clients.service.loads"):
+            with patch("launchkey.clients.service.AuthorizationResponse", return_value=self._response()):
+                self._service_client.handle_webhook("body", {})
+        self.assertTrue(self._service_client.get_authorization_response("auth").authorized)
+        self._transport.get.assert_not_called()
+
+
+class TestServiceClientAuthorizeDeduplication(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._transport.post.side_effect = lambda *args, **kwargs: APIResponse(
+            {"auth_request": "auth %s" % self._transport.post.call_count}, {}, 200)
+        self._service_client = ServiceClient(uuid4(), self._transport)
+        self._service_client.authorize_deduplicator = AuthorizationDeduplicator()
+
+    def test_without_deduplicator(self):
+        self._service_client.authorize_deduplicator = None
+        self._service_client.authorize("user", "context")
+        self.assertEqual(self._service_client.authorize("user", "context"), "auth 2")
+
+    def test_repeat_returns_existing_request(self):
+        self.assertEqual(self._service_client.authorize("user", "context"), "auth 1")
+        self.assertEqual(self._service_client.authorize("user", "context"), "auth 1")
+        self._transport.post.assert_called_once_with("/service/v3/auths", ANY, username="user", context="context")
+
+    def test_other_context_creates_request(self):
+        self._service_client.authorize("user", "context")
+        self.assertEqual(self._service_client.authorize("user", "other"), "auth 2")
+
+    def test_other_policy_creates_request(self):
+        self._service_client.authorize("user", policy=AuthPolicy(knowledge=True))
+        self.assertEqual(self._service_client.authorize("user", policy=AuthPolicy(knowledge=True)), "auth 1")
+        self.assertEqual(self._service_client.authorize("user", policy=AuthPolicy(possession=True)), "auth 2")
+
+    def test_failure_converted(self):
+        self._transport.post.side_effect = LaunchKeyAPIException({}, 429)
+        with self.assertRaises(RateLimited):
+            self._service_client.authorize("user")
+
+
+@ddt
+class TestServiceClientAuthorizeErrors(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._service_client = ServiceClient(uuid4(), self._transport)
+
+    @data(
+        (401, Unauthorized),
+        (403, Forbidden),
+        (404, EntityNotFound),
+        (408, RequestTimedOut),
+        (429, RateLimited),
+    )
+    @unpack
+    def test_error_detail_kept(self, status_code, exception):
+        self._transport.post.side_effect = LaunchKeyAPIException(
+            {"error_code": "LIB-001", "error_detail": "No such user"}, status_code)
+        with self.assertRaises(exception) as context:
+            self._service_client.authorize("user")
+        self.assertEqual(str(context.exception), "No such user")
+
+
+class TestServiceClientAuthorizeMany(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._transport.post.side_effect = lambda path, subject, **kwargs: APIResponse(
+            {"auth_request": "auth %s" % kwargs["username"]}, {}, 200)
+        self._service_client = ServiceClient(uuid4(), self._transport)
+
+    def test_requests_for_every_user(self):
+        results = dict(self._service_client.authorize_many(("user %s" % i for i in range(20)), max_workers=4))
+        self.assertEqual(results, dict(("user %s" % i, "auth user %s" % i) for i in range(20)))
+
+    def test_shared_context_and_policy(self):
+        policy = AuthPolicy(knowledge=True)
+        list(self._service_client.authorize_many(["user"], context="context", policy=policy))
+        self._transport.post.assert_called_once_with("/service/v3/auths", ANY, username="user", context="context",
+                                                     policy=policy.get_policy())
+
+    def test_policy_serialized_once(self):
+        policy = MagicMock(spec=AuthPolicy)
+        policy.get_policy.return_value = {}
+        list(self._service_client.authorize_many(["first", "second"], policy=policy))
+        policy.get_policy.assert_called_once_with()
+
+    def test_invalid_policy_raised_on_call(self):
+        with self.assertRaises(InvalidParameters):
+            self._service_client.authorize_many(["user"], policy={})
+
+    def test_context_per_user(self):
+        results = list(self._service_client.authorize_many([("user", "context")], context="default"))
+        self.assertEqual(results, [("user", "auth user")])
+        self._transport.post.assert_called_once_with("/service/v3/auths", ANY, username="user", context="context")
+
+    def test_failures_returned_converted(self):
+        self._transport.post.side_effect = LaunchKeyAPIException({}, 404)
+        results = list(self._service_client.authorize_many(["user"]))
+        self.assertIsInstance(results[0][1], EntityNotFound)
+
+
+class TestServiceClientSessionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._transport.post.return_value = APIResponse({}, {}, 200)
+        self._service_client = ServiceClient(uuid4(), self._transport)
+        self._registry = self._service_client.session_registry = SessionRegistry()
+
+    def _response(self):
+        response = AuthorizationResponse.__new__(AuthorizationResponse)
+        response.__dict__.update(authorization_request_id="auth", authorized=True, device_id="device",
+                                 service_pins=[], service_user_hash="hash", organization_user_hash=None,
+                                 user_push_id=None)
+        return response
+
+    def test_session_start_recorded(self):
+        self._service_client.session_start("user", "auth")
+        self.assertEqual(self._registry.sessions_for_user("user")[0].auth_request_id, "auth")
+
+    def test_failed_session_start_not_recorded(self):
+        self._transport.post.side_effect = LaunchKeyAPIException({}, 404)
+        with self.assertRaises(EntityNotFound):
+            self._service_client.session_start("user", "auth")
+        self.assertEqual(len(self._registry), 0)
+
+    def test_session_end_forgets_sessions(self):
+        self._service_client.session_start("user", "auth")
+        self._service_client.session_end("user")
+        self.assertEqual(self._registry.sessions_for_user("user"), [])
+
+    def test_webhook_response_indexes_session(self):
+        self._service_client.session_start("user", "auth")
+        with patch("launchkey.clients.service.loads"):
+            with patch("launchkey.clients.service.AuthorizationResponse", return_value=self._response()):
+                self._service_client.handle_webhook("body", {})
+        self.assertEqual(self._registry.end_service_user("hash")[0].user, "user")
+
+    def test_polled_response_indexes_session(self):
+        with patch.object(self._service_client, "_get_authorization_response", return_value=self._response()):
+            self._service_client.get_authorization_response("auth")
+        self._service_client.session_start("user", "auth")
+        self.assertEqual(self._registry.sessions_for_service_user_hash("hash")[0].user, "user")
+
+    def test_pending_response_ignored(self):
+        self._transport.get.return_value = APIResponse({}, {}, 204)
+        self.assertIsNone(self._service_client.get_authorization_response("auth"))
+        self.assertEqual(len(self._registry._hashes), 0)
+
+class TestServiceClientWebhookReplayCache(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._payload = {"jti": "jti", "exp": time() + 5}
+        self._transport.screen_jwt_response.return_value = self._payload
+        self._transport.verify_screened_jwt_response.return_value = self._payload
+        self._transport.parse_api_time.return_value = 1514764800
+        self._service_client = ServiceClient(uuid4(), self._transport)
+        self._cache = self._service_client.webhook_replay_cache = ReplayCache()
+        self._body = dumps({"service_user_hash": "hash", "api_time": "2018-01-01T00:00:00Z"})
+
+    def test_first_delivery_handled(self):
+        self.assertIsInstance(self._service_client.handle_webhook(self._body, {}), SessionEndRequest)
+        self.assertIn("jti", self._cache)
+
+    def test_replay_rejected_before_verification(self):
+        self._service_client.handle_webhook(self._body, {})
+        self._transport.verify_screened_jwt_response.reset_mock()
+        with self.assertRaises(JWTReplayed):
+            self._service_client.handle_webhook(self._body, {})
+        self._transport.verify_screened_jwt_response.assert_not_called()
+
+    def test_concurrent_replay_rejected_after_verification(self):
+        cache = self._service_client.webhook_replay_cache = MagicMock()
+        cache.__contains__.return_value = False
+        cache.add.return_value = False
+        with self.assertRaises(JWTReplayed):
+            self._service_client.handle_webhook(self._body, {})
+        cache.add.assert_called_once_with("jti", self._payload["exp"] + JOSE_JWT_LEEWAY)
+
+    def test_unverified_jwt_not_remembered(self):
+        self._transport.verify_screened_jwt_response.side_effect = JWTValidationFailure("Invalid signature")
+        with self.assertRaises(JWTValidationFailure):
+            self._service_client.handle_webhook(self._body, {})
+        self.assertNotIn("jti", self._cache)
+
+    def test_missing_jti_rejected(self):
+        del self._payload["jti"]
+        with self.assertRaises(JWTValidationFailure):
+            self._service_client.handle_webhook(self._body, {})
+
+
+class TestServiceClientHandleWebhooks(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = MagicMock()
+        self._transport.screen_jwt_response.return_value = {}
+        self._transport.verify_screened_jwt_response.return_value = {}
+        self._transport.parse_api_time.return_value = 1514764800
+        self._service_client = ServiceClient(uuid4(), self._transport)
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self._executor.shutdown()
+
+    @staticmethod
+    def _session_end(service_user_hash):
+        return dumps({"service_user_hash": service_user_hash, "api_time": "2018-01-01T00:00:00Z"}), {}
+
+    def test_results_in_input_order(self):
+        batch = [self._session_end("hash %s" % i) for i in range(20)]
+        results = self._service_client.handle_webhooks(batch, executor=self._executor, max_workers=2)
+        self.assertEqual([result.service_user_hash for result in results], ["hash %s" % i for i in range(20)])
+
+    def test_failures_isolated(self):
+        screened = JWTValidationFailure("EXP failed by 60 seconds")
+        forged = JWTValidationFailure("Invalid signature")
+        self._transport.screen_jwt_response.side_effect = lambda headers, body, subject: \
+            self._raise(screened) if "expired" in body else {"forged": "forged" in body}
+        self._transport.verify_screened_jwt_response.side_effect = lambda headers, payload: \
+            self._raise(forged) if payload["forged"] else {}
+        results = self._service_client.handle_webhooks(
+            [self._session_end("expired"), self._session_end("valid"), self._session_end("forged"), ("{}", {})],
+            executor=self._executor)
+        self.assertIs(results[0], screened)
+        self.assertEqual(results[1].service_user_hash, "valid")
+        self.assertIs(results[2], forged)
+        self.assertIsInstance(results[3], UnexpectedAPIResponse)
+
+    @staticmethod
+    def _raise(exception):
+        raise exception
+
+    def test_screened_webhooks_not_sent_to_workers(self):
+        self._transport.screen_jwt_response.side_effect = JWTValidationFailure("EXP failed by 60 seconds")
+        executor = MagicMock()
+        results = self._service_client.handle_webhooks([self._session_end("hash")], executor=executor)
+        self.assertIsInstance(results[0], JWTValidationFailure)
+        executor.submit.assert_not_called()
+
+    def test_worker_failure_reported_for_its_chunk(self):
+        error = RuntimeError("Worker died")
+        executor = MagicMock()
+        executor.submit.return_value.result.side_effect = error
+        results = self._service_client.handle_webhooks([self._session_end("a"), self._session_end("b")],
+                                                       executor=executor)
+        self.assertEqual(results, [error, error])
+
+    def test_duplicates_in_batch_rejected(self):
+        self._service_client.webhook_replay_cache = ReplayCache()
+        self._transport.screen_jwt_response.return_value = {"jti": "jti", "exp": time() + 5}
+        self._transport.verify_screened_jwt_response.return_value = {"jti": "jti", "exp": time() + 5}
+        results = self._service_client.handle_webhooks([self._session_end("a"), self._session_end("a")],
+                                                       executor=self._executor)
+        self.assertIsInstance(results[0], SessionEndRequest)
+        self.assertIsInstance(results[1], JWTReplayed)
+
+    def test_authorization_responses_resolve_futures(self):
+        response = MagicMock()
+        self._transport.decrypt_response.return_value = "{}"
+        with patch("launchkey.clients.service.AuthorizationResponse", return_value=response):
+            self._service_client.authorization_poller = MagicMock()
+            results = self._service_client.handle_webhooks([("eyJhbGciOiJSU0EtT0FFUCJ9.jwe", {})],
+                                                           executor=self._executor)
+        self.assertEqual(results, [response])
+        self._service_client.authorization_poller.resolve.assert_called_once_with(
+            response.authorization_request_id, response)
+
+    def test_process_pool(self):
+        api_key = RSA.importKey(valid_private_key)
+        service_id = uuid4()
+        transport = JOSETransport()
+        transport.set_issuer("svc", service_id, valid_private_key)
+        transport._api_public_keys = [RSAKey(key=api_key.publickey(), kid="api")], int(time())
+        service_client = ServiceClient(service_id, transport)
+
+        def sign(body, **claims):
+            now = int(time())
+            payload = {"aud": transport.issuer, "sub": service_client._subject, "iat": now, "nbf": now,
+                       "exp": now + 5, "jti": str(uuid4()), "request": {"hash": sha256(body.encode()).hexdigest()}}
+            payload.update(claims)
+            return {"X-IOV-JWT": JWS(dumps(payload), alg="RS256").sign_compact(keys=[RSAKey(key=api_key,
+                                                                                           kid="api")])}
+        valid = self._session_end("valid")[0]
+        forged = self._session_end("forged")[0]
+        batch = [(valid, sign(valid)), (forged, sign(valid)), ("junk", {"X-IOV-JWT": "junk"})]
+        try:
+            results = service_client.handle_webhooks(batch, max_workers=2)
+        finally:
+            service_client.webhook_executor.shutdown()
+        self.assertEqual(results[0].service_user_hash, "valid")
+        self.assertIsInstance(results[1], JWTValidationFailure)
+        self.assertIsInstance(results[2], InvalidJWTResponse)
+
+    @patch("launchkey.clients.service.ProcessPoolExecutor")
+    def test_process_pool_kept_for_every_batch(self, executor_patch):
+        executor_patch.return_value.submit.side_effect = self._executor.submit
+        self._service_client.handle_webhooks([self._session_end("a")])
+        self._service_client.handle_webhooks([self._session_end("b")])
+        executor_patch.assert_called_once_with(max_workers=ANY)
+        self.assertIs(self._service_client.webhook_executor, executor_patch.return_value)
+        executor_patch.return_value.shutdown.assert_not_called()
+
+    def test_webhook_executor_can_be_set(self):
+        executor = MagicMock()
+        executor.submit.side_effect = self._executor.submit
+        self._service_client.webhook_executor = executor
+        self._service_client.handle_webhooks([self._session_end("a")])
+        executor.submit.assert_called_once()
+
+
 class TestAuthorizationResponse(unittest.TestCase):
 
     def setUp(self):
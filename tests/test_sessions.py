@@ -0,0 +1,339 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+from mock import MagicMock, call, patch
+from requests.exceptions import ConnectionError
+from launchkey.exceptions import EntityNotFound
+from launchkey.sessions import SessionDispatcher, SessionRegistry
+from time import sleep, time
+
+
+def wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+class TestSessionDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self._client = MagicMock()
+        self._directory = tempfile.mkdtemp()
+        self._journal_path = os.path.join(self._directory, "sessions.journal")
+        self._dispatchers = []
+
+    def tearDown(self):
+        for dispatcher in self._dispatchers:
+            dispatcher.close(wait=False)
+        shutil.rmtree(self._directory)
+
+    def _dispatcher(self, **kwargs):
+        dispatcher = SessionDispatcher(self._client, **kwargs)
+        self._dispatchers.append(dispatcher)
+        return dispatcher
+
+    def _blocked_dispatcher(self, **kwargs):
+        """Returns a dispatcher whose calls wait for the returned event once the first one started"""
+        started, release = threading.Event(), threading.Event()
+
+        def block(*args):
+            started.set()
+            release.wait(5)
+        self._client.session_start.side_effect = block
+        self._client.session_end.side_effect = block
+        return self._dispatcher(**kwargs), started, release
+
+    def test_calls_made(self):
+        dispatcher = self._dispatcher()
+        dispatcher.session_start("user", "auth")
+        dispatcher.session_end("other")
+        self.assertTrue(dispatcher.flush(5))
+        self._client.session_start.assert_called_once_with("user", "auth")
+        self._client.session_end.assert_called_once_with("other")
+        self.assertEqual(len(dispatcher), 0)
+
+    def test_start_and_end_coalesced_to_end(self):
+        dispatcher, started, release = self._blocked_dispatcher(max_workers=1)
+        dispatcher.session_end("blocking")
+        started.wait(5)
+        dispatcher.session_start("user", "auth")
+        dispatcher.session_end("user")
+        self.assertEqual(len(dispatcher), 2)
+        release.set()
+        dispatcher.flush(5)
+        self._client.session_start.assert_not_called()
+        self._client.session_end.assert_has_calls([call("blocking"), call("user")])
+
+    def test_start_supersedes_previous_start(self):
+        dispatcher, started, release = self._blocked_dispatcher(max_workers=1)
+        dispatcher.session_end("blocking")
+        started.wait(5)
+        dispatcher.session_end("user")
+        dispatcher.session_start("user", "first")
+        dispatcher.session_start("user", "second")
+        release.set()
+        dispatcher.flush(5)
+        self.assertEqual(self._client.mock_calls[1:], [call.session_end("user"), call.session_start("user", "second")])
+
+    def test_calls_for_user_made_in_order(self):
+        dispatcher, started, release = self._blocked_dispatcher(max_workers=4)
+        dispatcher.session_start("user", "auth")
+        started.wait(5)
+        dispatcher.session_end("user")
+        self.assertFalse(dispatcher.flush(0.05))
+        self._client.session_end.assert_not_called()
+        release.set()
+        dispatcher.flush(5)
+        self.assertEqual(self._client.mock_calls, [call.session_start("user", "auth"), call.session_end("user")])
+
+    @patch("launchkey.sessions.dispatcher.sleep")
+    def test_transient_errors_retried(self, sleep_patch):
+        self._client.session_end.side_effect = [ConnectionError(), None]
+        dispatcher = self._dispatcher(retry_delay=2)
+        dispatcher.session_end("user")
+        dispatcher.flush(5)
+        self.assertEqual(self._client.session_end.call_count, 2)
+        sleep_patch.assert_called_once_with(2)
+
+    @patch("launchkey.sessions.dispatcher.sleep")
+    def test_failures_reported(self, sleep_patch):
+        error = EntityNotFound("Not found", 404)
+        self._client.session_end.side_effect = error
+        on_error = MagicMock()
+        dispatcher = self._dispatcher(on_error=on_error)
+        dispatcher.session_end("user")
+        dispatcher.flush(5)
+        on_error.assert_called_once_with("user", "session_end", error)
+        self._client.session_end.assert_called_once_with("user")
+
+    def test_closed_dispatcher_rejects_calls(self):
+        dispatcher = self._dispatcher()
+        dispatcher.close()
+        with self.assertRaises(RuntimeError):
+            dispatcher.session_end("user")
+
+    def test_close_makes_accepted_calls(self):
+        dispatcher = self._dispatcher()
+        dispatcher.session_end("user")
+        dispatcher.close()
+        self._client.session_end.assert_called_once_with("user")
+
+    def test_journal_mode(self):
+        self._dispatcher(journal_path=self._journal_path)
+        self.assertEqual(os.stat(self._journal_path).st_mode & 0o777, 0o600)
+
+    def test_journal_records_calls_until_made(self):
+        dispatcher, started, release = self._blocked_dispatcher(max_workers=1, journal_path=self._journal_path)
+        dispatcher.session_start("user", "auth")
+        started.wait(5)
+        with open(self._journal_path) as journal:
+            self.assertEqual([json.loads(line) for line in journal],
+                             [{"id": 1, "op": "start", "user": "user", "auth": "auth"}])
+        release.set()
+        dispatcher.flush(5)
+        self.assertEqual(os.path.getsize(self._journal_path), 0)
+
+    def test_journal_replayed(self):
+        dispatcher, started, release = self._blocked_dispatcher(max_workers=1, journal_path=self._journal_path)
+        dispatcher.session_end("blocking")
+        started.wait(5)
+        dispatcher.session_start("user", "auth")
+        dispatcher.session_end("other")
+        dispatcher.close(wait=False)
+        release.set()
+        self._client.reset_mock(side_effect=True)
+        self._client.session_start.side_effect = None
+        self._client.session_end.side_effect = None
+        dispatcher = self._dispatcher(journal_path=self._journal_path)
+        dispatcher.flush(5)
+        self._client.session_start.assert_called_once_with("user", "auth")
+        # The call in progress when the dispatcher was closed is made again
+        self._client.session_end.assert_has_calls([call("blocking"), call("other")], any_order=True)
+
+    def test_journal_replay_drops_made_and_superseded_calls(self):
+        records = [{"id": 1, "op": "start", "user": "user", "auth": "first"},
+                   {"id": 2, "op": "end", "user": "user", "auth": None},
+                   {"done": [2]},
+                   {"id": 3, "op": "start", "user": "other", "auth": "second"}]
+        with open(self._journal_path, "w") as journal:
+            # The last line was torn by a crash
+            journal.write("\n".join(json.dumps(record) for record in records) + '\n{"id": 4, "op')
+        dispatcher = self._dispatcher(journal_path=self._journal_path)
+        dispatcher.flush(5)
+        self.assertEqual(self._client.mock_calls, [call.session_start("other", "second")])
+        release = threading.Event()
+        self._client.session_end.side_effect = lambda user: release.wait(5)
+        dispatcher.session_end("user")
+        with open(self._journal_path) as journal:
+            self.assertEqual(json.loads(journal.readline())["id"], 4)
+        release.set()
+
+    @patch("launchkey.sessions.dispatcher.os.fsync")
+    def test_fsync(self, fsync_patch):
+        dispatcher = self._dispatcher(journal_path=self._journal_path, fsync=True)
+        fsync_patch.reset_mock()
+        dispatcher.session_end("user")
+        self.assertTrue(fsync_patch.called)
+
+    def test_journal_written_without_holding_condition(self):
+        dispatcher = self._dispatcher(journal_path=self._journal_path, fsync=True)
+        syncing, release = threading.Event(), threading.Event()
+
+        def fsync(fileno):
+            syncing.set()
+            release.wait(5)
+        with patch("launchkey.sessions.dispatcher.os.fsync", side_effect=fsync):
+            thread = threading.Thread(target=dispatcher.session_end, args=("user",))
+            thread.start()
+            self.assertTrue(syncing.wait(5))
+            counted = []
+            counter = threading.Thread(target=lambda: counted.append(len(dispatcher)))
+            counter.start()
+            counter.join(1)
+            release.set()
+            thread.join(5)
+        self.assertEqual(counted, [0])
+        self.assertTrue(dispatcher.flush(5))
+
+    def _journal_records(self):
+        with open(self._journal_path) as journal:
+            return [json.loads(line) for line in journal]
+
+    def _stepped_dispatcher(self, **kwargs):
+        """Returns a dispatcher whose calls for a user wait for the event returned for that user"""
+        events = {}
+
+        def block(user, *args):
+            events.setdefault(user, threading.Event()).wait(5)
+        self._client.session_start.side_effect = block
+        self._client.session_end.side_effect = block
+        return self._dispatcher(**kwargs), lambda user: events.setdefault(user, threading.Event())
+
+    def test_journal_compacted(self):
+        dispatcher, event = self._stepped_dispatcher(max_workers=1, journal_path=self._journal_path)
+        dispatcher._COMPACT_RECORDS = 3
+        for user in ("blocking", "first", "second", "third"):
+            dispatcher.session_end(user)
+        self.assertEqual(len(self._journal_records()), 4)
+        event("blocking").set()
+        # The first call is made once the journal holds 5 records, and the others are left
+        self.assertTrue(wait_for(lambda: [record.get("user") for record in self._journal_records()] ==
+                                 ["first", "second", "third"]))
+        for user in ("first", "second", "third"):
+            event(user).set()
+        self.assertTrue(dispatcher.flush(5))
+
+    def test_calls_accepted_while_journal_compacted(self):
+        dispatcher, event = self._stepped_dispatcher(max_workers=1, journal_path=self._journal_path)
+        dispatcher._COMPACT_RECORDS = 2
+        write_temporary_journal = dispatcher._write_temporary_journal
+
+        def accept_while_writing(records):
+            thread = threading.Thread(target=dispatcher.session_end, args=("late",))
+            thread.start()
+            thread.join(5)
+            return write_temporary_journal(records)
+        dispatcher._write_temporary_journal = accept_while_writing
+        for user in ("blocking", "first", "second"):
+            dispatcher.session_end(user)
+        event("blocking").set()
+        self.assertTrue(wait_for(lambda: [record.get("user") for record in self._journal_records()] ==
+                                 ["first", "second", "late"]))
+        for user in ("first", "second", "late"):
+            event(user).set()
+        self.assertTrue(dispatcher.flush(5))
+
+    @patch("launchkey.sessions.dispatcher.os.fsync")
+    def test_journal_not_synced_without_fsync(self, fsync_patch):
+        dispatcher = self._dispatcher(journal_path=self._journal_path)
+        for index in range(20):
+            dispatcher.session_end("user %s" % index)
+            dispatcher.flush(5)
+        fsync_patch.assert_not_called()
+        self.assertEqual(os.path.getsize(self._journal_path), 0)
+
+class TestSessionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self._registry = SessionRegistry()
+
+    def _response(self, auth_request_id, service_user_hash="hash"):
+        response = MagicMock()
+        response.authorization_request_id = auth_request_id
+        response.service_user_hash = service_user_hash
+        return response
+
+    def test_start(self):
+        session = self._registry.start("user", "auth", data="local session")
+        self.assertEqual((session.user, session.auth_request_id, session.data), ("user", "auth", "local session"))
+        self.assertIsNone(session.service_user_hash)
+        self.assertEqual(self._registry.sessions_for_user("user"), [session])
+        self.assertEqual(len(self._registry), 1)
+
+    def test_response_after_start_indexes_hash(self):
+        session = self._registry.start("user", "auth")
+        self._registry.record_response(self._response("auth"))
+        self.assertEqual(session.service_user_hash, "hash")
+        self.assertEqual(self._registry.sessions_for_service_user_hash("hash"), [session])
+
+    def test_response_before_start_indexes_hash(self):
+        self._registry.record_response(self._response("auth"))
+        session = self._registry.start("user", "auth")
+        self.assertEqual(self._registry.sessions_for_service_user_hash("hash"), [session])
+        self.assertEqual(len(self._registry._hashes), 0)
+
+    def test_response_without_hash_ignored(self):
+        self._registry.record_response(self._response("auth", None))
+        self.assertEqual(len(self._registry._hashes), 0)
+
+    def test_end_service_user(self):
+        first = self._registry.start("user", "first")
+        second = self._registry.start("user", "second")
+        other = self._registry.start("other", "third")
+        for auth_request_id, service_user_hash in (("first", "hash"), ("second", "hash"), ("third", "other")):
+            self._registry.record_response(self._response(auth_request_id, service_user_hash))
+        self.assertEqual(set(self._registry.end_service_user("hash")), set([first, second]))
+        self.assertEqual(self._registry.sessions_for_user("user"), [])
+        self.assertEqual(self._registry.sessions_for_service_user_hash("hash"), [])
+        self.assertEqual(self._registry.sessions_for_user("other"), [other])
+
+    def test_end_user(self):
+        session = self._registry.start("user", "auth")
+        self._registry.record_response(self._response("auth"))
+        self.assertEqual(self._registry.end("user"), [session])
+        self.assertEqual(self._registry.end_service_user("hash"), [])
+        self.assertEqual(self._registry._by_user, {})
+        self.assertEqual(self._registry._by_hash, {})
+
+    def test_unknown_hash(self):
+        self.assertEqual(self._registry.end_service_user("unknown"), [])
+
+    def test_restart_replaces_session(self):
+        self._registry.start("user", "auth")
+        session = self._registry.start("other", "auth")
+        self.assertEqual(self._registry.sessions_for_user("user"), [])
+        self.assertEqual(self._registry.sessions_for_user("other"), [session])
+
+    def test_bounded(self):
+        registry = SessionRegistry(max_sessions=2)
+        for auth_request_id in ("first", "second", "third"):
+            registry.start("user", auth_request_id)
+            registry.record_response(self._response("pending " + auth_request_id))
+        self.assertEqual(list(registry._sessions), ["second", "third"])
+        self.assertEqual(list(registry._hashes), ["pending second", "pending third"])
+
+    def test_expired_sessions_ignored_and_evicted(self):
+        registry = SessionRegistry(ttl=60)
+        with patch("launchkey.sessions.registry.time", return_value=time() - 1000):
+            registry.start("user", "old")
+            registry.record_response(self._response("pending"))
+        self.assertEqual(registry.sessions_for_user("user"), [])
+        session = registry.start("user", "new")
+        self.assertEqual(registry.sessions_for_user("user"), [session])
+        self.assertEqual(list(registry._sessions), ["new"])
+        self.assertEqual(len(registry._hashes), 0)
@@ -0,0 +1,239 @@
+import unittest
+import gc
+import os
+import shutil
+import tempfile
+from mock import patch
+from launchkey.transports.cache import SharedMemoryCache, DiskCache
+import json
+import pickle
+
+
+def _open_descriptors():
+    gc.collect()
+    return len(os.listdir("/proc/self/fd"))
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, "launchkey.cache")
+        self._cache = SharedMemoryCache(self._path, size=4096)
+
+    def tearDown(self):
+        self._cache.close()
+        shutil.rmtree(self._directory)
+
+    def test_file_mode(self):
+        self.assertEqual(os.stat(self._path).st_mode & 0o777, 0o600)
+        self.assertEqual(os.stat(self._path).st_size, 4096)
+
+    def test_get_missing(self):
+        self.assertIsNone(self._cache.get("missing"))
+
+    def test_set_get(self):
+        self.assertTrue(self._cache.set("key", [1, 2]))
+        self.assertTrue(self._cache.set("other", "value"))
+        self.assertEqual(self._cache.get("key"), [1, 2])
+        self.assertEqual(self._cache.get("other"), "value")
+
+    def test_shared_between_instances(self):
+        other = SharedMemoryCache(self._path, size=4096)
+        try:
+            self._cache.set("key", "first")
+            self.assertEqual(other.get("key"), "first")
+            other.set("key", "second")
+            self.assertEqual(self._cache.get("key"), "second")
+        finally:
+            other.close()
+
+    def test_value_too_large(self):
+        self.assertFalse(self._cache.set("key", "x" * 4096))
+        self.assertIsNone(self._cache.get("key"))
+
+    def test_torn_write_not_read(self):
+        self._cache.set("key", "value")
+        seq, length = SharedMemoryCache._HEADER.unpack_from(self._cache._mmap, 0)
+        SharedMemoryCache._HEADER.pack_into(self._cache._mmap, 0, seq + 1, length)
+        self._cache._MAX_READ_ATTEMPTS = 3
+        self.assertIsNone(self._cache.get("key"))
+
+    def test_torn_header_not_read(self):
+        self._cache.set("key", "value")
+        self._cache.set("key", "longer value")
+        seq, length = SharedMemoryCache._HEADER.unpack_from(self._cache._mmap, 0)
+        SharedMemoryCache._HEADER.pack_into(self._cache._mmap, 0, seq, length - 3)
+        self._cache._MAX_READ_ATTEMPTS = 3
+        self.assertIsNone(self._cache.get("key"))
+
+    def test_garbage_segment_read_as_empty(self):
+        self._cache.set("key", "value")
+        seq, length = SharedMemoryCache._HEADER.unpack_from(self._cache._mmap, 0)
+        self._cache._mmap[SharedMemoryCache._HEADER.size:SharedMemoryCache._HEADER.size + 4] = b"\xff\xfe{["
+        SharedMemoryCache._HEADER.pack_into(self._cache._mmap, 0, seq + 2, length)
+        self._cache._MAX_READ_ATTEMPTS = 3
+        self.assertIsNone(self._cache.get("key"))
+        self.assertTrue(self._cache.set("key", "new"))
+        self.assertEqual(self._cache.get("key"), "new")
+
+    def test_write_repairs_interrupted_write(self):
+        self._cache.set("key", "value")
+        seq, length = SharedMemoryCache._HEADER.unpack_from(self._cache._mmap, 0)
+        SharedMemoryCache._HEADER.pack_into(self._cache._mmap, 0, seq + 1, length)
+        self._cache.set("key", "new")
+        self.assertEqual(self._cache.get("key"), "new")
+        self.assertEqual(SharedMemoryCache._HEADER.unpack_from(self._cache._mmap, 0)[0] % 2, 0)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Requires os.fork")
+    def test_refresh_lock_exclusive_after_fork(self):
+        self.assertTrue(self._cache.acquire_refresh_lock())
+        try:
+            pid = os.fork()
+            if pid == 0:
+                acquired = self._cache.acquire_refresh_lock()
+                self._cache.set("child", "value")
+                os._exit(1 if acquired else 0)
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+            self.assertEqual(self._cache.get("child"), "value")
+        finally:
+            self._cache.release_refresh_lock()
+
+    def test_refresh_lock_exclusive(self):
+        other = SharedMemoryCache(self._path, size=4096)
+        try:
+            self.assertTrue(self._cache.acquire_refresh_lock())
+            self.assertFalse(self._cache.acquire_refresh_lock())
+            self.assertFalse(other.acquire_refresh_lock())
+            self._cache.release_refresh_lock()
+            self.assertTrue(other.acquire_refresh_lock())
+            other.release_refresh_lock()
+        finally:
+            other.close()
+
+
+    def test_pickled_cache_maps_the_same_file(self):
+        self._cache.set("key", "value")
+        cache = pickle.loads(pickle.dumps(self._cache))
+        try:
+            self.assertEqual(cache.get("key"), "value")
+            cache.set("other", 1)
+            self.assertEqual(self._cache.get("other"), 1)
+        finally:
+            cache.close()
+
+    def test_unpickled_cache_opens_files_on_first_use(self):
+        cache = pickle.loads(pickle.dumps(self._cache))
+        self.assertIsNone(cache._fd)
+        self.assertIsNone(cache._refresh_fd)
+        cache.set("key", "value")
+        self.assertEqual(self._cache.get("key"), "value")
+        cache.close()
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "Requires /proc/self/fd")
+    def test_unpickled_caches_do_not_leak_descriptors(self):
+        self._cache.set("key", "value")
+        opened = _open_descriptors()
+        for _ in range(50):
+            cache = pickle.loads(pickle.dumps(self._cache))
+            self.assertEqual(cache.get("key"), "value")
+            if cache.acquire_refresh_lock():
+                cache.release_refresh_lock()
+            del cache
+        self.assertEqual(_open_descriptors(), opened)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, "launchkey.json")
+        self._cache = DiskCache(self._path, ttl=60)
+
+    def tearDown(self):
+        self._cache.close()
+        shutil.rmtree(self._directory)
+
+    def test_get_missing_file(self):
+        self.assertIsNone(self._cache.get("key"))
+
+    def test_set_get(self):
+        self.assertTrue(self._cache.set("key", {"a": [1, 2]}))
+        self.assertEqual(self._cache.get("key"), {"a": [1, 2]})
+        self.assertEqual(os.stat(self._path).st_mode & 0o777, 0o600)
+
+    def test_persisted_for_new_instance(self):
+        self._cache.set("key", "value")
+        other = DiskCache(self._path)
+        try:
+            self.assertEqual(other.get("key"), "value")
+            other.set("other", "value")
+            self.assertEqual(self._cache.get("other"), "value")
+            self.assertEqual(self._cache.get("key"), "value")
+        finally:
+            other.close()
+
+    @patch("launchkey.transports.cache.time")
+    def test_ttl(self, time_patch):
+        time_patch.return_value = 1000
+        self._cache.set("key", "value")
+        time_patch.return_value = 1060
+        self.assertEqual(self._cache.get("key"), "value")
+        time_patch.return_value = 1061
+        self.assertIsNone(self._cache.get("key"))
+
+    @patch("launchkey.transports.cache.time")
+    def test_expired_entries_dropped_on_write(self, time_patch):
+        time_patch.return_value = 1000
+        self._cache.set("old", "value")
+        time_patch.return_value = 1100
+        self._cache.set("new", "value")
+        with open(self._path) as f:
+            self.assertEqual(list(json.load(f)["entries"].keys()), ["new"])
+
+    def test_tampered_file_ignored(self):
+        self._cache.set("key", "value")
+        with open(self._path) as f:
+            document = json.load(f)
+        document["entries"]["key"][1] = "tampered"
+        with open(self._path, "w") as f:
+            json.dump(document, f)
+        self.assertIsNone(DiskCache(self._path).get("key"))
+
+    def test_corrupt_file_ignored(self):
+        with open(self._path, "w") as f:
+            f.write("{not json")
+        self.assertIsNone(self._cache.get("key"))
+        self.assertTrue(self._cache.set("key", "value"))
+        self.assertEqual(self._cache.get("key"), "value")
+
+    def test_caches_issuer_keys_when_enabled(self):
+        self.assertFalse(self._cache.cache_issuer_keys)
+        self.assertTrue(DiskCache(self._path, cache_issuer_keys=True).cache_issuer_keys)
+        self.assertFalse(SharedMemoryCache.cache_issuer_keys)
+
+    def test_warm_start(self):
+        self.assertTrue(DiskCache.warm_start)
+        self.assertFalse(SharedMemoryCache.warm_start)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "Requires /proc/self/fd")
+    def test_unpickled_caches_do_not_leak_descriptors(self):
+        self._cache.set("key", "value")
+        opened = _open_descriptors()
+        for _ in range(50):
+            cache = pickle.loads(pickle.dumps(self._cache))
+            self.assertEqual(cache.get("key"), "value")
+            if cache.acquire_refresh_lock():
+                cache.release_refresh_lock()
+            del cache
+        self.assertEqual(_open_descriptors(), opened)
+
+    def test_pickled_cache_uses_the_same_file(self):
+        self._cache.set("key", "value")
+        cache = pickle.loads(pickle.dumps(self._cache))
+        try:
+            self.assertEqual(cache.ttl, 60)
+            self.assertFalse(cache.cache_issuer_keys)
+            self.assertEqual(cache.get("key"), "value")
+        finally:
+            cache.close()
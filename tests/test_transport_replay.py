@@ -0,0 +1,139 @@
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from mock import patch
+from launchkey.transports.replay import ReplayCache, SharedMemoryReplayCache
+from time import time
+
+
+class ReplayCacheTests(object):
+    """Tests run against every replay cache"""
+
+    def _cache(self, **kwargs):
+        raise NotImplementedError
+
+    def test_first_add_accepted(self):
+        cache = self._cache()
+        self.assertNotIn("jti", cache)
+        self.assertTrue(cache.add("jti", time() + 60))
+        self.assertIn("jti", cache)
+
+    def test_second_add_rejected(self):
+        cache = self._cache()
+        cache.add("jti", time() + 60)
+        self.assertFalse(cache.add("jti", time() + 60))
+
+    def test_other_ids_accepted(self):
+        cache = self._cache()
+        cache.add("jti", time() + 60)
+        self.assertTrue(cache.add("other", time() + 60))
+
+    def test_expired_ids_forgotten(self):
+        cache = self._cache()
+        with patch(self._time_path, return_value=time() - 1000):
+            cache.add("jti", time() - 900)
+        self.assertNotIn("jti", cache)
+        self.assertTrue(cache.add("jti", time() + 60))
+
+    def test_expired_jwt_not_remembered(self):
+        cache = self._cache()
+        self.assertTrue(cache.add("jti", time() - 60))
+        self.assertNotIn("jti", cache)
+
+    def test_concurrent_adds_accepted_once(self):
+        cache = self._cache()
+        results = []
+        expires = time() + 60
+
+        def add():
+            for i in range(200):
+                results.append(cache.add("jti %s" % i, expires))
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 200)
+
+
+class TestReplayCache(ReplayCacheTests, unittest.TestCase):
+
+    _time_path = "launchkey.transports.replay.time"
+
+    def _cache(self, **kwargs):
+        return ReplayCache(**kwargs)
+
+    def test_bounded(self):
+        cache = ReplayCache(max_entries=10, shards=2, bucket_seconds=5)
+        now = time()
+        for i in range(100):
+            cache.add("jti %s" % i, now + 5 + i)
+        self.assertLessEqual(len(cache), 10)
+        self.assertIn("jti 99", cache)
+
+    def test_earliest_expiring_bucket_dropped_first(self):
+        cache = ReplayCache(max_entries=2, shards=1, bucket_seconds=10)
+        now = time()
+        cache.add("later", now + 100)
+        cache.add("sooner", now + 20)
+        cache.add("new", now + 60)
+        self.assertEqual(("later" in cache, "sooner" in cache, "new" in cache), (True, False, True))
+
+
+class TestSharedMemoryReplayCache(ReplayCacheTests, unittest.TestCase):
+
+    _time_path = "launchkey.transports.replay.time"
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, "replay")
+        self._caches = []
+
+    def tearDown(self):
+        for cache in self._caches:
+            cache.close()
+        shutil.rmtree(self._directory)
+
+    def _cache(self, **kwargs):
+        kwargs.setdefault("slots", 1024)
+        kwargs.setdefault("shards", 8)
+        cache = SharedMemoryReplayCache(self._path, **kwargs)
+        self._caches.append(cache)
+        return cache
+
+    def test_file_mode(self):
+        self._cache()
+        self.assertEqual(os.stat(self._path).st_mode & 0o777, 0o600)
+
+    def test_shared_between_instances(self):
+        cache, other = self._cache(), self._cache()
+        cache.add("jti", time() + 60)
+        self.assertIn("jti", other)
+        self.assertFalse(other.add("jti", time() + 60))
+
+    def test_pickled_cache_maps_the_same_file(self):
+        cache = self._cache()
+        cache.add("jti", time() + 60)
+        unpickled = pickle.loads(pickle.dumps(cache))
+        self._caches.append(unpickled)
+        self.assertIn("jti", unpickled)
+
+    def test_bounded_by_slots(self):
+        cache = self._cache(slots=64, shards=2)
+        now = time()
+        for i in range(1000):
+            self.assertTrue(cache.add("jti %s" % i, now + 60 + i))
+        self.assertEqual(os.path.getsize(self._path), 64 * SharedMemoryReplayCache._SLOT.size)
+        self.assertIn("jti 999", cache)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Requires os.fork")
+    def test_shared_with_forked_process(self):
+        cache = self._cache()
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if cache.add("child", time() + 60) else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertFalse(cache.add("child", time() + 60))
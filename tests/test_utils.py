@@ -1,5 +1,10 @@
 import unittest
-from launchkey.utils import iso_format, UUIDHelper
+import os
+import shutil
+import socket
+import tempfile
+from mock import patch
+from launchkey.utils import iso_format, UUIDHelper, ForkDetector, remove_stale_socket
 from launchkey.entities.validation import ValidateISODate
 from ddt import ddt, data
 from formencode import Invalid
@@ -99,3 +104,44 @@ class TestUUIDHelper(unittest.TestCase):
     def test_invalid_uuid_5(self, value):
         with self.assertRaises(InvalidIssuerVersion):
             UUIDHelper().from_string(value, 5)
+
+
+class TestForkDetector(unittest.TestCase):
+
+    @patch("launchkey.utils.os.getpid")
+    def test_forked(self, getpid_patch):
+        getpid_patch.return_value = 1
+        detector = ForkDetector()
+        self.assertFalse(detector.forked())
+        getpid_patch.return_value = 2
+        self.assertTrue(detector.forked())
+        self.assertFalse(detector.forked())
+
+
+class TestRemoveStaleSocket(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, "launchkey.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_missing(self):
+        remove_stale_socket(self._path)
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_socket_removed(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self._path)
+        sock.close()
+        remove_stale_socket(self._path)
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_other_file_kept(self):
+        with open(self._path, "w") as f:
+            f.write("data")
+        with self.assertRaises(OSError):
+            remove_stale_socket(self._path)
+        with open(self._path) as f:
+            self.assertEqual(f.read(), "data")
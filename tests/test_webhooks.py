@@ -0,0 +1,204 @@
+import unittest
+import threading
+from io import BytesIO
+from mock import MagicMock, ANY, patch
+from launchkey.entities.service import SessionEndRequest, AuthorizationResponse
+from launchkey.exceptions import JWTValidationFailure, JWTReplayed, WebhookBodyTooLarge, EntityNotFound
+from launchkey.webhooks import WSGIWebhookApp
+import sys
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from launchkey.webhooks.asgi import ASGIWebhookApp
+
+
+class WebhookAppTests(object):
+    """Tests run against the WSGI and ASGI apps"""
+
+    def setUp(self):
+        self._client = MagicMock()
+        self._client.max_webhook_body_size = 1024
+        self._package = SessionEndRequest("hash", 1514764800)
+        self._client.handle_webhook.return_value = self._package
+        self._apps = []
+
+    def tearDown(self):
+        for app in self._apps:
+            app.shutdown()
+
+    def _app(self, **kwargs):
+        app = self._app_class(self._client, **kwargs)
+        self._apps.append(app)
+        return app
+
+    def test_webhook_handled(self):
+        status, _ = self._request(self._app(), b"body", jwt="jwt")
+        self.assertEqual(status, 200)
+        self._client.handle_webhook.assert_called_once_with(b"body", {"X-IOV-JWT": "jwt",
+                                                                      "Content-Type": "application/jwe"})
+
+    def test_handlers_called_for_their_class(self):
+        app = self._app()
+        session_end_handler, authorization_handler = MagicMock(), MagicMock()
+        app.add_handler(SessionEndRequest, session_end_handler)
+        app.add_handler(AuthorizationResponse, authorization_handler)
+        self._request(app, b"body")
+        session_end_handler.assert_called_once_with(self._package)
+        authorization_handler.assert_not_called()
+
+    def test_failing_handler(self):
+        app = self._app()
+        app.add_handler(SessionEndRequest, MagicMock(side_effect=EntityNotFound("Not found", 404)))
+        self.assertEqual(self._request(app, b"body")[0], 500)
+
+    def test_invalid_webhook(self):
+        self._client.handle_webhook.side_effect = JWTValidationFailure("EXP failed by 60 seconds")
+        self.assertEqual(self._request(self._app(), b"body")[0], 400)
+
+    def test_replayed_webhook(self):
+        self._client.handle_webhook.side_effect = JWTReplayed("JTI jti was already received")
+        self.assertEqual(self._request(self._app(), b"body")[0], 409)
+
+    def test_unexpected_error(self):
+        self._client.handle_webhook.side_effect = IOError()
+        self.assertEqual(self._request(self._app(), b"body")[0], 500)
+
+    def test_too_large_body_not_read(self):
+        self.assertEqual(self._request(self._app(), b"x" * 1025)[0], 413)
+        self._client.handle_webhook.assert_not_called()
+
+    def test_too_large_body_rejected_by_client(self):
+        self._client.max_webhook_body_size = None
+        self._client.handle_webhook.side_effect = WebhookBodyTooLarge("The webhook body is larger than 10 bytes")
+        self.assertEqual(self._request(self._app(), b"x" * 2048)[0], 413)
+
+    def test_method_not_allowed(self):
+        status, headers = self._request(self._app(), b"", method="GET")
+        self.assertEqual(status, 405)
+        self.assertEqual(headers["allow"], "POST")
+
+    def test_busy(self):
+        started, release = threading.Event(), threading.Event()
+
+        def block(body, headers):
+            started.set()
+            release.wait(5)
+            return self._package
+        self._client.handle_webhook.side_effect = block
+        app = self._app(max_workers=1, max_pending=1, retry_after=3)
+        thread = threading.Thread(target=self._request, args=(app, b"body"))
+        thread.start()
+        try:
+            started.wait(5)
+            status, headers = self._request(app, b"body")
+            self.assertEqual(status, 503)
+            self.assertEqual(headers["retry-after"], "3")
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(self._request(app, b"body")[0], 200)
+
+
+class TestWSGIWebhookApp(WebhookAppTests, unittest.TestCase):
+
+    _app_class = WSGIWebhookApp
+
+    def _request(self, app, body, jwt="jwt", method="POST", content_length=None):
+        environ = {"REQUEST_METHOD": method, "CONTENT_TYPE": "application/jwe", "HTTP_X_IOV_JWT": jwt,
+                   "CONTENT_LENGTH": str(len(body)) if content_length is None else content_length,
+                   "wsgi.input": BytesIO(body)}
+        start_response = MagicMock()
+        self.assertEqual(b"".join(app(environ, start_response)), b"")
+        status, headers = start_response.call_args[0]
+        return int(status.split()[0]), dict((name.lower(), value) for name, value in headers)
+
+    def test_missing_length(self):
+        self.assertEqual(self._request(self._app(), b"body", content_length="")[0], 411)
+        self._client.handle_webhook.assert_not_called()
+
+
+@unittest.skipUnless(sys.version_info >= (3, 5), "ASGI requires Python 3.5 or later")
+class TestASGIWebhookApp(WebhookAppTests, unittest.TestCase):
+
+    _app_class = ASGIWebhookApp if sys.version_info >= (3, 5) else None
+
+    def setUp(self):
+        super(TestASGIWebhookApp, self).setUp()
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        super(TestASGIWebhookApp, self).tearDown()
+        self._loop.close()
+
+    def _run(self, app, scope, messages):
+        """Runs the app with the messages it receives, and returns the messages it sent"""
+        messages, sent = list(messages), []
+        # Requests made from other threads run on their own loop
+        loop = self._loop if threading.current_thread() is threading.main_thread() else asyncio.new_event_loop()
+
+        def resolved(value):
+            future = loop.create_future()
+            future.set_result(value)
+            return future
+
+        def send(message):
+            sent.append(message)
+            return resolved(None)
+        try:
+            loop.run_until_complete(app(scope, lambda: resolved(messages.pop(0)), send))
+        finally:
+            if loop is not self._loop:
+                loop.close()
+        return sent
+
+    def _request(self, app, body, jwt="jwt", method="POST", chunks=None, content_length=True):
+        headers = [(b"content-type", b"application/jwe"), (b"x-iov-jwt", jwt.encode())]
+        if content_length:
+            headers.append((b"content-length", str(len(body)).encode()))
+        chunks = chunks or [body]
+        messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+        sent = self._run(app, {"type": "http", "method": method, "headers": headers}, messages)
+        self.assertEqual(sent[1], {"type": "http.response.body", "body": b""})
+        return sent[0]["status"], dict((name.decode(), value.decode()) for name, value in sent[0]["headers"])
+
+    def test_chunked_body_joined(self):
+        app = self._app()
+        self.assertEqual(self._request(app, b"", chunks=[b"bo", b"dy"], content_length=False)[0], 200)
+        self._client.handle_webhook.assert_called_once_with(b"body", ANY)
+
+    def test_too_large_chunked_body(self):
+        status, _ = self._request(self._app(), b"", chunks=[b"x" * 1000, b"x" * 1000], content_length=False)
+        self.assertEqual(status, 413)
+        self._client.handle_webhook.assert_not_called()
+
+    def test_disconnected_client_not_handled(self):
+        app = self._app()
+        headers = [(b"x-iov-jwt", b"jwt"), (b"content-length", b"4")]
+        messages = [{"type": "http.request", "body": b"bo", "more_body": True}, {"type": "http.disconnect"}]
+        self.assertEqual(self._run(app, {"type": "http", "method": "POST", "headers": headers}, messages), [])
+        self._client.handle_webhook.assert_not_called()
+        # The slot was released
+        self.assertEqual(self._request(app, b"body")[0], 200)
+        self.assertTrue(all(app._acquire() for _ in range(app.max_pending)))
+
+    def test_coroutine_handler_awaited(self):
+        app = self._app()
+        handled = []
+
+        def handler(package):
+            handled.append(package)
+            future = self._loop.create_future()
+            future.set_result(None)
+            return future
+        coroutine_handler = MagicMock(side_effect=handler)
+        app.add_handler(SessionEndRequest, coroutine_handler)
+        with patch("launchkey.webhooks.asgi._iscoroutinefunction", return_value=True), \
+                patch("launchkey.webhooks.base._iscoroutinefunction", return_value=True):
+            self.assertEqual(self._request(app, b"body")[0], 200)
+        self.assertEqual(handled, [self._package])
+
+    def test_lifespan(self):
+        app = self._app()
+        sent = self._run(app, {"type": "lifespan"}, [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+        self.assertEqual(sent, [{"type": "lifespan.startup.complete"}, {"type": "lifespan.shutdown.complete"}])